@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Microbenchmark: precompiled field rules vs the original parser
+
+Times parse_invoice_data (invoices.extraction rules) against
+legacy_parse_invoice_data (legacy_parser.py) on the Sofia sample PDF and on synthetic invoices,
+and checks that both return identical data.
+
+Usage:
+    python benchmarks/bench_parse_invoice.py [--iterations N] [--synthetic N]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'daycare_tracker.settings')
+
+import django
+
+django.setup()
+
+from invoices.utils import parse_invoice_data
+
+from corpus import load_sofia_text, synthetic_simple, synthetic_statement
+from legacy_parser import legacy_parse_invoice_data
+
+
+def time_parser(parser, texts, iterations):
+    """Average microseconds per call of parser over texts"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            parser(text)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--synthetic', type=int, default=200, help='synthetic invoices per corpus')
+    parser.add_argument('--seed', type=int, default=2025)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(args.seed)
+    corpora = [
+        ('Sofia sample', [load_sofia_text()]),
+        ('Synthetic statements', [synthetic_statement(rng) for _ in range(args.synthetic)]),
+        ('Synthetic long statements', [synthetic_statement(rng, extra_lines=200) for _ in range(args.synthetic // 10)]),
+        ('Synthetic simple invoices', [synthetic_simple(rng) for _ in range(args.synthetic)]),
+    ]
+
+    print(f"{'Corpus':<28}{'legacy us':>12}{'current us':>12}{'speedup':>10}  parity")
+    print('-' * 70)
+    results = []
+    for name, texts in corpora:
+        parity = all(legacy_parse_invoice_data(text) == parse_invoice_data(text) for text in texts)
+        legacy_us = time_parser(legacy_parse_invoice_data, texts, args.iterations)
+        current_us = time_parser(parse_invoice_data, texts, args.iterations)
+        results.append((name, legacy_us, current_us, parity))
+
+    for name, legacy_us, current_us, parity in results:
+        print(f"{name:<28}{legacy_us:>12.1f}{current_us:>12.1f}{legacy_us / current_us:>9.1f}x  {'OK' if parity else 'MISMATCH'}")
+
+    return 0 if all(result[3] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
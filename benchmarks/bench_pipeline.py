@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Benchmark: each stage of the uploaded invoice PDF pipeline
+
+Times validate_pdf_file, extract_pdf_text, sanitize_extracted_text,
+parse_invoice_data and the whole of process_uploaded_invoice separately on
+generated PDFs in each layout and size (see corpus.py) and on the Sofia
+sample, and reports throughput and p50/p95/p99 latency per stage and corpus.
+
+Results can be written as JSON and saved as a named baseline in
+benchmarks/baselines/, then compared against on a later commit:
+
+    python benchmarks/bench_pipeline.py --save-baseline main
+    python benchmarks/bench_pipeline.py --baseline main --max-regression 15
+
+The comparison exits with status 1 if any stage's p50 is slower than the
+baseline by more than --max-regression percent. process_uploaded_invoice runs
+against a throwaway test database with the extraction cache disabled unless
+--with-cache is given.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'daycare_tracker.settings')
+
+import django
+
+django.setup()
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings, setup_test_environment, setup_databases, teardown_databases
+
+from invoices.utils import (
+    PDFDocument, extract_pdf_text, parse_invoice_data, process_uploaded_invoice,
+    sanitize_extracted_text, validate_pdf_file,
+)
+
+from corpus import pdf_corpora
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+
+STAGES = ('validate', 'extract', 'sanitize', 'parse', 'process')
+
+
+def upload(content, name='invoice.pdf'):
+    return SimpleUploadedFile(name, content, content_type='application/pdf')
+
+
+def stage_calls(content, user):
+    """Zero-argument callables for each stage, run against the same document"""
+    raw_text = PDFDocument(io.BytesIO(content)).text
+    sanitized = sanitize_extracted_text(raw_text)
+    return {
+        'validate': lambda: validate_pdf_file(upload(content)),
+        'extract': lambda: extract_pdf_text(upload(content)),
+        'sanitize': lambda: sanitize_extracted_text(raw_text),
+        'parse': lambda: parse_invoice_data(sanitized),
+        'process': lambda: process_uploaded_invoice(upload(content), user),
+    }
+
+
+def percentile_summary(timings_ms, wall_seconds):
+    """Latency percentiles in milliseconds and documents per second"""
+    if len(timings_ms) > 1:
+        cuts = statistics.quantiles(timings_ms, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = timings_ms[0]
+    return {
+        'samples': len(timings_ms),
+        'p50_ms': round(p50, 4),
+        'p95_ms': round(p95, 4),
+        'p99_ms': round(p99, 4),
+        'docs_per_second': round(len(timings_ms) / wall_seconds, 1) if wall_seconds else None,
+    }
+
+
+def run_benchmark(corpora, user, iterations, warmup=1):
+    """
+    Time every stage on every document of every corpus
+
+    Args:
+        corpora: (name, [PDF bytes]) pairs
+        user: Owner passed to process_uploaded_invoice
+        iterations: Timed passes over each corpus
+        warmup: Untimed passes first
+
+    Returns:
+        {corpus: {stage: percentile summary}}
+    """
+    results = {}
+    for name, documents in corpora:
+        calls = [stage_calls(content, user) for content in documents]
+        results[name] = {}
+        for stage in STAGES:
+            for _ in range(warmup):
+                for document_calls in calls:
+                    document_calls[stage]()
+            timings_ms = []
+            wall_start = time.perf_counter()
+            for _ in range(iterations):
+                for document_calls in calls:
+                    start = time.perf_counter()
+                    document_calls[stage]()
+                    timings_ms.append((time.perf_counter() - start) * 1000)
+            results[name][stage] = percentile_summary(timings_ms, time.perf_counter() - wall_start)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_regression):
+    """Print p50 changes against a baseline; returns the regressed (corpus, stage) pairs"""
+    regressions = []
+    print(f"\nCompared with baseline from commit {baseline['meta'].get('commit')}")
+    print(f"{'Corpus':<18}{'Stage':<10}{'base p50':>11}{'p50':>11}{'change':>9}")
+    print('-' * 59)
+    for name, stages in results.items():
+        for stage, summary in stages.items():
+            previous = baseline['results'].get(name, {}).get(stage)
+            if not previous or not previous['p50_ms']:
+                continue
+            change = (summary['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100
+            flag = ''
+            if change > max_regression:
+                regressions.append((name, stage))
+                flag = '  REGRESSION'
+            print(f"{name:<18}{stage:<10}{previous['p50_ms']:>11.3f}{summary['p50_ms']:>11.3f}{change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=5, help='timed passes over each corpus')
+    parser.add_argument('--synthetic', type=int, default=20, help='synthetic PDFs per corpus')
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--with-cache', action='store_true', help='keep the extraction cache enabled')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--save-baseline', metavar='NAME', help='save results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--baseline', metavar='NAME', help='compare with a saved baseline (name or path)')
+    parser.add_argument('--max-regression', type=float, default=10.0,
+                        help='p50 slowdown in percent that fails the comparison')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    corpora = list(pdf_corpora(args.seed, args.synthetic))
+
+    overrides = {'INVOICE_METRICS_FILE': None}
+    if not args.with_cache:
+        overrides['INVOICE_EXTRACTION_CACHE'] = None
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(**overrides):
+            from django.contrib.auth import get_user_model
+
+            user = get_user_model().objects.create_user(username='bench', password='bench-password')
+            results = run_benchmark(corpora, user, args.iterations)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(f"{'Corpus':<18}{'Stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'docs/s':>10}")
+    print('-' * 68)
+    for name, stages in results.items():
+        for stage, summary in stages.items():
+            print(f"{name:<18}{stage:<10}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}"
+                  f"{summary['p99_ms']:>10.3f}{summary['docs_per_second']:>10.1f}")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'synthetic': args.synthetic,
+            'seed': args.seed,
+            'extraction_cache': args.with_cache,
+            'corpus_sizes': {name: len(documents) for name, documents in corpora},
+        },
+        'results': results,
+    }
+
+    paths = []
+    if args.output:
+        paths.append(Path(args.output))
+    if args.save_baseline:
+        paths.append(BASELINE_DIR / f'{args.save_baseline}.json')
+    for path in paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'\nWrote {path}')
+
+    if args.baseline:
+        baseline_path = Path(args.baseline)
+        if not baseline_path.exists():
+            baseline_path = BASELINE_DIR / f'{args.baseline}.json'
+        baseline = json.loads(baseline_path.read_text())
+        if compare(results, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Synthetic daycare invoice corpus shared by the benchmarks
+
+Text generators produce statements in the Active Explorers layout (the Sofia
+sample's) and short labelled invoices in the generic layout. make_pdf()
+writes text lines into a minimal PDF using a standard font, so PyPDF2 can
+extract them again without any PDF library being installed.
+"""
+import random
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SOFIA_PDF = BASE_DIR / 'media' / 'invoices' / '2025.08.25 - Sofia.pdf'
+
+FIRST_NAMES = ['Sofia', 'Liam', 'Emma', 'Noah', 'Olivia', 'Mason', 'Ava', 'Lucas']
+LAST_NAMES = ['Green', 'Smith', 'Brown', 'Taylor', 'Wilson', 'Walker', 'Clark']
+PROVIDERS = ['Active Explorers Ashburton', 'Sunshine Daycare Centre', 'Little Acorns Nursery']
+
+LINES_PER_PAGE = 50
+
+
+def load_sofia_text():
+    """Extract the raw text of the bundled Sofia sample invoice"""
+    import PyPDF2
+
+    with open(SOFIA_PDF, 'rb') as pdf_file:
+        reader = PyPDF2.PdfReader(pdf_file)
+        return '\n'.join(page.extract_text() for page in reader.pages)
+
+
+def synthetic_statement(rng, extra_lines=0):
+    """Build a statement in the Active Explorers layout with random values"""
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    reference = f'{first[0]}{last[0]}{rng.randint(100, 999)}'
+    provider = rng.choice(PROVIDERS)
+    fee = rng.randint(20000, 60000) / 100
+    discount_pct = rng.choice([0, 25, 50, 75])
+    discount = round(fee * discount_pct / 100, 2)
+    previous = rng.randint(0, 20000) / 100
+    day = rng.randint(1, 24)
+    lines = [
+        f'Statement for {first} {last}-{reference}',
+        ' ', ' ', ' ',
+        f'{provider} requires payments for fees to be paid on a weekly basis as per',
+        f"our terms of trade. Quoting your child's reference number {reference}",
+        'Statement / Tax Invoice',
+        f'To: Parent {last} From: {provider}',
+        f'Issued: {day} August 2025 Period: {day} Aug 2025 - {day + 4} Aug 2025',
+        'Item Description Type Ref Date Debit Credit',
+        f'Previous Balance ${previous:.2f}',
+        f'1Under 3 Fee May 2025 INV {rng.randint(10000, 99999)}',
+        f'{day}Aug 2025 ${fee:.2f}',
+        f'2Fee Discount of {discount_pct:.2f}% INV 78352',
+        f'{day}Aug 2025 -${discount:.2f}',
+    ]
+    lines += [f'Attendance note {index}: day {index % 5 + 1} present' for index in range(extra_lines)]
+    lines += [
+        f'Amount due (GST incl) ${fee - discount + previous:.2f}',
+        f'Name: {first} {last} Amount due',
+        f'Reference: {reference} Amount Paid: __________',
+    ]
+    return '\n'.join(lines)
+
+
+def synthetic_simple(rng):
+    """Build a short labelled invoice in the generic layout"""
+    return '\n'.join([
+        'SUNSHINE DAYCARE CENTRE',
+        f'Invoice Number: INV-{rng.randint(1000, 9999)}',
+        f'Invoice Date: {rng.randint(1, 28)}/08/2025',
+        f'Due Date: {rng.randint(1, 28)}/09/2025',
+        f'Child: {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        f'Child Ref: C{rng.randint(100, 999)}',
+        'Period from: 01/08/2025',
+        'Period to: 31/08/2025',
+        'Fee Type: Full Day Care',
+        f'Total Due: ${rng.randint(100, 2000)}.00',
+    ])
+
+
+def _pdf_string(text):
+    """Escape text for a PDF literal string, replacing non-Latin-1 characters"""
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(text: str, title: str = 'Invoice') -> bytes:
+    """Minimal PDF with the lines of text set in Helvetica, paginated"""
+    lines = text.split('\n')
+    pages = [lines[start:start + LINES_PER_PAGE] for start in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, 4 info, then a page and content stream per page
+    objects = {
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        4: f'<< /Title ({_pdf_string(title)}) /Producer (benchmarks.corpus) >>'.encode('latin-1'),
+    }
+    page_ids = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 5 + index * 2, 6 + index * 2
+        page_ids.append(page_id)
+        commands = ['BT', '/F1 10 Tf', '12 TL', '50 800 Td']
+        commands += [f'({_pdf_string(line)}) Tj T*' for line in page_lines]
+        commands.append('ET')
+        stream = '\n'.join(commands).encode('latin-1')
+        objects[content_id] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+        objects[page_id] = (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode('latin-1')
+    objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[2] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode('latin-1')
+
+    output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b'%d 0 obj\n%s\nendobj\n' % (object_id, objects[object_id])
+    xref_offset = len(output)
+    size = max(objects) + 1
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % size
+    for object_id in range(1, size):
+        output += b'%010d 00000 n \n' % offsets[object_id]
+    output += b'trailer\n<< /Size %d /Root 1 0 R /Info 4 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref_offset)
+    return bytes(output)
+
+
+def text_corpora(seed: int, size: int) -> List[Tuple[str, List[str]]]:
+    """Named lists of invoice texts in each layout and size"""
+    rng = random.Random(seed)
+    return [
+        ('sofia', [load_sofia_text()]),
+        ('statement', [synthetic_statement(rng) for _ in range(size)]),
+        ('long_statement', [synthetic_statement(rng, extra_lines=200) for _ in range(max(1, size // 10))]),
+        ('simple', [synthetic_simple(rng) for _ in range(size)]),
+    ]
+
+
+def pdf_corpora(seed: int, size: int) -> Iterable[Tuple[str, List[bytes]]]:
+    """Named lists of PDF file contents; the Sofia sample is the real file"""
+    for name, texts in text_corpora(seed, size):
+        if name == 'sofia':
+            yield name, [SOFIA_PDF.read_bytes()]
+        else:
+            yield name, [make_pdf(text) for text in texts]
@@ -0,0 +1,297 @@
+"""
+The original multi-scan invoice parser
+
+Kept out of the application as the reference that the precompiled rules in
+invoices.extraction are benchmarked (bench_parse_invoice.py) and
+parity-tested (invoices.tests.ParserParityTests) against.
+"""
+import re
+from decimal import Decimal
+from typing import Dict
+
+from invoices.tracing import trace
+from invoices.utils import parse_date_string, sanitize_extracted_text
+
+
+def legacy_parse_invoice_data(text: str) -> Dict:
+    """
+    Original multi-scan invoice parser
+    
+    Args:
+        text: Extracted text from PDF
+        
+    Returns:
+        Dictionary containing parsed invoice data
+    """
+    # Sanitize input text first
+    text = sanitize_extracted_text(text)
+    
+    parsed_data = {
+        'invoice_reference': '',
+        'issue_date': None,
+        'due_date': None,
+        'period_start': None,
+        'period_end': None,
+        'original_amount': Decimal('0.00'),
+        'discount_amount': Decimal('0.00'),
+        'discount_percentage': Decimal('0.00'),
+        'previous_balance': Decimal('0.00'),
+        'week_amount_due': Decimal('0.00'),
+        'total_amount_due': Decimal('0.00'),
+        'amount_due': Decimal('0.00'),  # Legacy field
+        'child_reference': '',
+        'child_name': '',
+        'fee_type': '',
+        'provider_name': '',
+    }
+    
+    # Normalize text for better pattern matching
+    text_lines = [line.strip() for line in text.split('\n') if line.strip()]
+    text_upper = text.upper()
+    
+    # Extract invoice reference number
+    invoice_patterns = [
+        r'INV\s+(\d+)',  # Pattern for "INV 78352" - put this first for better matching
+        r'INVOICE\s*(?:NO|NUMBER|#)?\s*:?\s*(\w+[\w\-]*)',
+        r'REFERENCE\s*(?:NO|NUMBER)?\s*:?\s*(\w+[\w\-]*)',
+        r'INV\s*(?:NO|#)?\s*:?\s*(\w+[\w\-]*)',
+        r'REF\s+(\w+)',   # Pattern for "REF 78352"
+    ]
+    
+    for pattern in invoice_patterns:
+        match = re.search(pattern, text_upper)
+        if match:
+            parsed_data['invoice_reference'] = match.group(1)
+            break
+    
+    # Extract child name and reference (case insensitive search on uppercase text)
+    child_patterns_upper = [
+        r'CHILD\s*NAME\s*:\s*([A-Z\s]+)',
+        r'STUDENT\s*NAME\s*:\s*([A-Z\s]+)',
+        r'CHILD\s*:\s*([A-Z\s]+)',
+        r'FOR\s*:\s*([A-Z\s]+)',
+        r'STATEMENT\s+FOR\s+([A-Z\s]+?)\s*-\w+',  # Pattern for "Statement for Sofia Green-SG300"
+        r'NAME\s*:\s*([A-Z\s]+?)(?:\s+AMOUNT|$)',  # Pattern for "Name: Sofia Green Amount due"
+    ]
+    
+    for pattern in child_patterns_upper:
+        match = re.search(pattern, text_upper)
+        if match:
+            name_part = match.group(1).strip()
+            # Convert back to title case for proper name formatting
+            parsed_data['child_name'] = ' '.join(word.capitalize() for word in name_part.split())
+            break
+    
+    trace('child_name_extracted', child_name=parsed_data['child_name'], text=text)
+    
+    # Extract child reference number - More specific patterns
+    ref_patterns = [
+        r'CHILD\s*(?:REF|REFERENCE|ID|NO)\s*:\s*(\w+)',
+        r'STUDENT\s*(?:REF|REFERENCE|ID|NO)\s*:\s*(\w+)',
+        r'(?:REFERENCE|REF)\s*:\s*(\w+)',
+        r'(?:ID|NO)\s*:\s*(\w+)',
+        r'STATEMENT\s+FOR\s+[A-Z\s]+-(\w+)',  # Pattern for "Statement for Sofia Green-SG300"
+        r'REFERENCE\s+NUMBER\s+(\w+)',  # Pattern for "reference number SG300"
+    ]
+    
+    for pattern in ref_patterns:
+        match = re.search(pattern, text_upper)
+        if match:
+            parsed_data['child_reference'] = match.group(1)
+            break
+    
+    trace('child_reference_extracted', child_reference=parsed_data['child_reference'])
+    
+    # Extract dates
+    date_patterns = {
+        'issue_date': [
+            r'ISSUED\s*:?\s*(\d{1,2}\s+\w+\s+\d{4})',  # Pattern for "Issued: 25 August 2025"
+            r'ISSUE\s*DATE\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'DATE\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'INVOICE\s*DATE\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ],
+        'due_date': [
+            r'DUE\s*DATE\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'PAYMENT\s*DUE\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ],
+        'period_start': [
+            r'PERIOD\s*:?\s*(\d{1,2}\s+\w+\s+\d{4})\s*-',  # Pattern for start of "Period: 25 Aug 2025 - 29 Aug 2025"
+            r'PERIOD\s*FROM\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'FROM\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ],
+        'period_end': [
+            r'PERIOD\s*:?\s*\d{1,2}\s+\w+\s+\d{4}\s*-\s*(\d{1,2}\s+\w+\s+\d{4})',  # Pattern for period end from "Period: 25 Aug 2025 - 29 Aug 2025"
+            r'PERIOD\s*TO\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'TO\s*:?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ]
+    }
+    
+    for date_key, patterns in date_patterns.items():
+        for pattern in patterns:
+            match = re.search(pattern, text_upper)
+            if match:
+                parsed_date = parse_date_string(match.group(1))
+                if parsed_date:
+                    parsed_data[date_key] = parsed_date
+                    break  # Break only from the pattern loop, not the date_key loop
+    
+    # Extract amounts - Enhanced patterns for detailed financial breakdown
+    # Split text into lines for multi-line pattern matching
+    text_lines = text.split('\n')
+    
+    # Extract Previous Balance
+    for line in text_lines:
+        if 'Previous Balance' in line:
+            prev_match = re.search(r'\$(\d+\.\d{2})', line)
+            if prev_match:
+                parsed_data['previous_balance'] = Decimal(prev_match.group(1))
+                break
+    
+    # Extract Original Amount (multi-line: Under 3 Fee line followed by amount line)
+    for i, line in enumerate(text_lines):
+        if 'Under 3 Fee' in line or '1Under 3 Fee' in line:
+            # Check current line for amount
+            amount_match = re.search(r'\$(\d+\.\d{2})', line)
+            if amount_match:
+                parsed_data['original_amount'] = Decimal(amount_match.group(1))
+                break
+            # Check next line for amount
+            elif i + 1 < len(text_lines):
+                next_line = text_lines[i + 1]
+                next_amount_match = re.search(r'\$(\d+\.\d{2})', next_line)
+                if next_amount_match:
+                    parsed_data['original_amount'] = Decimal(next_amount_match.group(1))
+                    break
+    
+    # Extract Discount Amount (multi-line: Fee Discount line followed by amount line)
+    for i, line in enumerate(text_lines):
+        if 'Fee Discount' in line:
+            # Extract discount percentage
+            pct_match = re.search(r'(\d+\.\d{2})%', line)
+            if pct_match:
+                parsed_data['discount_percentage'] = Decimal(pct_match.group(1))
+            
+            # Check current line for discount amount
+            discount_match = re.search(r'-\$(\d+\.\d{2})', line)
+            if discount_match:
+                parsed_data['discount_amount'] = Decimal(discount_match.group(1))
+                break
+            # Check next line for discount amount
+            elif i + 1 < len(text_lines):
+                next_line = text_lines[i + 1]
+                next_discount_match = re.search(r'-\$(\d+\.\d{2})', next_line)
+                if next_discount_match:
+                    parsed_data['discount_amount'] = Decimal(next_discount_match.group(1))
+                    break
+    
+    # Extract Total Amount Due
+    total_due_patterns = [
+        r'Amount due \(GST incl\)\s*\$(\d+\.\d{2})',
+        r'AMOUNT\s+DUE\s*\(\w+\s+\w+\)\s*\$(\d+\.\d{2})',
+    ]
+    
+    for pattern in total_due_patterns:
+        match = re.search(pattern, text_upper)
+        if match:
+            parsed_data['total_amount_due'] = Decimal(match.group(1))
+            break
+    
+    # Calculate week amount due
+    if (parsed_data['original_amount'] > 0 and parsed_data['discount_amount'] > 0):
+        parsed_data['week_amount_due'] = parsed_data['original_amount'] - parsed_data['discount_amount']
+    
+    # Set legacy amount_due field to total_amount_due for backward compatibility
+    if parsed_data['total_amount_due'] > 0:
+        parsed_data['amount_due'] = parsed_data['total_amount_due']
+    
+    # Fallback: Try to find ANY dollar amount as potential amount due if nothing found
+    if parsed_data['total_amount_due'] == Decimal('0.00'):
+        fallback_pattern = r'\$(\d{1,3}(?:\.\d{2})?)'
+        fallback_matches = re.findall(fallback_pattern, text)
+        if fallback_matches:
+            # Take the largest dollar amount found
+            amounts = []
+            for amount_str in fallback_matches:
+                try:
+                    amounts.append(Decimal(amount_str))
+                except:
+                    continue
+            if amounts:
+                parsed_data['total_amount_due'] = max(amounts)
+                parsed_data['amount_due'] = parsed_data['total_amount_due']
+    
+    trace('amounts_extracted', amounts=lambda: {
+        key: parsed_data[key] for key in (
+            'previous_balance', 'original_amount', 'discount_percentage', 'discount_amount',
+            'week_amount_due', 'total_amount_due',
+        )
+    })
+    
+    # Legacy amount patterns (keeping for other invoice formats)
+    amount_patterns = {
+        'amount_due_fallback': [
+            r'TOTAL\s*(?:DUE|AMOUNT)?\s*:?\s*\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+            r'AMOUNT\s*DUE\s*:?\s*\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+            r'FINAL\s*AMOUNT\s*:?\s*\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+            r'DUE\s*:?\s*\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+            r'BALANCE\s*DUE\s*:?\s*\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+            r'OUTSTANDING\s*:?\s*\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        ]
+    }
+    
+    # Only use fallback patterns if we haven't found amounts yet
+    if parsed_data['total_amount_due'] == Decimal('0.00'):
+        for amount_key, patterns in amount_patterns.items():
+            for pattern in patterns:
+                match = re.search(pattern, text_upper)
+                if match:
+                    try:
+                        amount_str = match.group(1).replace(',', '')
+                        parsed_data['total_amount_due'] = Decimal(amount_str)
+                        parsed_data['amount_due'] = parsed_data['total_amount_due']
+                        trace('fallback_amount_extracted', amount=amount_str, pattern=pattern)
+                        break
+                    except Exception:
+                        continue
+            if parsed_data['total_amount_due'] > Decimal('0.00'):
+                break
+    
+    # Extract discount percentage
+    discount_pct_pattern = r'DISCOUNT\s*:?\s*(\d{1,2})%'
+    match = re.search(discount_pct_pattern, text_upper)
+    if match:
+        try:
+            parsed_data['discount_percentage'] = Decimal(match.group(1))
+        except:
+            pass
+    
+    # Extract fee type
+    fee_patterns = [
+        r'(UNDER\s+\d+\s+FEE)',  # Pattern for "Under 3 Fee" - put this first for better matching
+        r'(\d+\w*\s+FEE)',  # Pattern for fee types like "3 Fee", "Under3 Fee"
+        r'FEE\s*TYPE\s*:?\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
+        r'SERVICE\s*:?\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
+    ]
+    
+    for pattern in fee_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            parsed_data['fee_type'] = match.group(1).strip()
+            break
+    
+    # Extract provider name (usually at the top of the invoice)
+    for line in text_lines[:10]:  # Check first 10 lines
+        if (len(line) > 10 and 
+            ('DAYCARE' in line.upper() or 'CHILDCARE' in line.upper() or 
+             'EXPLORERS' in line.upper() or 'NURSERY' in line.upper())):
+            parsed_data['provider_name'] = line.strip()
+            break
+    
+    # If no provider found in first lines, look for "From:" pattern
+    if not parsed_data['provider_name']:
+        from_pattern = r'FROM:\s*([A-Za-z\s]+?)(?:\n|\s{2,})'
+        match = re.search(from_pattern, text, re.IGNORECASE)
+        if match:
+            parsed_data['provider_name'] = match.group(1).strip()
+    
+    return parsed_data
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+Load test: replay a realistic request mix against the main pages
+
+Builds a throwaway test database filled by the generate_load_data command,
+then replays weighted traffic (dashboard, invoice list pages, invoice detail,
+quick stats, the spend report and PDF uploads) from several threads, each logged in as a random
+generated user through Django's test client. Reports latency percentiles and
+database query counts per endpoint, so the data size at which an endpoint
+stops scaling shows up when --users/--children/--years are increased.
+
+Usage:
+    python benchmarks/load_test.py [--users N] [--children N] [--years N]
+                                   [--requests N] [--threads N] [--output FILE]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'daycare_tracker.settings')
+
+import django
+
+django.setup()
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, setup_databases, teardown_databases
+
+from invoices.instrumentation import RequestMetrics
+from invoices.models import Child, Invoice
+from invoices.pagination import encode_cursor
+
+from corpus import make_pdf, synthetic_statement
+
+PASSWORD = 'loadtest-password'
+
+# Endpoint name -> relative weight in the replayed traffic
+TRAFFIC_MIX = {
+    'dashboard': 20,
+    'invoice_list': 25,
+    'invoice_list_deep': 5,
+    'invoice_detail': 25,
+    'payment_list': 10,
+    'quick_stats': 10,
+    'spend_report': 2,
+    'upload': 3,
+}
+
+
+class Session:
+    """One simulated user: a logged-in client and the ids their pages link to"""
+
+    def __init__(self, user, rng, upload_pdf):
+        self.client = Client()
+        self.client.force_login(user)
+        self.rng = rng
+        self.upload_pdf = upload_pdf
+        keys = list(Invoice.objects.filter(user=user).order_by('-issue_date', '-id').values_list(
+            'issue_date', 'id',
+        ))
+        self.invoice_ids = [invoice_id for _, invoice_id in keys]
+        # Cursors starting pages near the start and at the end of the history
+        self.shallow_cursors = [encode_cursor(key) for key in keys[19:60:20]] or ['']
+        self.deep_cursor = encode_cursor(keys[-21]) if len(keys) > 20 else ''
+
+    def request(self, endpoint):
+        client = self.client
+        if endpoint == 'dashboard':
+            return client.get('/')
+        if endpoint == 'invoice_list':
+            return client.get('/invoices/', {'cursor': self.rng.choice(self.shallow_cursors)})
+        if endpoint == 'invoice_list_deep':
+            return client.get('/invoices/', {'cursor': self.deep_cursor})
+        if endpoint == 'invoice_detail':
+            return client.get(f'/invoices/{self.rng.choice(self.invoice_ids)}/')
+        if endpoint == 'payment_list':
+            return client.get('/payments/')
+        if endpoint == 'quick_stats':
+            return client.get('/ajax/quick-stats/')
+        if endpoint == 'spend_report':
+            return client.get('/api/reports/spend/')
+        if endpoint == 'upload':
+            upload = SimpleUploadedFile('invoice.pdf', self.upload_pdf, content_type='application/pdf')
+            return client.post('/ajax/invoice-upload/', {'pdf_file': upload})
+        raise ValueError(f'Unknown endpoint {endpoint}')
+
+
+def worker(sessions, plan, samples, errors, lock):
+    """Replay the planned (session index, endpoint) requests, recording timings"""
+    metrics = RequestMetrics()
+    with connection.execute_wrapper(metrics):
+        for session_index, endpoint in plan:
+            queries_before = metrics.query_count
+            start = time.perf_counter()
+            response = sessions[session_index].request(endpoint)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                samples.setdefault(endpoint, []).append((elapsed_ms, metrics.query_count - queries_before))
+                if response.status_code >= 400:
+                    errors[endpoint] = errors.get(endpoint, 0) + 1
+    connection.close()
+
+
+def summarize(samples, errors, wall_seconds):
+    results = {}
+    for endpoint in TRAFFIC_MIX:
+        if endpoint not in samples:
+            continue
+        timings = [elapsed for elapsed, _ in samples[endpoint]]
+        queries = [count for _, count in samples[endpoint]]
+        if len(timings) > 1:
+            cuts = statistics.quantiles(timings, n=100, method='inclusive')
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = timings[0]
+        results[endpoint] = {
+            'requests': len(timings),
+            'errors': errors.get(endpoint, 0),
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'max_ms': round(max(timings), 2),
+            'queries_mean': round(statistics.fmean(queries), 1),
+            'queries_max': max(queries),
+        }
+    total = sum(len(entries) for entries in samples.values())
+    return {'requests_per_second': round(total / wall_seconds, 1), 'endpoints': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--children', type=int, default=2, help='children per user')
+    parser.add_argument('--years', type=float, default=2, help='years of weekly invoices per child')
+    parser.add_argument('--requests', type=int, default=500, help='total requests to replay')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(args.seed)
+    upload_pdf = make_pdf(synthetic_statement(random.Random(args.seed)))
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        # worker() times and counts every request itself, so the middleware's
+        # sampled instrumentation is off rather than adding to the measured
+        # work; metrics stay in memory
+        with override_settings(INVOICE_TIMING_SAMPLE_RATE=0.0, INVOICE_METRICS_FILE=None,
+                               INVOICE_EXTRACTION_CACHE=None, INVOICE_PROCESSING_ASYNC=False):
+            start = time.perf_counter()
+            call_command('generate_load_data', users=args.users, children=args.children, years=args.years,
+                         seed=args.seed, password=PASSWORD, verbosity=0, stdout=open(os.devnull, 'w'))
+            print(f'Generated {Invoice.objects.count()} invoices for {Child.objects.count()} children '
+                  f'in {time.perf_counter() - start:.1f}s')
+
+            from django.contrib.auth import get_user_model
+
+            users = list(get_user_model().objects.filter(username__startswith='loadtest_'))
+            sessions = [Session(user, random.Random(rng.random()), upload_pdf) for user in users]
+
+            endpoints, weights = zip(*TRAFFIC_MIX.items())
+            plan = [(rng.randrange(len(sessions)), endpoint)
+                    for endpoint in rng.choices(endpoints, weights, k=args.requests)]
+            samples, errors, lock = {}, {}, threading.Lock()
+            threads = [
+                threading.Thread(target=worker, args=(sessions, plan[index::args.threads], samples, errors, lock))
+                for index in range(args.threads)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results = summarize(samples, errors, time.perf_counter() - start)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(f"\n{'Endpoint':<20}{'reqs':>6}{'errs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'max q':>7}")
+    print('-' * 75)
+    for endpoint, summary in results['endpoints'].items():
+        print(f"{endpoint:<20}{summary['requests']:>6}{summary['errors']:>6}{summary['p50_ms']:>9.1f}"
+              f"{summary['p95_ms']:>9.1f}{summary['p99_ms']:>9.1f}{summary['queries_mean']:>9.1f}"
+              f"{summary['queries_max']:>7}")
+    print(f"\n{results['requests_per_second']} requests/s with {args.threads} thread(s)")
+
+    if args.output:
+        results['meta'] = {key: value for key, value in vars(args).items() if key != 'output'}
+        Path(args.output).write_text(json.dumps(results, indent=2) + '\n')
+        print(f'Wrote {args.output}')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
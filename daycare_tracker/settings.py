@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -26,6 +27,9 @@ SECRET_KEY = config('SECRET_KEY', default='django-insecure-b0jn81a8mj-1kn0bjqgwq
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=True, cast=bool)
 
+# Running under `manage.py test`
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1,testserver', cast=lambda v: [s.strip() for s in v.split(',')])
 
 
@@ -50,12 +54,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'invoices.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'invoices.tracing.TracingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -63,7 +69,8 @@ ROOT_URLCONF = 'daycare_tracker.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to RequestTimingMiddleware
+        'BACKEND': 'invoices.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -161,6 +168,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024   # 10MB
 
+# Queue PDF uploads for the process_invoice_jobs worker instead of parsing
+# them inside the request
+INVOICE_PROCESSING_ASYNC = config('INVOICE_PROCESSING_ASYNC', default=False, cast=bool)
+
+# Request timing, see invoices/instrumentation.py: fraction of requests whose
+# queries and stages are measured, threshold above which any request is logged,
+# and whether measured requests get a Server-Timing header. Tests measure
+# nothing unless they ask to, so they do not log a line per request.
+INVOICE_TIMING_SAMPLE_RATE = config(
+    'INVOICE_TIMING_SAMPLE_RATE', default=0.0 if TESTING else 1.0 if DEBUG else 0.05, cast=float,
+)
+INVOICE_SLOW_REQUEST_MS = config('INVOICE_SLOW_REQUEST_MS', default=1000, cast=int)
+INVOICE_SERVER_TIMING = config('INVOICE_SERVER_TIMING', default=DEBUG, cast=bool)
+
+# Pipeline metrics shared by all worker processes through this SQLite file and
+# exported at /metrics/ for staff; None keeps per-process metrics only
+INVOICE_METRICS_FILE = config('INVOICE_METRICS_FILE', default=str(BASE_DIR / 'logs' / 'metrics.sqlite3')) or None
+INVOICE_METRICS_FLUSH_SECONDS = config('INVOICE_METRICS_FLUSH_SECONDS', default=10, cast=int)
+
+# Debug tracing of uploads and parsing into the 'invoices.trace' logger, see
+# invoices/tracing.py. Staff can also trace a single request with ?trace=1.
+INVOICE_TRACE_ENABLED = config('INVOICE_TRACE_ENABLED', default=False, cast=bool)
+INVOICE_TRACE_USERS = config('INVOICE_TRACE_USERS', default='', cast=lambda v: [int(s) for s in v.split(',') if s.strip()])
+INVOICE_TRACE_PARAM = 'trace'
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -180,10 +212,13 @@ LOGGING = {
             'class': 'logging.StreamHandler',
             'formatter': 'detailed',
         },
+        # JSON lines written by a background thread, see invoices/log_pipeline.py
         'file': {
-            'class': 'logging.FileHandler',
+            'class': 'invoices.log_pipeline.QueueFileHandler',
             'filename': BASE_DIR / 'logs' / 'application.log',
-            'formatter': 'detailed',
+            'max_bytes': config('LOG_MAX_BYTES', default=10 * 1024 * 1024, cast=int),
+            'backup_count': config('LOG_BACKUP_COUNT', default=5, cast=int),
+            'rotate_when': config('LOG_ROTATE_WHEN', default='midnight'),
         },
     },
     'loggers': {
@@ -200,10 +235,41 @@ LOGGING = {
     },
 }
 
-# Cache configuration for rate limiting
+# Cache configuration for rate limiting and dashboard statistics. Set
+# SHARED_CACHE_PATH to a SQLite file so that every worker process shares
+# one cache and one set of upload limits; otherwise each process keeps its
+# own in memory. Cached statistics are keyed by a data version stored in the
+# database, so they go stale in every process after any write either way.
+SHARED_CACHE_PATH = config('SHARED_CACHE_PATH', default='')
+
 CACHES = {
     'default': {
+        'BACKEND': 'invoices.cache_backends.SQLiteCache',
+        'LOCATION': SHARED_CACHE_PATH,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('SHARED_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    } if SHARED_CACHE_PATH else {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'daycare-tracker-cache',
-    }
+    },
+    # LRU store for PDF extraction results, see invoices/extraction_cache.py
+    'invoice_extraction': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'invoice-extraction-cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('EXTRACTION_CACHE_MAX_ENTRIES', default=500, cast=int),
+        },
+    },
+}
+
+# Seconds a user's cached dashboard statistics are kept; writes invalidate them immediately
+INVOICE_STATS_CACHE_TIMEOUT = config('INVOICE_STATS_CACHE_TIMEOUT', default=300, cast=int)
+
+# PDF extraction cache backend. To keep entries on disk under MEDIA_ROOT use
+# {'BACKEND': 'invoices.extraction_cache.FileSystemBackend', 'OPTIONS': {'max_entries': 1000}}
+# Set to None to disable caching.
+INVOICE_EXTRACTION_CACHE = {
+    'BACKEND': 'invoices.extraction_cache.DjangoCacheBackend',
+    'OPTIONS': {'alias': 'invoice_extraction', 'timeout': None},
 }
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django import forms
-from .models import DaycareProvider, Child, Invoice, Payment
+from .models import DaycareProvider, Child, Invoice, Payment, InvoiceProcessingJob, MonthlySummary
 
 
 class DaycareProviderAdminForm(forms.ModelForm):
@@ -148,3 +148,37 @@ class PaymentAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queries by selecting related objects"""
         return super().get_queryset(request).select_related('invoice', 'invoice__child')
+
+
+@admin.register(InvoiceProcessingJob)
+class InvoiceProcessingJobAdmin(admin.ModelAdmin):
+    """Admin configuration for InvoiceProcessingJob model"""
+    list_display = ['id', 'original_name', 'user', 'status', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['original_name', 'user__username']
+    readonly_fields = ['result', 'error', 'started_at', 'finished_at', 'created_at', 'updated_at']
+    
+    def get_queryset(self, request):
+        """Optimize queries by selecting related objects"""
+        return super().get_queryset(request).select_related('user')
+
+
+@admin.register(MonthlySummary)
+class MonthlySummaryAdmin(admin.ModelAdmin):
+    """Read-only view of the monthly rollup, maintained from invoices and payments"""
+    list_display = ['month', 'child', 'provider', 'user', 'invoice_count', 'invoiced_amount', 'paid_amount',
+                    'outstanding_amount']
+    list_filter = ['month', 'provider']
+    search_fields = ['child__name', 'user__username']
+    date_hierarchy = 'month'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_queryset(self, request):
+        """Optimize queries by selecting related objects"""
+        return super().get_queryset(request).select_related('child', 'provider', 'user')
+
@@ -0,0 +1,216 @@
+"""
+Spend analytics: per-child, per-provider and monthly rollups
+
+A report is built from three columnar fetches (children, invoices, payments)
+with values_list and no joins between invoices and payments. Amounts are
+converted to whole cents in the database and held, like the dates, in
+array.array columns, so rollups sum flat integer columns with exact
+arithmetic instead of a Decimal per row per rollup. Only the totals in the
+finished report are converted back to Decimal.
+
+Ten years of weekly invoices for two children (about a thousand invoices and
+a thousand payments) builds in a few tens of milliseconds, most of it spent
+fetching rows. The views cache the report per user data version (see
+stats.cached_stats) like the dashboard statistics.
+"""
+import statistics
+from array import array
+from decimal import Decimal
+from itertools import accumulate
+from typing import Dict, Sequence
+
+from django.db.models import F, IntegerField
+from django.db.models.functions import Cast, Round
+
+from .models import Child, Invoice, Payment
+
+# Invoice amount columns and the fields they are read from
+INVOICE_AMOUNTS = {
+    'original': 'original_amount',
+    'discount': 'discount_amount',
+    'spend': 'week_amount_due',
+    'due': 'total_amount_due',
+    'paid': 'amount_paid_total',
+}
+
+
+def _cents(field: str):
+    """An amount column as whole cents, rounded in the database"""
+    return Cast(Round(F(field) * 100), IntegerField())
+
+
+def _money(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def _month_label(month_key: int) -> str:
+    return f'{month_key // 12:04d}-{month_key % 12 + 1:02d}'
+
+
+def _transpose(rows: Sequence[tuple], names: Sequence[str]) -> Dict[str, tuple]:
+    """Turn values_list rows into one tuple of values per named column"""
+    return dict(zip(names, zip(*rows))) if rows else {name: () for name in names}
+
+
+def group_sums(keys: Sequence, *columns: Sequence[int]) -> Dict:
+    """
+    Count rows and sum each column per distinct key
+
+    Row indices are bucketed by key in one Python loop over the keys; each
+    column is then summed per bucket by the built-in sum() over
+    map(column.__getitem__, indices), so no Python code runs per row per
+    column. This is not NumPy-style vectorization, but it is about twice as
+    fast as adding up every row's values in Python.
+
+    Returns:
+        {key: [row count, column 1 sum, column 2 sum, ...]}
+    """
+    rows = {}
+    for index, key in enumerate(keys):
+        rows.setdefault(key, []).append(index)
+    return {
+        key: [len(indices), *(sum(map(column.__getitem__, indices)) for column in columns)]
+        for key, indices in rows.items()
+    }
+
+
+def fetch_invoice_columns(user) -> Dict[str, array]:
+    """
+    One user's invoices, oldest first, as columns
+
+    Amounts are in cents. Issue dates are held as month keys
+    (year * 12 + month - 1) and due dates as ordinals (date.toordinal), with
+    -1 for a missing due date.
+    """
+    rows = list(Invoice.objects.filter(user=user).order_by('issue_date', 'id').values_list(
+        'id', 'child_id', 'issue_date', 'due_date', *(_cents(field) for field in INVOICE_AMOUNTS.values()),
+    ))
+    raw = _transpose(rows, ('id', 'child', 'issue_date', 'due_date', *INVOICE_AMOUNTS))
+    columns = {name: array('q', raw[name]) for name in ('id', 'child', *INVOICE_AMOUNTS)}
+    columns['month'] = array('l', (day.year * 12 + day.month - 1 for day in raw['issue_date']))
+    columns['due_date'] = array('l', (day.toordinal() if day else -1 for day in raw['due_date']))
+    return columns
+
+
+def fetch_payment_columns(user) -> Dict[str, array]:
+    """One user's payments, oldest first, as columns (see fetch_invoice_columns)"""
+    rows = list(Payment.objects.filter(user=user).order_by('payment_date', 'id').values_list(
+        'invoice_id', 'payment_date', _cents('amount_paid'),
+    ))
+    raw = _transpose(rows, ('invoice', 'payment_date', 'amount'))
+    return {
+        'invoice': array('q', raw['invoice']),
+        'amount': array('q', raw['amount']),
+        'month': array('l', (day.year * 12 + day.month - 1 for day in raw['payment_date'])),
+        'payment_date': array('l', (day.toordinal() for day in raw['payment_date'])),
+    }
+
+
+def payment_latency(invoices: Dict[str, array], payments: Dict[str, array]) -> Dict:
+    """
+    Days from due date to payment, over payments whose invoice has a due date
+
+    Negative latencies are payments made before the due date.
+    """
+    due_by_invoice = dict(zip(invoices['id'], invoices['due_date']))
+    days = sorted(
+        paid_on - due_by_invoice[invoice_id]
+        for invoice_id, paid_on in zip(payments['invoice'], payments['payment_date'])
+        if due_by_invoice.get(invoice_id, -1) >= 0
+    )
+    if not days:
+        return {'payments': 0, 'mean_days': None, 'median_days': None, 'p90_days': None,
+                'late_payments': 0, 'on_time_percent': None}
+    late = len(days) - sum(1 for value in days if value <= 0)
+    return {
+        'payments': len(days),
+        'mean_days': round(statistics.fmean(days), 1),
+        'median_days': statistics.median(days),
+        'p90_days': days[min(len(days) - 1, (len(days) * 9) // 10)],
+        'late_payments': late,
+        'on_time_percent': round((len(days) - late) / len(days) * 100, 1),
+    }
+
+
+def spend_report(user) -> Dict:
+    """
+    Spend, discounts, payments and balances for a user's whole history
+
+    Returns:
+        Dict with 'totals', 'by_child' (each with per-year rows),
+        'by_provider', 'by_month' (with the running balance) and 'latency'
+    """
+    children = list(Child.objects.filter(user=user).order_by('name', 'id').values_list(
+        'id', 'name', 'daycare_provider_id', 'daycare_provider__name',
+    ))
+    invoices = fetch_invoice_columns(user)
+    payments = fetch_payment_columns(user)
+
+    amounts = [invoices[name] for name in INVOICE_AMOUNTS]
+    by_child = group_sums(invoices['child'], *amounts)
+    years = array('l', (month // 12 for month in invoices['month']))
+    by_child_year = group_sums(zip(invoices['child'], years),
+                               invoices['discount'], invoices['spend'], invoices['paid'])
+    billed_by_month = group_sums(invoices['month'], invoices['discount'], invoices['spend'])
+    paid_by_month = group_sums(payments['month'], payments['amount'])
+
+    def rollup(totals):
+        count, original, discount, spend, due, paid = totals
+        return {
+            'invoices': count,
+            'gross': _money(original),
+            'discounts': _money(discount),
+            'spend': _money(spend),
+            'paid': _money(paid),
+            'outstanding': _money(due - paid),
+        }
+
+    child_rows = []
+    provider_totals = {}
+    for child_id, name, provider_id, provider_name in children:
+        totals = by_child.get(child_id, [0] * 6)
+        child_years = sorted((year, sums) for (key, year), sums in by_child_year.items() if key == child_id)
+        child_rows.append({
+            'child_id': child_id,
+            'name': name,
+            'provider': provider_name,
+            **rollup(totals),
+            'years': [
+                {'year': year, 'invoices': count, 'discounts': _money(discount),
+                 'spend': _money(spend), 'paid': _money(paid)}
+                for year, (count, discount, spend, paid) in child_years
+            ],
+        })
+        provider = provider_totals.setdefault(provider_id, {'name': provider_name, 'children': 0, 'sums': [0] * 6})
+        provider['children'] += 1
+        provider['sums'] = [a + b for a, b in zip(provider['sums'], totals)]
+
+    months = sorted(billed_by_month.keys() | paid_by_month.keys())
+    spend_column = [billed_by_month.get(month, [0, 0, 0])[2] for month in months]
+    paid_column = [paid_by_month.get(month, [0, 0])[1] for month in months]
+    balances = accumulate(spend - paid for spend, paid in zip(spend_column, paid_column))
+    month_rows = [
+        {
+            'month': _month_label(month),
+            'invoices': billed_by_month.get(month, [0])[0],
+            'discounts': _money(billed_by_month.get(month, [0, 0])[1]),
+            'spend': _money(spend),
+            'paid': _money(paid),
+            'balance': _money(balance),
+        }
+        for month, spend, paid, balance in zip(months, spend_column, paid_column, balances)
+    ]
+
+    totals = rollup([len(invoices['id'])] + [sum(column) for column in amounts])
+    totals['payments'] = len(payments['amount'])
+    return {
+        'totals': totals,
+        'by_child': child_rows,
+        'by_provider': [
+            {'provider_id': provider_id, 'name': provider['name'], 'children': provider['children'],
+             **rollup(provider['sums'])}
+            for provider_id, provider in sorted(provider_totals.items(), key=lambda item: item[1]['name'])
+        ],
+        'by_month': month_rows,
+        'latency': payment_latency(invoices, payments),
+    }
@@ -6,3 +6,7 @@ class InvoicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoices'
     verbose_name = 'Invoice Management'
+    
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,196 @@
+"""
+SQLite-backed Django cache shared by every process on one machine
+
+Django's file and database caches implement incr() as a get followed by a
+set, so two workers can lose an update. This backend keeps entries in a
+standalone SQLite file in WAL mode and performs add() and incr() as single
+statements, which makes them atomic across processes without an external
+service such as Redis or Memcached. It needs SQLite 3.35 or later (for
+RETURNING), which is checked when the cache is created.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'invoices.cache_backends.SQLiteCache',
+            'LOCATION': BASE_DIR / 'cache.sqlite3',
+        },
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+# Integers that fit SQLite's signed 64-bit INTEGER are stored as integers so
+# incr() can update them in SQL; everything else is pickled
+INTEGER_MIN, INTEGER_MAX = -2 ** 63, 2 ** 63 - 1
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    'cache_key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+)
+_NOT_EXPIRED = '(expires IS NULL OR expires > ?)'
+
+# Counting entries scans the table, so MAX_ENTRIES is enforced every N writes
+CULL_CHECK_INTERVAL = 100
+
+
+class SQLiteCache(BaseCache):
+    """Cache backend storing entries in a SQLite database file"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        if sqlite3.sqlite_version_info < (3, 35, 0):
+            raise ImproperlyConfigured(
+                f'SQLiteCache needs SQLite 3.35 or later, found {sqlite3.sqlite_version}'
+            )
+        self.path = str(location)
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _connection(self):
+        # One connection per thread, reopened in forked worker processes
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _encode(self, value):
+        if type(value) is int and INTEGER_MIN <= value <= INTEGER_MAX:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, stored):
+        if isinstance(stored, int):
+            return stored
+        return pickle.loads(stored)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        # Inserts, or replaces an expired entry; a live entry is left alone
+        cursor = self._connection.execute(
+            'INSERT INTO cache_entries (cache_key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (cache_key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout), now),
+        )
+        added = cursor.rowcount == 1
+        if added:
+            self._cull(now)
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection.execute(
+            f'SELECT value FROM cache_entries WHERE cache_key = ? AND {_NOT_EXPIRED}',
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return default
+        return self._decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO cache_entries (cache_key, value, expires) VALUES (?, ?, ?)',
+            (key, self._encode(value), self.get_backend_timeout(timeout)),
+        )
+        self._cull(time.time())
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection.execute(
+            f'UPDATE cache_entries SET expires = ? WHERE cache_key = ? AND {_NOT_EXPIRED}',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection.execute('DELETE FROM cache_entries WHERE cache_key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection.execute(
+            f'SELECT 1 FROM cache_entries WHERE cache_key = ? AND {_NOT_EXPIRED}',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        if INTEGER_MIN <= delta <= INTEGER_MAX:
+            # Only when the result stays a 64-bit integer; SQLite would turn
+            # an overflowing sum into a float
+            bound = ('value <= ?', INTEGER_MAX - delta) if delta >= 0 else ('value >= ?', INTEGER_MIN - delta)
+            row = self._connection.execute(
+                'UPDATE cache_entries SET value = value + ? '
+                f"WHERE cache_key = ? AND typeof(value) = 'integer' AND {bound[0]} AND {_NOT_EXPIRED} "
+                'RETURNING value',
+                (delta, key, bound[1], now),
+            ).fetchone()
+            if row is not None:
+                return row[0]
+        return self._incr_pickled(key, delta, now)
+
+    def _incr_pickled(self, key, delta, now):
+        """incr() of a value SQL cannot add to, under the database write lock"""
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                f'SELECT value FROM cache_entries WHERE cache_key = ? AND {_NOT_EXPIRED}', (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._decode(row[0]) + delta
+            connection.execute(
+                'UPDATE cache_entries SET value = ? WHERE cache_key = ?', (self._encode(value), key),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache_entries')
+
+    def close(self, **kwargs):
+        # Connections are kept open per thread for the life of the process
+        pass
+
+    def _cull(self, now):
+        """Drop expired entries, then the soonest to expire, above MAX_ENTRIES"""
+        self._writes += 1
+        if self._writes % CULL_CHECK_INTERVAL:
+            return
+        connection = self._connection
+        count = connection.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        connection.execute('DELETE FROM cache_entries WHERE expires IS NOT NULL AND expires <= ?', (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+        else:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE cache_key IN ('
+                'SELECT cache_key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
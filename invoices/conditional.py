@@ -0,0 +1,67 @@
+"""
+Conditional GET for pages built from a user's invoices, payments and children
+
+A page's ETag is derived from the user's data version (see
+stats.get_stats_version), which every Invoice, Payment or Child write bumps.
+The version is a database row, so writes from other server processes,
+import_invoices and process_invoice_jobs change the ETag too, whatever cache
+each process uses. A browser revalidating an unchanged page (back
+navigation, a reload, a polling tab) gets 304 Not Modified after a single
+primary key lookup, before any aggregate query or template rendering.
+
+Besides the version, the ETag covers what else the page shows: the full
+path (filters and page cursor), today's date (due and overdue labels) and
+the CSRF secret embedded in the page's forms, which changes at login. Pages
+with flash messages waiting are never answered with 304, so the messages
+are shown.
+
+There is no Last-Modified: the version is a counter, not a time, and a
+timestamp would not move when rows are deleted.
+"""
+import hashlib
+from datetime import date
+from typing import Optional
+
+from django.contrib.messages import get_messages
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .stats import get_stats_version
+
+
+def user_data_etag(request, *args, **kwargs) -> Optional[str]:
+    """
+    ETag of a page showing the requesting user's data
+
+    Returns:
+        A hex digest, or None (no conditional processing) for anonymous
+        users and for pages with messages to show
+    """
+    user = request.user
+    if not user.is_authenticated or get_messages(request):
+        return None
+    key = ':'.join(str(part) for part in (
+        user.pk, get_stats_version(user.pk), request.get_full_path(), date.today().isoformat(),
+        request.META.get('CSRF_COOKIE', ''),
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ConditionalUserDataMixin:
+    """
+    Answer If-None-Match with 304 while the user's data is unchanged
+
+    List after LoginRequiredMixin, so anonymous requests are redirected first.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self._conditional_dispatch(request, *args, **kwargs)
+        # Revalidate on every use, and never from a shared cache; outside
+        # condition() so its 304 responses are marked private too
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @method_decorator(condition(etag_func=user_data_etag))
+    def _conditional_dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,310 @@
+"""
+Streaming CSV and XLSX exports of invoices, payments and child statements
+
+Rows are read with values_list() and QuerySet.iterator(chunk_size=...), so
+no model instances are built and only one chunk of rows is in memory at a
+time, whatever the length of the history. Each chunk is encoded and handed
+to a StreamingHttpResponse as it is read; nothing goes through the template
+engine.
+
+XLSX files are written without a third-party library: a workbook is a zip of
+a few small XML parts plus one worksheet part, and zipfile can stream that
+part to an unseekable output chunk by chunk.
+"""
+import csv
+import heapq
+import io
+import re
+import zipfile
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .models import Payment
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# (header, kind) pairs; kind is 'text', 'date' or 'money'
+Column = Tuple[str, str]
+
+INVOICE_COLUMNS = [
+    ('invoice_reference', ('Reference', 'text')),
+    ('child__name', ('Child', 'text')),
+    ('child__daycare_provider__name', ('Provider', 'text')),
+    ('issue_date', ('Issue Date', 'date')),
+    ('due_date', ('Due Date', 'date')),
+    ('period_start', ('Period Start', 'date')),
+    ('period_end', ('Period End', 'date')),
+    ('fee_type', ('Fee Type', 'text')),
+    ('original_amount', ('Original Amount', 'money')),
+    ('discount_amount', ('Discount', 'money')),
+    ('week_amount_due', ('Week Amount Due', 'money')),
+    ('previous_balance', ('Previous Balance', 'money')),
+    ('total_amount_due', ('Total Amount Due', 'money')),
+    ('amount_paid_total', ('Paid', 'money')),
+    ('payment_status', ('Status', 'text')),
+]
+
+PAYMENT_COLUMNS = [
+    ('payment_date', ('Date', 'date')),
+    ('invoice__invoice_reference', ('Invoice', 'text')),
+    ('invoice__child__name', ('Child', 'text')),
+    ('amount_paid', ('Amount', 'money')),
+    ('payment_method', ('Method', 'text')),
+    ('reference_number', ('Reference', 'text')),
+    ('notes', ('Notes', 'text')),
+]
+
+STATEMENT_COLUMNS = [
+    ('Date', 'date'),
+    ('Type', 'text'),
+    ('Reference', 'text'),
+    ('Charges', 'money'),
+    ('Payments', 'money'),
+    ('Balance', 'money'),
+]
+
+
+def queryset_rows(queryset, columns) -> Tuple[List[Column], Iterator[tuple]]:
+    """Headers and a chunked row iterator for a queryset and (field, column) pairs"""
+    fields = [field for field, _ in columns]
+    return [column for _, column in columns], queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def statement_rows(child, start=None, end=None) -> Iterator[tuple]:
+    """
+    A child's invoices and payments in date order with the running balance
+
+    Charges are each invoice's week amount (the previous balance it carries
+    is already in the running balance). With a start date, the first row is
+    the opening balance from everything before it.
+    """
+    invoices = child.invoices.order_by('issue_date', 'id')
+    payments = Payment.objects.filter(invoice__child=child).order_by(
+        'payment_date', 'id',
+    )
+    balance = Decimal('0.00')
+    if start is not None:
+        charged = invoices.filter(issue_date__lt=start).aggregate(total=Sum('week_amount_due'))['total']
+        paid = payments.filter(payment_date__lt=start).aggregate(total=Sum('amount_paid'))['total']
+        balance = (charged or Decimal('0.00')) - (paid or Decimal('0.00'))
+        yield (start, 'Opening balance', '', None, None, balance)
+        invoices = invoices.filter(issue_date__gte=start)
+        payments = payments.filter(payment_date__gte=start)
+    if end is not None:
+        invoices = invoices.filter(issue_date__lte=end)
+        payments = payments.filter(payment_date__lte=end)
+
+    # Each stream is already in date order; on the same day, charges come first
+    charges = (
+        (day, 0, 'Invoice', reference, amount, None)
+        for day, reference, amount in invoices.values_list(
+            'issue_date', 'invoice_reference', 'week_amount_due',
+        ).iterator(chunk_size=CHUNK_SIZE)
+    )
+    credits = (
+        (day, 1, 'Payment', reference or method, None, amount)
+        for day, method, reference, amount in payments.values_list(
+            'payment_date', 'payment_method', 'reference_number', 'amount_paid',
+        ).iterator(chunk_size=CHUNK_SIZE)
+    )
+    for day, _, kind, reference, charge, payment in heapq.merge(charges, credits, key=lambda line: line[:2]):
+        balance += (charge or 0) - (payment or 0)
+        yield (day, kind, reference, charge, payment, balance)
+
+
+def _chunks(rows: Iterable[tuple]) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Leading characters that make spreadsheet programs evaluate a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_text(value):
+    """Text that would be read as a formula, quoted with a leading apostrophe"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(columns: Sequence[Column], rows: Iterable[tuple]) -> Iterator[bytes]:
+    """
+    CSV with a UTF-8 byte order mark (so spreadsheet programs detect the encoding)
+
+    Text cells starting with a formula character are prefixed with an
+    apostrophe, so references and notes typed by users (or read from
+    uploaded PDFs) open as text. XLSX cells are inline strings and are never
+    evaluated, so they are left alone.
+    """
+    text_columns = {index for index, (_, kind) in enumerate(columns) if kind == 'text'}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([header for header, _ in columns])
+    for chunk in _chunks(rows):
+        writer.writerows(
+            [_csv_text(value) if index in text_columns else value for index, value in enumerate(row)]
+            for row in chunk
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _Pipe:
+    """Unseekable file object collecting what zipfile writes until it is drained"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell style 1 is a date (built-in format 14), style 2 an amount (#,##0.00)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+EXCEL_EPOCH = date(1899, 12, 30).toordinal()
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _text_cell(value) -> str:
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_INVALID_XML.sub("", str(value)))}</t></is></c>'
+
+
+def _xlsx_cell(value, kind) -> str:
+    if value is None or value == '':
+        return '<c/>'
+    if kind == 'date':
+        return f'<c s="1"><v>{value.toordinal() - EXCEL_EPOCH}</v></c>'
+    if kind == 'money':
+        return f'<c s="2"><v>{value}</v></c>'
+    return _text_cell(value)
+
+
+def xlsx_stream(columns: Sequence[Column], rows: Iterable[tuple]) -> Iterator[bytes]:
+    """A single-sheet workbook, yielded as each chunk of rows is compressed"""
+    pipe = _Pipe()
+    kinds = [kind for _, kind in columns]
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            header = ''.join(_text_cell(header) for header, _ in columns)
+            sheet.write(f'<row>{header}</row>'.encode())
+            for chunk in _chunks(rows):
+                sheet.write(''.join(
+                    '<row>' + ''.join(_xlsx_cell(value, kind) for value, kind in zip(row, kinds)) + '</row>'
+                    for row in chunk
+                ).encode())
+                yield pipe.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield pipe.drain()
+
+
+def export_response(columns: Sequence[Column], rows: Iterable[tuple], fmt: str, filename: str):
+    """
+    StreamingHttpResponse downloading rows as CSV or XLSX
+
+    Args:
+        columns: (header, kind) for each value in a row
+        rows: Row tuples, consumed lazily while the response is sent
+        fmt: 'csv' or 'xlsx'
+        filename: Download name without the extension
+    """
+    if fmt == 'xlsx':
+        content = xlsx_stream(columns, rows)
+    else:
+        content = csv_stream(columns, rows)
+    response = StreamingHttpResponse(content, content_type=FORMATS[fmt])
+    # Quoted or RFC 5987 encoded as needed, since names can include user input
+    response['Content-Disposition'] = content_disposition_header(True, f'{filename}.{fmt}')
+    return response
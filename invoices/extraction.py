@@ -0,0 +1,264 @@
+"""
+Invoice field patterns, compiled once
+
+The same rules as the original parser, compiled at import instead of on
+every call and grouped in priority order per field. Each field is still
+found with its own search()es over the upper-cased text, tried in priority
+order; only the line-oriented rules (previous balance, "Under 3 Fee", "Fee
+Discount" and provider name) share one walk over the lines. Field priorities
+and results match the original parser; parsing is about 1.0-1.7x faster
+(see benchmarks/bench_parse_invoice.py).
+"""
+import re
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+# Bump whenever a rule below changes in a way that can alter parsed output
+PARSER_VERSION = '2'
+
+_NUMERIC_DATE = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
+_WORD_DATE = r'(\d{1,2}\s+\w+\s+\d{4})'
+_LEGACY_AMOUNT = r'\$?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)'
+
+
+def _rules(*patterns: str) -> Tuple[re.Pattern, ...]:
+    """Compile a priority-ordered group of field patterns"""
+    return tuple(re.compile(pattern) for pattern in patterns)
+
+
+# Field rules in priority order, matched against the upper-cased text
+INVOICE_REFERENCE_RULES = _rules(
+    r'INV\s+(\d+)',
+    r'INVOICE\s*(?:NO|NUMBER|#)?\s*:?\s*(\w+[\w\-]*)',
+    r'REFERENCE\s*(?:NO|NUMBER)?\s*:?\s*(\w+[\w\-]*)',
+    r'INV\s*(?:NO|#)?\s*:?\s*(\w+[\w\-]*)',
+    r'REF\s+(\w+)',
+)
+
+CHILD_NAME_RULES = _rules(
+    r'CHILD\s*NAME\s*:\s*([A-Z\s]+)',
+    r'STUDENT\s*NAME\s*:\s*([A-Z\s]+)',
+    r'CHILD\s*:\s*([A-Z\s]+)',
+    r'FOR\s*:\s*([A-Z\s]+)',
+    r'STATEMENT\s+FOR\s+([A-Z\s]+?)\s*-\w+',
+    r'NAME\s*:\s*([A-Z\s]+?)(?:\s+AMOUNT|$)',
+)
+
+CHILD_REFERENCE_RULES = _rules(
+    r'CHILD\s*(?:REF|REFERENCE|ID|NO)\s*:\s*(\w+)',
+    r'STUDENT\s*(?:REF|REFERENCE|ID|NO)\s*:\s*(\w+)',
+    r'(?:REFERENCE|REF)\s*:\s*(\w+)',
+    r'(?:ID|NO)\s*:\s*(\w+)',
+    r'STATEMENT\s+FOR\s+[A-Z\s]+-(\w+)',
+    r'REFERENCE\s+NUMBER\s+(\w+)',
+)
+
+DATE_RULES = (
+    ('issue_date', _rules(
+        r'ISSUED\s*:?\s*' + _WORD_DATE,
+        r'ISSUE\s*DATE\s*:?\s*' + _NUMERIC_DATE,
+        r'DATE\s*:?\s*' + _NUMERIC_DATE,
+        r'INVOICE\s*DATE\s*:?\s*' + _NUMERIC_DATE,
+    )),
+    ('due_date', _rules(
+        r'DUE\s*DATE\s*:?\s*' + _NUMERIC_DATE,
+        r'PAYMENT\s*DUE\s*:?\s*' + _NUMERIC_DATE,
+    )),
+    ('period_start', _rules(
+        r'PERIOD\s*:?\s*' + _WORD_DATE + r'\s*-',
+        r'PERIOD\s*FROM\s*:?\s*' + _NUMERIC_DATE,
+        r'FROM\s*:?\s*' + _NUMERIC_DATE,
+    )),
+    ('period_end', _rules(
+        r'PERIOD\s*:?\s*\d{1,2}\s+\w+\s+\d{4}\s*-\s*' + _WORD_DATE,
+        r'PERIOD\s*TO\s*:?\s*' + _NUMERIC_DATE,
+        r'TO\s*:?\s*' + _NUMERIC_DATE,
+    )),
+)
+
+# The original mixed-case "Amount due (GST incl)" rule could never match
+# upper-cased text, so only its upper-case form is kept.
+TOTAL_DUE_RULES = _rules(
+    r'AMOUNT\s+DUE\s*\(\w+\s+\w+\)\s*\$(\d+\.\d{2})',
+)
+
+AMOUNT_FALLBACK_RULES = _rules(
+    r'TOTAL\s*(?:DUE|AMOUNT)?\s*:?\s*' + _LEGACY_AMOUNT,
+    r'AMOUNT\s*DUE\s*:?\s*' + _LEGACY_AMOUNT,
+    r'FINAL\s*AMOUNT\s*:?\s*' + _LEGACY_AMOUNT,
+    r'DUE\s*:?\s*' + _LEGACY_AMOUNT,
+    r'BALANCE\s*DUE\s*:?\s*' + _LEGACY_AMOUNT,
+    r'OUTSTANDING\s*:?\s*' + _LEGACY_AMOUNT,
+)
+
+DISCOUNT_PERCENTAGE_RULES = _rules(
+    r'DISCOUNT\s*:?\s*(\d{1,2})%',
+)
+
+# Patterns applied to the original-case text
+FEE_TYPE_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(UNDER\s+\d+\s+FEE)',
+    r'(\d+\w*\s+FEE)',
+    r'FEE\s*TYPE\s*:?\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
+    r'SERVICE\s*:?\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)',
+))
+PROVIDER_FROM_PATTERN = re.compile(r'FROM:\s*([A-Za-z\s]+?)(?:\n|\s{2,})', re.IGNORECASE)
+DOLLAR_AMOUNT_PATTERN = re.compile(r'\$(\d{1,3}(?:\.\d{2})?)')
+
+# Line-level patterns
+LINE_AMOUNT_PATTERN = re.compile(r'\$(\d+\.\d{2})')
+LINE_CREDIT_PATTERN = re.compile(r'-\$(\d+\.\d{2})')
+LINE_PERCENTAGE_PATTERN = re.compile(r'(\d+\.\d{2})%')
+
+PROVIDER_KEYWORDS = ('DAYCARE', 'CHILDCARE', 'EXPLORERS', 'NURSERY')
+PROVIDER_SEARCH_LINES = 10
+
+
+def empty_invoice_data() -> Dict:
+    """Return the parsed invoice dict with every field at its default"""
+    return {
+        'invoice_reference': '',
+        'issue_date': None,
+        'due_date': None,
+        'period_start': None,
+        'period_end': None,
+        'original_amount': Decimal('0.00'),
+        'discount_amount': Decimal('0.00'),
+        'discount_percentage': Decimal('0.00'),
+        'previous_balance': Decimal('0.00'),
+        'week_amount_due': Decimal('0.00'),
+        'total_amount_due': Decimal('0.00'),
+        'amount_due': Decimal('0.00'),  # Legacy field
+        'child_reference': '',
+        'child_name': '',
+        'fee_type': '',
+        'provider_name': '',
+    }
+
+
+def _first_group(patterns, text_upper: str) -> Optional[str]:
+    """First captured group of the highest priority pattern that matches"""
+    for pattern in patterns:
+        match = pattern.search(text_upper)
+        if match is not None:
+            return match.group(1)
+    return None
+
+
+def _scan_lines(text_lines: List[str], parsed_data: Dict) -> None:
+    """Fill the line-oriented fields in a single walk over the lines"""
+    need_previous = need_original = need_discount = True
+    need_provider = True
+    last_index = len(text_lines) - 1
+
+    for index, line in enumerate(text_lines):
+        if need_previous and 'Previous Balance' in line:
+            match = LINE_AMOUNT_PATTERN.search(line)
+            if match:
+                parsed_data['previous_balance'] = Decimal(match.group(1))
+                need_previous = False
+
+        if need_original and 'Under 3 Fee' in line:
+            match = LINE_AMOUNT_PATTERN.search(line)
+            if not match and index < last_index:
+                match = LINE_AMOUNT_PATTERN.search(text_lines[index + 1])
+            if match:
+                parsed_data['original_amount'] = Decimal(match.group(1))
+                need_original = False
+
+        if need_discount and 'Fee Discount' in line:
+            match = LINE_PERCENTAGE_PATTERN.search(line)
+            if match:
+                parsed_data['discount_percentage'] = Decimal(match.group(1))
+            match = LINE_CREDIT_PATTERN.search(line)
+            if not match and index < last_index:
+                match = LINE_CREDIT_PATTERN.search(text_lines[index + 1])
+            if match:
+                parsed_data['discount_amount'] = Decimal(match.group(1))
+                need_discount = False
+
+        if need_provider and index < PROVIDER_SEARCH_LINES and len(line) > 10:
+            line_upper = line.upper()
+            if any(keyword in line_upper for keyword in PROVIDER_KEYWORDS):
+                parsed_data['provider_name'] = line.strip()
+                need_provider = False
+
+
+def extract_invoice_fields(text: str) -> Dict:
+    """
+    Extract invoice fields from already sanitized text
+
+    Args:
+        text: Sanitized text extracted from an invoice PDF
+
+    Returns:
+        Dictionary with the same keys as parse_invoice_data
+    """
+    from .utils import parse_date_string
+
+    parsed_data = empty_invoice_data()
+    text_upper = text.upper()
+
+    reference = _first_group(INVOICE_REFERENCE_RULES, text_upper)
+    if reference is not None:
+        parsed_data['invoice_reference'] = reference
+
+    child_name = _first_group(CHILD_NAME_RULES, text_upper)
+    if child_name is not None:
+        parsed_data['child_name'] = ' '.join(word.capitalize() for word in child_name.split())
+
+    child_reference = _first_group(CHILD_REFERENCE_RULES, text_upper)
+    if child_reference is not None:
+        parsed_data['child_reference'] = child_reference
+
+    # A date rule whose first match does not parse falls through to the next rule
+    for date_key, rules in DATE_RULES:
+        for pattern in rules:
+            match = pattern.search(text_upper)
+            if match:
+                parsed_date = parse_date_string(match.group(1))
+                if parsed_date:
+                    parsed_data[date_key] = parsed_date
+                    break
+
+    _scan_lines(text.split('\n'), parsed_data)
+
+    total_due = _first_group(TOTAL_DUE_RULES, text_upper)
+    if total_due is not None:
+        parsed_data['total_amount_due'] = Decimal(total_due)
+
+    if parsed_data['original_amount'] > 0 and parsed_data['discount_amount'] > 0:
+        parsed_data['week_amount_due'] = parsed_data['original_amount'] - parsed_data['discount_amount']
+
+    if parsed_data['total_amount_due'] > 0:
+        parsed_data['amount_due'] = parsed_data['total_amount_due']
+
+    # Fallbacks for other invoice layouts: largest dollar amount, then labelled totals
+    if parsed_data['total_amount_due'] == Decimal('0.00'):
+        amounts = [Decimal(amount) for amount in DOLLAR_AMOUNT_PATTERN.findall(text)]
+        if amounts:
+            parsed_data['total_amount_due'] = max(amounts)
+            parsed_data['amount_due'] = parsed_data['total_amount_due']
+
+    if parsed_data['total_amount_due'] == Decimal('0.00'):
+        fallback_amount = _first_group(AMOUNT_FALLBACK_RULES, text_upper)
+        if fallback_amount is not None:
+            parsed_data['total_amount_due'] = Decimal(fallback_amount.replace(',', ''))
+            parsed_data['amount_due'] = parsed_data['total_amount_due']
+
+    discount_percentage = _first_group(DISCOUNT_PERCENTAGE_RULES, text_upper)
+    if discount_percentage is not None:
+        parsed_data['discount_percentage'] = Decimal(discount_percentage)
+
+    for pattern in FEE_TYPE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            parsed_data['fee_type'] = match.group(1).strip()
+            break
+
+    if not parsed_data['provider_name']:
+        match = PROVIDER_FROM_PATTERN.search(text)
+        if match:
+            parsed_data['provider_name'] = match.group(1).strip()
+
+    return parsed_data
@@ -0,0 +1,186 @@
+"""
+Content-addressed cache for PDF text extraction and parsing results
+
+Entries are keyed by the SHA-256 of the uploaded file bytes together with the
+parser rules version, so a re-uploaded invoice skips PyPDF2 extraction and
+regex parsing, while any change to the parsing rules invalidates old entries.
+Only user-independent results (sanitized text and parsed fields) are stored;
+child matching still runs on every upload. Uploads are hashed only after the
+type and size checks pass, and extractions that produced no text are not
+stored, so a re-upload tries again.
+
+The backend is configured through settings.INVOICE_EXTRACTION_CACHE:
+
+    INVOICE_EXTRACTION_CACHE = {
+        'BACKEND': 'invoices.extraction_cache.DjangoCacheBackend',
+        'OPTIONS': {'alias': 'invoice_extraction', 'timeout': None},
+    }
+
+Set it to None to disable caching.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .extraction import PARSER_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of stored entries changes
+CACHE_FORMAT_VERSION = '1'
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def hash_uploaded_file(file) -> str:
+    """SHA-256 hex digest of the file contents, leaving the pointer at the start"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def make_cache_key(file_hash: str) -> str:
+    """Cache key for a file hash under the current parser rules"""
+    return f'invoice_extraction:{CACHE_FORMAT_VERSION}:{PARSER_VERSION}:{file_hash}'
+
+
+class DjangoCacheBackend:
+    """
+    Store entries in one of the configured Django caches
+
+    Size bounding and eviction are delegated to the cache itself; LocMemCache
+    evicts least recently used entries once MAX_ENTRIES is reached.
+    """
+
+    def __init__(self, alias: str = 'default', timeout: Optional[int] = None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        return self.cache.get(make_cache_key(file_hash))
+
+    def set(self, file_hash: str, entry: Dict) -> None:
+        self.cache.set(make_cache_key(file_hash), entry, self.timeout)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+def _encode_value(value):
+    """JSON encoder hook for the Decimal and date values in parsed data"""
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f'Cannot serialize {value.__class__.__name__}')
+
+
+def _decode_value(obj):
+    """JSON decoder hook reversing _encode_value"""
+    if '__decimal__' in obj:
+        return Decimal(obj['__decimal__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+class FileSystemBackend:
+    """
+    Store entries as JSON files in a directory, by default under MEDIA_ROOT
+
+    Reads refresh a file's modification time and writes evict the least
+    recently used files once more than max_entries are stored.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 1000):
+        self.directory = Path(directory or Path(settings.MEDIA_ROOT) / 'extraction_cache')
+        self.max_entries = max_entries
+
+    def _path(self, file_hash: str) -> Path:
+        return self.directory / f'{make_cache_key(file_hash).replace(":", "-")}.json'
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        path = self._path(file_hash)
+        try:
+            with open(path, encoding='utf-8') as cache_file:
+                entry = json.load(cache_file, object_hook=_decode_value)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def set(self, file_hash: str, entry: Dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as cache_file:
+                json.dump(entry, cache_file, default=_encode_value)
+            os.replace(temp_path, self._path(file_hash))
+        except OSError:
+            logger.warning("Could not write extraction cache entry %s", file_hash, exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries above max_entries"""
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        for _, path in sorted(entries)[:excess]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        for path in self.directory.glob('*.json'):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+@lru_cache(maxsize=None)
+def get_extraction_cache():
+    """Backend configured in settings.INVOICE_EXTRACTION_CACHE, or None if disabled"""
+    config = getattr(settings, 'INVOICE_EXTRACTION_CACHE', None)
+    if not config:
+        return None
+    backend_class = import_string(config['BACKEND'])
+    return backend_class(**config.get('OPTIONS', {}))
+
+
+@receiver(setting_changed)
+def reset_extraction_cache(setting, **kwargs):
+    """Rebuild the backend when tests override INVOICE_EXTRACTION_CACHE"""
+    if setting == 'INVOICE_EXTRACTION_CACHE':
+        get_extraction_cache.cache_clear()
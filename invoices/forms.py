@@ -122,7 +122,7 @@ class PaymentForm(forms.ModelForm):
         if user:
             # Filter invoices to only show user's invoices
             self.fields['invoice'].queryset = Invoice.objects.filter(
-                child__user=user
+                user=user
             ).select_related('child')
         
         self.helper = FormHelper()
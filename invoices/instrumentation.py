@@ -0,0 +1,149 @@
+"""
+Per-request timing and query-count instrumentation
+
+RequestTimingMiddleware measures wall time for every request. For a sampled
+fraction of requests it also counts database queries and the time spent in
+them, and collects named stages recorded with timed_stage(), such as the PDF
+processing steps in utils.process_uploaded_invoice and template rendering
+(see TimedDjangoTemplates). Sampled and slow requests are written to the
+structured log, tagged with the request's correlation id, and sampled
+requests can report their timings in a Server-Timing response header.
+
+    INVOICE_TIMING_SAMPLE_RATE = 1.0   # fraction of requests instrumented
+    INVOICE_SLOW_REQUEST_MS = 1000     # always log requests slower than this
+    INVOICE_SERVER_TIMING = True       # add the Server-Timing header
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+from .logging_config import StructuredLogger
+from .metrics import template_render_duration
+
+logger = logging.getLogger('invoices.timing')
+
+_current_metrics = ContextVar('invoice_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Query and stage timings collected for one request"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.stages = {}
+
+    def add_stage(self, name, duration_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper, see connection.execute_wrapper()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            self.query_ms += (time.perf_counter() - start) * 1000
+
+
+@contextmanager
+def timed_stage(name):
+    """Add the time spent in the block to the current request's stage timings"""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_stage(name, (time.perf_counter() - start) * 1000)
+
+
+def server_timing_header(total_ms, metrics):
+    """Server-Timing header value for a request's timings"""
+    entries = [f'total;dur={total_ms:.1f}', f'db;dur={metrics.query_ms:.1f};desc="{metrics.query_count} queries"']
+    entries += [f'{name};dur={duration:.1f}' for name, duration in metrics.stages.items()]
+    return ', '.join(entries)
+
+
+class RequestTimingMiddleware:
+    """Time requests and log sampled or slow ones with their query and stage timings"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'INVOICE_TIMING_SAMPLE_RATE', 0.0)
+        metrics = RequestMetrics() if sample_rate and random.random() < sample_rate else None
+
+        start = time.perf_counter()
+        if metrics is None:
+            response = self.get_response(request)
+        else:
+            token = _current_metrics.set(metrics)
+            try:
+                with ExitStack() as stack:
+                    for alias in connections:
+                        stack.enter_context(connections[alias].execute_wrapper(metrics))
+                    response = self.get_response(request)
+            finally:
+                _current_metrics.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        slow = total_ms >= getattr(settings, 'INVOICE_SLOW_REQUEST_MS', 1000)
+        if metrics is not None or slow:
+            self.log_request(request, response, total_ms, metrics, slow)
+        if metrics is not None and getattr(settings, 'INVOICE_SERVER_TIMING', False):
+            response['Server-Timing'] = server_timing_header(total_ms, metrics)
+        return response
+
+    def log_request(self, request, response, total_ms, metrics, slow):
+        timing = {
+            'method': request.method,
+            'path': request.path,
+            'status_code': response.status_code,
+            'duration_ms': round(total_ms, 1),
+            'slow': slow,
+        }
+        if metrics is not None:
+            timing.update({
+                'query_count': metrics.query_count,
+                'query_ms': round(metrics.query_ms, 1),
+                'stages_ms': {name: round(duration, 1) for name, duration in metrics.stages.items()},
+            })
+        message = f'{request.method} {request.path} {response.status_code} {total_ms:.0f}ms'
+        if slow:
+            user = getattr(request, 'user', None)
+            logger.warning(message, extra={
+                'correlation_id': StructuredLogger.get_correlation_id(request),
+                'user_id': user.id if user is not None and user.is_authenticated else None,
+                **timing,
+            })
+        else:
+            StructuredLogger.log_info(logger, message, request=request, extra_data=timing)
+
+
+class TimedTemplate(Template):
+    """Template whose rendering is recorded as the 'render' stage"""
+
+    def render(self, context=None, request=None):
+        with timed_stage('render'), template_render_duration.time(template=self.origin.template_name or '<string>'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend that records render time in request timings"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,86 @@
+"""
+Database-backed background processing of uploaded invoice PDFs
+
+Uploads are stored as InvoiceProcessingJob rows and picked up by the
+process_invoice_jobs management command, which fans them out to a process
+pool. No external broker is needed; claiming a job is a conditional UPDATE,
+so several workers can share one SQLite database.
+"""
+import logging
+from typing import List
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import InvoiceProcessingJob
+from .utils import process_uploaded_invoice
+
+logger = logging.getLogger(__name__)
+
+
+def async_processing_enabled() -> bool:
+    """Whether uploads are queued for the worker instead of processed in the request"""
+    return getattr(settings, 'INVOICE_PROCESSING_ASYNC', False)
+
+
+def enqueue_invoice_job(pdf_file, user) -> InvoiceProcessingJob:
+    """Store an uploaded PDF and queue it for processing"""
+    pdf_file.seek(0)
+    job = InvoiceProcessingJob(user=user, original_name=pdf_file.name[:255])
+    job.pdf_file.save(pdf_file.name, pdf_file, save=False)
+    job.save()
+    pdf_file.seek(0)
+    logger.info("Queued invoice processing job %s for user %s", job.pk, user.pk)
+    return job
+
+
+def claim_jobs(limit: int) -> List[int]:
+    """Mark up to limit queued jobs as running and return their ids, oldest first"""
+    candidate_ids = InvoiceProcessingJob.objects.filter(
+        status=InvoiceProcessingJob.STATUS_QUEUED
+    ).order_by('created_at', 'pk').values_list('pk', flat=True)[:limit]
+
+    claimed = []
+    for job_id in candidate_ids:
+        # Another worker may have claimed the job since it was selected
+        updated = InvoiceProcessingJob.objects.filter(
+            pk=job_id, status=InvoiceProcessingJob.STATUS_QUEUED
+        ).update(status=InvoiceProcessingJob.STATUS_RUNNING, started_at=timezone.now())
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_running_jobs() -> int:
+    """Return jobs left running by a worker that stopped mid-batch to the queue"""
+    return InvoiceProcessingJob.objects.filter(
+        status=InvoiceProcessingJob.STATUS_RUNNING
+    ).update(status=InvoiceProcessingJob.STATUS_QUEUED, started_at=None)
+
+
+def run_invoice_job(job_id: int) -> str:
+    """Process one claimed job and store its result; returns the final status"""
+    job = InvoiceProcessingJob.objects.select_related('user').get(pk=job_id)
+    try:
+        with job.pdf_file.open('rb') as pdf_file:
+            job.result = process_uploaded_invoice(pdf_file, job.user)
+        job.status = InvoiceProcessingJob.STATUS_COMPLETED
+    except Exception as e:
+        logger.error("Invoice processing job %s failed: %s", job_id, e, exc_info=True)
+        job.status = InvoiceProcessingJob.STATUS_FAILED
+        job.error = f'Error processing PDF: {str(e)}'
+
+    # The extracted result is all that is kept once a job has run
+    if job.pdf_file:
+        job.pdf_file.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save()
+    return job.status
+
+
+def init_worker_process():
+    """Process pool initializer: set up Django and drop inherited DB connections"""
+    django.setup()
+    connections.close_all()
@@ -0,0 +1,290 @@
+"""
+Non-blocking JSON-lines logging pipeline
+
+QueueFileHandler only puts records on an in-memory queue; a background
+listener thread formats them as JSON lines and writes them to a rotating file
+in batches, flushing once per batch. Request threads therefore never wait on
+disk I/O, and tracebacks and extra data are formatted in the listener.
+
+Configured in settings.LOGGING:
+
+    'file': {
+        'class': 'invoices.log_pipeline.QueueFileHandler',
+        'filename': BASE_DIR / 'logs' / 'application.log',
+        'max_bytes': 10 * 1024 * 1024,
+        'backup_count': 5,
+        'rotate_when': 'midnight',
+    }
+
+When the queue is full new records are dropped rather than blocking, and the
+number dropped is reported in the next record written.
+
+Every process writing the file (forked workers, separately started servers
+and commands) appends to it. Rotation is checked once per batch against the
+file on disk and done under an exclusive lock on '<filename>.lock', so the
+file is rotated once however many processes notice; the others reopen the
+new file before their next batch.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation is not coordinated between processes
+    fcntl = None
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Intervals accepted by rotate_when, in seconds
+_ROTATION_INTERVALS = {'S': 1, 'M': 60, 'H': 3600, 'D': 86400, 'MIDNIGHT': 86400}
+
+_handlers = weakref.WeakSet()
+
+
+def _json_default(value):
+    """Serialize extra values such as Decimals, dates and form errors"""
+    if hasattr(value, 'get_json_data'):
+        return value.get_json_data()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """Format a record as one JSON object per line, including extra fields"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.thread,
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=_json_default)
+
+
+class RotatingJSONLinesFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotate by size and/or age when told to, and leave flushing to the caller
+
+    The file may be shared by several processes: rollover_if_due() decides
+    from the file on disk and the lock file's mtime (the time of the last
+    rotation), not from this process's own writes.
+
+    Args:
+        filename: Log file path
+        max_bytes: Rotate once the file would exceed this size; 0 disables
+        backup_count: Rotated files to keep
+        rotate_when: 'S', 'M', 'H', 'D' or 'midnight' to also rotate by age; None disables
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=5, rotate_when=None):
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.rotate_when = rotate_when.upper() if rotate_when else None
+        if self.rotate_when and self.rotate_when not in _ROTATION_INTERVALS:
+            raise ValueError(f'Invalid rotate_when: {rotate_when}')
+        self.lock_path = self.baseFilename + '.lock'
+        # Created now so age-based rotation counts from the first start
+        open(self.lock_path, 'a').close()
+        self._stream_id = None
+        self.setFormatter(JSONLinesFormatter())
+
+    def _next_rollover(self, rotated_at):
+        if self.rotate_when == 'MIDNIGHT':
+            local = time.localtime(rotated_at)
+            return time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        return rotated_at + _ROTATION_INTERVALS[self.rotate_when]
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self._stream_id = (stat.st_dev, stat.st_ino)
+        return stream
+
+    def _file_state(self):
+        """((device, inode), size) of the file now at the log path, or None"""
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_dev, stat.st_ino), stat.st_size
+
+    def _rotated_at(self):
+        try:
+            return os.stat(self.lock_path).st_mtime
+        except FileNotFoundError:
+            open(self.lock_path, 'a').close()
+            return time.time()
+
+    def _rollover_due(self, state, now):
+        if state is None:
+            return False
+        if self.maxBytes and state[1] >= self.maxBytes:
+            return True
+        return bool(self.rotate_when) and now >= self._next_rollover(self._rotated_at())
+
+    @contextmanager
+    def _rotation_lock(self):
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def rollover_if_due(self):
+        """Rotate the file if it is due, and reopen it if another process rotated it"""
+        now = time.time()
+        state = self._file_state()
+        if self._rollover_due(state, now):
+            with self._rotation_lock():
+                # Another process may have rotated it while we waited
+                state = self._file_state()
+                if self._rollover_due(state, now):
+                    self.doRollover()
+                    os.utime(self.lock_path)
+                    state = None
+        if self.stream is not None and (state is None or state[0] != self._stream_id):
+            self.stream.close()
+            self.stream = None
+
+    def emit(self, record):
+        # Same as FileHandler.emit without the per-record flush; rotation is
+        # left to rollover_if_due()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueFileHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for a background thread that writes them to a JSON-lines file
+
+    Args:
+        filename: Log file path
+        max_bytes: Size-based rotation threshold; 0 disables
+        backup_count: Rotated files to keep
+        rotate_when: Age-based rotation interval, see RotatingJSONLinesFileHandler
+        queue_size: Records buffered before new ones are dropped
+        batch_size: Most records written between flushes
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, rotate_when=None,
+                 queue_size=10000, batch_size=200):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = RotatingJSONLinesFileHandler(filename, max_bytes, backup_count, rotate_when)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._thread = None
+        self._start()
+        _handlers.add(self)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='log-pipeline', daemon=True)
+        self._thread.start()
+
+    def prepare(self, record):
+        # Merge the message now since args may change later, but leave exc_info
+        # and extra data for the listener thread to format
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if None in batch:
+                return
+
+    def _write(self, batch):
+        try:
+            self.target.rollover_if_due()
+        except OSError:
+            # Keep writing to the open file; rotation is retried next batch
+            self.target.handleError(logging.makeLogRecord({'name': __name__, 'msg': 'Log rotation failed'}))
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            self.target.handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f'Log queue full; dropped {dropped} record(s)',
+            }))
+        for record in batch:
+            if record is not None:
+                self.target.handle(record)
+        self.target.flush()
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.join()
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.target.close()
+        super().close()
+
+    def _after_fork(self):
+        # The listener thread does not survive fork; start one for the child
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self._dropped_lock = threading.Lock()
+        self.target.stream = None
+        self._start()
+
+
+def _restart_after_fork():
+    for handler in list(_handlers):
+        if handler._thread is not None:
+            handler._after_fork()
+
+
+def _close_all():
+    for handler in list(_handlers):
+        handler.close()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_close_all)
@@ -6,7 +6,6 @@ import uuid
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.conf import settings
-import traceback
 
 class StructuredLogger:
     """Structured logging with correlation IDs"""
@@ -34,13 +33,13 @@ class StructuredLogger:
             log_data.update({
                 'error_type': error.__class__.__name__,
                 'error_message': str(error),
-                'traceback': traceback.format_exc() if settings.DEBUG else None
             })
         
         if extra_data:
             log_data.update(extra_data)
         
-        logger.error("Application Error", extra=log_data)
+        # The traceback is formatted by the log handler, off the request thread
+        logger.error("Application Error", extra=log_data, exc_info=error if error and settings.DEBUG else None)
     
     @staticmethod
     def log_info(logger, message, request=None, extra_data=None):
@@ -74,26 +73,63 @@ from django.core.cache import cache
 from django.http import HttpResponse
 import time
 
+def check_rate_limit(identifier, max_requests, window_seconds):
+    """
+    Count a request against a sliding-window limit shared through the cache
+
+    Requests are counted in fixed buckets one window long; the previous
+    bucket's count is weighted by how much of it still falls inside the
+    sliding window. Each check is an add/incr on the current bucket and a get
+    of the previous one, which is atomic on shared backends such as
+    invoices.cache_backends.SQLiteCache.
+
+    Args:
+        identifier: User id or address the limit applies to
+        max_requests: Requests allowed per window
+        window_seconds: Length of the sliding window in seconds
+
+    Returns:
+        Seconds to wait before retrying if the request is refused, otherwise 0
+    """
+    now = time.time()
+    bucket = int(now // window_seconds)
+    current_key = f'rate_limit:{identifier}:{window_seconds}:{bucket}'
+    previous_key = f'rate_limit:{identifier}:{window_seconds}:{bucket - 1}'
+
+    # Buckets live for two windows so the next bucket can still weigh this one
+    cache.add(current_key, 0, window_seconds * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Expired between add and incr
+        cache.add(current_key, 1, window_seconds * 2)
+        current = 1
+
+    elapsed = now / window_seconds - bucket
+    estimated = current + cache.get(previous_key, 0) * (1 - elapsed)
+    if estimated <= max_requests:
+        return 0
+
+    # Refused requests do not count towards the limit
+    try:
+        cache.decr(current_key)
+    except ValueError:
+        pass
+    return max(1, int((1 - elapsed) * window_seconds))
+
+
 def rate_limit_uploads(max_uploads=5, window_minutes=10):
     """Rate limiting decorator for file uploads"""
     def decorator(view_func):
         def wrapper(self, request, *args, **kwargs):
             if request.method == 'POST' and request.FILES:
                 user_id = request.user.id if request.user.is_authenticated else request.META.get('REMOTE_ADDR')
-                cache_key = f'upload_rate_limit_{user_id}'
+                retry_after = check_rate_limit(f'upload_{user_id}', max_uploads, window_minutes * 60)
                 
-                uploads = cache.get(cache_key, [])
-                now = time.time()
-                # Remove uploads older than window
-                uploads = [upload_time for upload_time in uploads if now - upload_time < window_minutes * 60]
-                
-                if len(uploads) >= max_uploads:
+                if retry_after:
                     response = HttpResponse("Too many uploads. Please wait before uploading again.", status=429)
-                    response['Retry-After'] = str(window_minutes * 60)
+                    response['Retry-After'] = str(retry_after)
                     return response
-                
-                uploads.append(now)
-                cache.set(cache_key, uploads, window_minutes * 60)
             
             return view_func(self, request, *args, **kwargs)
         return wrapper
@@ -166,12 +166,12 @@ class Command(BaseCommand):
         self.stdout.write('\nSummary:')
         self.stdout.write(f'- Daycare Providers: {DaycareProvider.objects.count()}')
         self.stdout.write(f'- Children: {Child.objects.filter(user=user).count()}')
-        self.stdout.write(f'- Invoices: {Invoice.objects.filter(child__user=user).count()}')
-        self.stdout.write(f'- Payments: {Payment.objects.filter(invoice__child__user=user).count()}')
+        self.stdout.write(f'- Invoices: {Invoice.objects.filter(user=user).count()}')
+        self.stdout.write(f'- Payments: {Payment.objects.filter(user=user).count()}')
         
         # Show invoice statuses
         self.stdout.write('\nInvoice Status Summary:')
-        for invoice in Invoice.objects.filter(child__user=user):
+        for invoice in Invoice.objects.filter(user=user):
             status = invoice.payment_status
             outstanding = invoice.outstanding_balance
             self.stdout.write(f'- {invoice.invoice_reference}: {status.title()} (Outstanding: ${outstanding})')
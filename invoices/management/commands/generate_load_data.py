@@ -0,0 +1,179 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from invoices.models import Child, DaycareProvider, Invoice, Payment
+from invoices.stats import invalidate_user_stats
+from invoices.summaries import rebuild_monthly_summaries
+
+User = get_user_model()
+
+PROVIDER_NAMES = ['Active Explorers Ashburton', 'Sunshine Daycare Centre', 'Little Acorns Nursery']
+FIRST_NAMES = ['Sofia', 'Liam', 'Emma', 'Noah', 'Olivia', 'Mason', 'Ava', 'Lucas', 'Mia', 'Leo']
+LAST_NAMES = ['Green', 'Smith', 'Brown', 'Taylor', 'Wilson', 'Walker', 'Clark', 'Hall']
+WEEKLY_FEES = [Decimal(amount) for amount in ('180.00', '245.50', '312.00', '398.75', '455.00')]
+DISCOUNTS = [Decimal('0.00'), Decimal('0.00'), Decimal('25.00'), Decimal('50.00')]
+PAYMENT_METHODS = [choice for choice, _ in Payment.PAYMENT_METHOD_CHOICES]
+CENT = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible dataset of users, children, weekly invoices and payments for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Users to create')
+        parser.add_argument('--children', type=int, default=2, help='Children per user')
+        parser.add_argument('--years', type=float, default=1, help='Years of weekly invoices per child')
+        parser.add_argument('--seed', type=int, default=2025, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help='Issue date of the last invoice (YYYY-MM-DD, default today)')
+        parser.add_argument('--prefix', default='loadtest', help='Username prefix of the generated users')
+        parser.add_argument('--password', default='loadtest-password', help='Password for every generated user')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk INSERT')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete users with the prefix (and their data) before generating')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}_')
+        if options['clear']:
+            deleted = existing.count()
+            existing.delete()
+            self.stdout.write(f'Deleted {deleted} existing {prefix} user(s)')
+        elif existing.exists():
+            raise CommandError(f'Users named {prefix}_* already exist; use --clear or another --prefix')
+
+        rng = random.Random(options['seed'])
+        end_date = options['end_date'] or date.today()
+        weeks = max(1, round(options['years'] * 52))
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            providers = self.get_providers()
+            users = User.objects.bulk_create([
+                User(username=f'{prefix}_{index:05d}', email=f'{prefix}_{index:05d}@example.com',
+                     password=make_password(options['password']))
+                for index in range(options['users'])
+            ], batch_size=batch_size)
+            if not all(user.pk for user in users):
+                # Backends without RETURNING do not set primary keys on bulk_create
+                users = list(User.objects.filter(username__startswith=f'{prefix}_').order_by('username'))
+
+            children = Child.objects.bulk_create([
+                Child(
+                    user=user,
+                    name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    reference_number=f'LT{user.pk}-{number}',
+                    date_of_birth=end_date - timedelta(days=rng.randint(365, 5 * 365)),
+                    daycare_provider=rng.choice(providers),
+                )
+                for user in users for number in range(options['children'])
+            ], batch_size=batch_size)
+
+            invoice_count = payment_count = 0
+            invoices, payments = [], []
+            for child in children:
+                for invoice, invoice_payments in self.child_history(rng, child, weeks, end_date):
+                    invoices.append(invoice)
+                    payments.append(invoice_payments)
+                if len(invoices) >= batch_size:
+                    invoice_count, payment_count = self.flush(invoices, payments, batch_size,
+                                                              invoice_count, payment_count)
+                    invoices, payments = [], []
+            invoice_count, payment_count = self.flush(invoices, payments, batch_size, invoice_count, payment_count)
+            # bulk_create skips the signals that keep the monthly summaries up to date
+            rebuild_monthly_summaries(users)
+
+        # bulk_create skips the signals that normally keep cached stats fresh
+        for user in users:
+            invalidate_user_stats(user.pk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(children)} children, '
+            f'{invoice_count} invoices and {payment_count} payments'
+        ))
+
+    def get_providers(self):
+        providers = []
+        for name in PROVIDER_NAMES:
+            provider, _ = DaycareProvider.objects.get_or_create(name=name)
+            providers.append(provider)
+        return providers
+
+    def child_history(self, rng, child, weeks, end_date):
+        """Weekly invoices for a child, oldest first, each with the payments made against it"""
+        weekly_fee = rng.choice(WEEKLY_FEES)
+        discount_percentage = rng.choice(DISCOUNTS)
+        for week in range(weeks):
+            issue_date = end_date - timedelta(weeks=weeks - 1 - week)
+            period_start = issue_date - timedelta(days=issue_date.weekday())
+            discount_amount = (weekly_fee * discount_percentage / 100).quantize(CENT)
+            week_amount_due = weekly_fee - discount_amount
+            invoice = Invoice(
+                child=child,
+                user_id=child.user_id,
+                invoice_reference=f'LT-{child.pk}-{week + 1:04d}',
+                period_start=period_start,
+                period_end=period_start + timedelta(days=4),
+                issue_date=issue_date,
+                due_date=issue_date + timedelta(days=7),
+                original_amount=weekly_fee,
+                discount_percentage=discount_percentage,
+                discount_amount=discount_amount,
+                week_amount_due=week_amount_due,
+                total_amount_due=week_amount_due,
+                amount_due=week_amount_due,
+                fee_type='Weekly Fee',
+            )
+
+            # Older invoices are nearly always settled; the last few weeks are often still open
+            roll = rng.random()
+            settled_share = 0.95 if week < weeks - 4 else 0.4
+            if roll < settled_share:
+                amounts = [week_amount_due]
+                if rng.random() < 0.2:
+                    first = (week_amount_due * Decimal(rng.randint(30, 70)) / 100).quantize(CENT)
+                    amounts = [first, week_amount_due - first]
+            elif roll < settled_share + 0.03:
+                amounts = [(week_amount_due / 2).quantize(CENT)]
+            else:
+                amounts = []
+
+            invoice_payments = [
+                Payment(
+                    payment_date=min(end_date, issue_date + timedelta(days=rng.randint(0, 6) + index * 7)),
+                    amount_paid=amount,
+                    payment_method=rng.choice(PAYMENT_METHODS),
+                    reference_number=f'LT-{child.pk}-{week + 1:04d}-{index + 1}',
+                )
+                for index, amount in enumerate(amounts)
+            ]
+            invoice.amount_paid_total = sum(amounts, Decimal('0.00'))
+            if invoice.amount_paid_total >= invoice.total_amount_due:
+                invoice.payment_status = 'paid'
+            elif invoice.amount_paid_total > 0:
+                invoice.payment_status = 'partial'
+            elif invoice.due_date < end_date:
+                invoice.payment_status = 'overdue'
+            else:
+                invoice.payment_status = 'unpaid'
+            yield invoice, invoice_payments
+
+    def flush(self, invoices, payments, batch_size, invoice_count, payment_count):
+        """Insert a batch of invoices, then their payments once the invoices have ids"""
+        if not invoices:
+            return invoice_count, payment_count
+        Invoice.objects.bulk_create(invoices, batch_size=batch_size)
+        rows = []
+        for invoice, invoice_payments in zip(invoices, payments):
+            for payment in invoice_payments:
+                payment.invoice = invoice
+                payment.user_id = invoice.user_id
+                rows.append(payment)
+        Payment.objects.bulk_create(rows, batch_size=batch_size)
+        return invoice_count + len(invoices), payment_count + len(rows)
@@ -0,0 +1,265 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from invoices.jobs import init_worker_process
+from invoices.models import Child, Invoice
+from invoices.stats import invalidate_user_stats
+from invoices.summaries import mark_dirty
+from invoices.utils import PDFDocument, extract_pdf_text, parse_invoice_data, validate_pdf_file
+
+User = get_user_model()
+
+INVOICE_FIELDS = [
+    'invoice_reference', 'period_start', 'period_end', 'issue_date', 'due_date',
+    'original_amount', 'discount_percentage', 'discount_amount', 'previous_balance',
+    'week_amount_due', 'total_amount_due', 'amount_due', 'fee_type',
+]
+REQUIRED_FIELDS = ['invoice_reference', 'period_start', 'period_end', 'issue_date', 'original_amount']
+
+
+def extract_invoice_file(path):
+    """Validate, extract and parse one PDF; runs inside a pool worker"""
+    try:
+        with open(path, 'rb') as pdf_file:
+            document = PDFDocument(pdf_file)
+            errors = validate_pdf_file(pdf_file, document)
+            if errors:
+                return path, None, '; '.join(errors.values())
+            text = extract_pdf_text(pdf_file, document)
+        if not text:
+            return path, None, 'no text could be extracted'
+        return path, parse_invoice_data(text), None
+    except Exception as e:
+        return path, None, f'error processing PDF: {e}'
+
+
+class ChildMatcher:
+    """In-memory version of the child matching strategies in process_uploaded_invoice"""
+
+    def __init__(self, children):
+        self.children = sorted(children, key=lambda child: child.name)
+        self.by_reference = {}
+        for child in self.children:
+            self.by_reference.setdefault(child.reference_number, child)
+
+    def match(self, data):
+        reference = data.get('child_reference')
+        name = data.get('child_name')
+        if not reference and not name:
+            return None
+        # Strategy 1: Exact reference match
+        if reference and reference in self.by_reference:
+            return self.by_reference[reference]
+        # Strategy 2: Partial reference match
+        if reference:
+            for child in self.children:
+                if reference.lower() in child.reference_number.lower():
+                    return child
+        # Strategy 3: Name matching (partial)
+        if name:
+            for child in self.children:
+                if name.lower() in child.name.lower():
+                    return child
+        # Strategy 4: If only one child exists, use it
+        if len(self.children) == 1:
+            return self.children[0]
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Bulk import invoice PDFs from a directory using a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory searched recursively for PDF files')
+        parser.add_argument('--user', required=True, help='Username that owns the imported invoices')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help='Invoices inserted per transaction',
+        )
+        parser.add_argument(
+            '--state-file', default=None,
+            help='File recording imported PDFs for resuming (default: <directory>/.import_invoices_state)',
+        )
+        parser.add_argument(
+            '--copy-files', action='store_true',
+            help='Copy PDFs outside MEDIA_ROOT into media storage and attach them to the invoices',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Extract, parse and match without writing anything; reports throughput',
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory']).resolve()
+        if not directory.is_dir():
+            raise CommandError(f'{directory} is not a directory')
+
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        self.dry_run = options['dry_run']
+        self.copy_files = options['copy_files']
+        self.state_file = Path(options['state_file'] or directory / '.import_invoices_state')
+        self.matcher = ChildMatcher(Child.objects.filter(user=user))
+        if not self.matcher.children:
+            raise CommandError(f"User '{user.username}' has no children to match invoices against")
+
+        # Resume: skip files already recorded by an earlier run
+        done = set()
+        if not self.dry_run and self.state_file.exists():
+            done = set(self.state_file.read_text(encoding='utf-8').splitlines())
+        paths = [
+            str(path) for path in sorted(directory.rglob('*'))
+            if path.suffix.lower() == '.pdf' and path.is_file() and str(path.relative_to(directory)) not in done
+        ]
+        self.directory = directory
+        total = len(paths)
+        self.stdout.write(
+            f'Found {total} PDF(s) to import' + (f' ({len(done)} already imported)' if done else '')
+        )
+        if not total:
+            return
+
+        self.counts = {'created': 0, 'duplicate': 0, 'unmatched': 0, 'invalid': 0, 'failed': 0}
+        chunk_size = max(1, options['chunk_size'])
+        workers = max(1, options['workers'])
+        started = time.perf_counter()
+        processed = 0
+
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_process) as pool:
+            results = pool.map(extract_invoice_file, paths, chunksize=max(1, min(16, chunk_size // workers)))
+            chunk = []
+            for result in results:
+                chunk.append(result)
+                if len(chunk) >= chunk_size:
+                    processed += self.import_chunk(chunk, user)
+                    self.report_progress(processed, total, started)
+                    chunk = []
+            if chunk:
+                processed += self.import_chunk(chunk, user)
+                self.report_progress(processed, total, started)
+
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f'{count} {name}' for name, count in self.counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Dry run' if self.dry_run else 'Import'} complete: {summary} "
+            f"in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f} files/s)"
+        ))
+
+    def report_progress(self, processed, total, started):
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(f'  {processed}/{total} files ({rate:.1f} files/s), {self.counts["created"]} invoices')
+
+    def build_invoice(self, path, data):
+        """Unsaved Invoice for parsed data, or a reason why it cannot be imported"""
+        child = self.matcher.match(data)
+        if child is None:
+            return None, 'unmatched', 'no matching child'
+
+        missing = [field for field in REQUIRED_FIELDS if not data.get(field)]
+        if missing:
+            return None, 'invalid', f"missing {', '.join(missing)}"
+
+        invoice = Invoice(child=child, user_id=child.user_id, **{field: data[field] for field in INVOICE_FIELDS if data.get(field) is not None})
+        invoice.calculate_amounts()
+        if not invoice.amount_due:
+            return None, 'invalid', 'missing amount due'
+        try:
+            invoice.full_clean(exclude=['child', 'pdf_file'], validate_unique=False)
+        except ValidationError as e:
+            return None, 'invalid', '; '.join(e.messages)
+        return invoice, 'created', None
+
+    def attach_pdf(self, invoice, path):
+        """
+        Point the invoice at its PDF, copying it into storage if requested
+
+        Returns:
+            The storage name of the copy, or None if nothing was copied
+        """
+        media_root = Path(settings.MEDIA_ROOT).resolve()
+        pdf_path = Path(path)
+        if media_root in pdf_path.parents:
+            invoice.pdf_file.name = str(pdf_path.relative_to(media_root))
+        elif self.copy_files:
+            with open(pdf_path, 'rb') as pdf_file:
+                invoice.pdf_file.name = default_storage.save(
+                    invoice.pdf_file.field.generate_filename(invoice, pdf_path.name), File(pdf_file)
+                )
+            return invoice.pdf_file.name
+        return None
+
+    def import_chunk(self, chunk, user):
+        """Insert one chunk of parsed files in a single transaction"""
+        candidates = []
+        for path, data, error in chunk:
+            if error:
+                self.counts['failed'] += 1
+                self.stderr.write(f'  {Path(path).name}: {error}')
+                continue
+            invoice, outcome, reason = self.build_invoice(path, data)
+            if invoice is None:
+                self.counts[outcome] += 1
+                self.stderr.write(f'  {Path(path).name}: {reason}')
+                continue
+            candidates.append((path, invoice))
+
+        # One query for invoices that already exist for this chunk's children
+        existing = set(Invoice.objects.filter(
+            child__in={invoice.child_id for _, invoice in candidates},
+            invoice_reference__in={invoice.invoice_reference for _, invoice in candidates},
+        ).values_list('child_id', 'invoice_reference')) if candidates else set()
+
+        new_invoices = []
+        imported_paths = []
+        for path, invoice in candidates:
+            imported_paths.append(path)
+            key = (invoice.child_id, invoice.invoice_reference)
+            if key in existing:
+                self.counts['duplicate'] += 1
+                continue
+            existing.add(key)
+            new_invoices.append((path, invoice))
+        self.counts['created'] += len(new_invoices)
+
+        if not self.dry_run:
+            # Storage is not transactional: copies are made before the chunk's
+            # transaction and removed again if it rolls back
+            copies = [self.attach_pdf(invoice, path) for path, invoice in new_invoices]
+            try:
+                with transaction.atomic():
+                    Invoice.objects.bulk_create([invoice for _, invoice in new_invoices])
+                    # bulk_create sends no post_save signals
+                    mark_dirty((invoice.child_id, invoice.issue_date) for _, invoice in new_invoices)
+            except Exception:
+                for name in filter(None, copies):
+                    default_storage.delete(name)
+                raise
+            if new_invoices:
+                invalidate_user_stats(user.pk)
+            # Recorded only after the chunk committed, so a rerun resumes here;
+            # files that failed or did not match are retried on the next run
+            with open(self.state_file, 'a', encoding='utf-8') as state:
+                for path in imported_paths:
+                    state.write(str(Path(path).relative_to(self.directory)) + '\n')
+
+        return len(chunk)
@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from invoices.jobs import claim_jobs, init_worker_process, requeue_running_jobs, run_invoice_job
+from invoices.models import InvoiceProcessingJob
+
+
+class Command(BaseCommand):
+    help = 'Process queued invoice PDF uploads using a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Jobs claimed per batch (default: twice the worker count)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait before polling an empty queue again',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling',
+        )
+        parser.add_argument(
+            '--requeue-running', action='store_true',
+            help='Requeue jobs left running by a previous worker before starting',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size'] or workers * 2
+
+        if options['requeue_running']:
+            requeued = requeue_running_jobs()
+            self.stdout.write(f'Requeued {requeued} interrupted job(s)')
+
+        # Forked workers must not share the parent's database connection
+        connections.close_all()
+
+        self.stdout.write(f'Processing invoice jobs with {workers} worker process(es)...')
+        processed = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_process) as pool:
+            try:
+                while True:
+                    job_ids = claim_jobs(batch_size)
+                    if not job_ids:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    for job_id, status in zip(job_ids, pool.map(run_invoice_job, job_ids)):
+                        processed += 1
+                        style = self.style.SUCCESS if status == InvoiceProcessingJob.STATUS_COMPLETED else self.style.ERROR
+                        self.stdout.write(style(f'Job {job_id}: {status}'))
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('Interrupted; run with --requeue-running to resume claimed jobs'))
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.stats import invalidate_user_stats
+from invoices.summaries import rebuild_monthly_summaries, verify_monthly_summaries
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Verify or rebuild the MonthlySummary rollup from invoices and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report months whose stored summary is wrong; exits with an error if any are found',
+        )
+        parser.add_argument('--user', help='Only this username (default: every user)')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['user']:
+            users = list(User.objects.filter(username=options['user']))
+            if not users:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        if options['verify']:
+            differences = verify_monthly_summaries(users)
+            for (child_id, month), stored, expected in differences:
+                self.stdout.write(f'- child {child_id} {month:%Y-%m}: stored {stored}, expected {expected}')
+            if differences:
+                raise CommandError(
+                    f'{len(differences)} monthly summary row(s) are wrong; run without --verify to rebuild'
+                )
+            self.stdout.write(self.style.SUCCESS('All monthly summaries match their invoices and payments'))
+            return
+
+        written = rebuild_monthly_summaries(users)
+        # Cached trends were computed from the old rows
+        user_ids = [user.pk for user in users] if users is not None else User.objects.values_list('pk', flat=True)
+        for user_id in user_ids:
+            invalidate_user_stats(user_id)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} monthly summary row(s)'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from invoices.models import Invoice
+from invoices.reconciliation import payments_sum_subquery, recompute_payment_statuses
+
+
+class Command(BaseCommand):
+    help = 'Verify or rebuild the stored Invoice.amount_paid_total values and payment statuses from payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report invoices whose stored total is wrong; exits with an error if any are found',
+        )
+
+    def handle(self, *args, **options):
+        mismatched = Invoice.objects.annotate(actual_paid=payments_sum_subquery()).exclude(
+            amount_paid_total=F('actual_paid')
+        ).select_related('child')
+
+        if options['verify']:
+            count = 0
+            for invoice in mismatched:
+                count += 1
+                self.stdout.write(
+                    f'- {invoice}: stored ${invoice.amount_paid_total}, payments ${invoice.actual_paid}'
+                )
+            if count:
+                raise CommandError(f'{count} invoice(s) have an incorrect paid total; run without --verify to fix')
+            self.stdout.write(self.style.SUCCESS('All invoice paid totals match their payments'))
+            return
+
+        with transaction.atomic():
+            fixed = mismatched.count()
+            recompute_payment_statuses(rebuild_totals=True)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt paid totals; {fixed} invoice(s) were out of date'))
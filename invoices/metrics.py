@@ -0,0 +1,279 @@
+"""
+In-process metrics registry with Prometheus text export
+
+Counters and histograms are updated in memory. Every INVOICE_METRICS_FLUSH_SECONDS
+each process adds its accumulated deltas to a shared SQLite file
+(INVOICE_METRICS_FILE) in one transaction, so the staff-only metrics view
+reports totals across all worker processes. Periodic flushes run on a
+background thread, never on the request being measured, and whatever is left
+is flushed at process exit. With INVOICE_METRICS_FILE set to
+None the view reports the current process only.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS metric_samples ('
+    'name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+    'PRIMARY KEY (name, labels))'
+)
+
+
+def _label_key(labels: Dict[str, str]) -> str:
+    return json.dumps(labels, sort_keys=True, separators=(',', ':'))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in sorted(labels.items())
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    """Base class; samples are (series name, label key) -> value deltas"""
+    type_name = ''
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return {name: str(value) for name, value in labels.items()}
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(f'{self.name}_total', _label_key(self._labels(labels)), amount)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+    type_name = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        updates = [(f'{self.name}_sum', _label_key(labels), value), (f'{self.name}_count', _label_key(labels), 1)]
+        for bound in self.buckets:
+            if value <= bound:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                updates.append((f'{self.name}_bucket', _label_key({**labels, 'le': le}), 1))
+        self.registry.add_many(updates)
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block in seconds"""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """Holds metric definitions and this process's unflushed sample deltas"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._pending: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flushing = False
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, series, label_key, amount):
+        self.add_many([(series, label_key, amount)])
+
+    def add_many(self, updates):
+        with self._lock:
+            for series, label_key, amount in updates:
+                key = (series, label_key)
+                self._pending[key] = self._pending.get(key, 0) + amount
+        if time.monotonic() - self._last_flush >= getattr(settings, 'INVOICE_METRICS_FLUSH_SECONDS', 10):
+            self._flush_in_background()
+
+    def _flush_in_background(self) -> None:
+        """Start a flush on its own thread unless one is already running"""
+        with self._lock:
+            if self._flushing:
+                return
+            self._flushing = True
+            self._last_flush = time.monotonic()
+        threading.Thread(target=self._background_flush, name='metrics-flush', daemon=True).start()
+
+    def _background_flush(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._flushing = False
+
+    def _connect(self, path) -> sqlite3.Connection:
+        directory = os.path.dirname(str(path))
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(_SCHEMA)
+        return connection
+
+    def flush(self) -> None:
+        """Add this process's pending deltas to the shared metrics file"""
+        path = getattr(settings, 'INVOICE_METRICS_FILE', None)
+        if not path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            connection = self._connect(path)
+            try:
+                with connection:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.executemany(
+                        'INSERT INTO metric_samples (name, labels, value) VALUES (?, ?, ?) '
+                        'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                        [(series, label_key, amount) for (series, label_key), amount in pending.items()],
+                    )
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            # Keep the deltas for the next flush rather than losing them
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + amount
+
+    def samples(self) -> Dict[Tuple[str, str], float]:
+        """Current totals: the shared file's, or this process's if there is none"""
+        path = getattr(settings, 'INVOICE_METRICS_FILE', None)
+        if path:
+            self.flush()
+            connection = self._connect(path)
+            try:
+                return {(name, labels): value for name, labels, value in connection.execute(
+                    'SELECT name, labels, value FROM metric_samples'
+                )}
+            finally:
+                connection.close()
+        with self._lock:
+            return dict(self._pending)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._flushing = False
+
+    def reset(self) -> None:
+        """Forget pending deltas and clear the shared file"""
+        with self._lock:
+            self._pending = {}
+        path = getattr(settings, 'INVOICE_METRICS_FILE', None)
+        if path:
+            connection = self._connect(path)
+            try:
+                connection.execute('DELETE FROM metric_samples')
+            finally:
+                connection.close()
+
+    def render(self) -> str:
+        """Prometheus text exposition of every registered metric"""
+        by_series = {}
+        for (series, label_key), value in self.samples().items():
+            by_series.setdefault(series, []).append((json.loads(label_key), value))
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            if metric.type_name == 'counter':
+                suffixes = ('_total',)
+            else:
+                suffixes = ('_bucket', '_sum', '_count')
+            for suffix in suffixes:
+                series = metric.name + suffix
+                samples = by_series.get(series, [])
+                if suffix == '_bucket':
+                    samples.sort(key=lambda sample: (
+                        sorted((k, v) for k, v in sample[0].items() if k != 'le'),
+                        float(sample[0]['le']),
+                    ))
+                else:
+                    samples.sort(key=lambda sample: sorted(sample[0].items()))
+                for labels, value in samples:
+                    lines.append(f'{series}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+if hasattr(os, 'register_at_fork'):
+    # A forked worker must not flush the deltas its parent will flush too
+    os.register_at_fork(after_in_child=registry._after_fork)
+
+# Invoice pipeline metrics
+uploads_processed = registry.counter(
+    'invoice_uploads_processed', 'Uploaded invoice PDFs processed, by outcome', ['outcome'],
+)
+upload_duration = registry.histogram(
+    'invoice_upload_processing_seconds', 'Time spent in process_uploaded_invoice',
+)
+parse_field_missing = registry.counter(
+    'invoice_parse_field_missing', 'Uploads whose text did not yield a field', ['field'],
+)
+extraction_cache_lookups = registry.counter(
+    'invoice_extraction_cache_lookups', 'Extraction cache lookups, by result', ['result'],
+)
+child_matches = registry.counter(
+    'invoice_child_matches', 'Child matching strategy that matched an upload', ['strategy'],
+)
+template_render_duration = registry.histogram(
+    'invoice_template_render_seconds', 'Page template render time', ['template'],
+)
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:08
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_amount_paid_total(apps, schema_editor):
+    """Set amount_paid_total to the current sum of each invoice's payments"""
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Payment = apps.get_model('invoices', 'Payment')
+    paid = Payment.objects.filter(invoice=OuterRef('pk')).values('invoice').annotate(
+        total=Sum('amount_paid')
+    ).values('total')
+    Invoice.objects.update(amount_paid_total=Coalesce(
+        Subquery(paid), Value(Decimal('0.00')), output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_invoiceprocessingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, help_text='Sum of all payments against this invoice', max_digits=10),
+        ),
+        migrations.RunPython(backfill_amount_paid_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Raw indexes from 0003, superseded by the model-level indexes
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS idx_invoice_user_status;",
+            "CREATE INDEX IF NOT EXISTS idx_invoice_user_status ON invoices_invoice (child_id, payment_status);",
+        ),
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS idx_invoice_issue_date;",
+            "CREATE INDEX IF NOT EXISTS idx_invoice_issue_date ON invoices_invoice (issue_date DESC);",
+        ),
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS idx_payment_date;",
+            "CREATE INDEX IF NOT EXISTS idx_payment_date ON invoices_payment (payment_date DESC);",
+        ),
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS idx_child_user;",
+            "CREATE INDEX IF NOT EXISTS idx_child_user ON invoices_child (user_id, name);",
+        ),
+        migrations.AlterField(
+            model_name='child',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='children', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='child',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='invoices.child'),
+        ),
+        migrations.AddIndex(
+            model_name='child',
+            index=models.Index(fields=['user', 'name'], name='idx_child_user_name'),
+        ),
+        migrations.AddIndex(
+            model_name='child',
+            index=models.Index(fields=['daycare_provider', 'user'], name='idx_child_provider_user'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['child', 'payment_status', 'total_amount_due', 'amount_paid_total'], name='idx_invoice_child_totals'),
+        ),
+    ]
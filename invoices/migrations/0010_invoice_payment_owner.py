@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_owner(apps, schema_editor):
+    """Copy each invoice's owner from its child, and each payment's from its invoice"""
+    Child = apps.get_model('invoices', 'Child')
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Payment = apps.get_model('invoices', 'Payment')
+    Invoice.objects.update(user=Subquery(Child.objects.filter(pk=OuterRef('child_id')).values('user_id')[:1]))
+    Payment.objects.update(user=Subquery(Invoice.objects.filter(pk=OuterRef('invoice_id')).values('user_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('invoices', '0009_index_redesign'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owner, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='invoice',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='idx_invoice_issued_keyset',
+        ),
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='idx_invoice_child_totals',
+        ),
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='idx_payment_paid_keyset',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', '-issue_date', '-id'], name='idx_invoice_user_issued'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['user', 'payment_status', 'total_amount_due', 'amount_paid_total'], name='idx_invoice_user_totals'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-payment_date', '-id'], name='idx_payment_user_paid'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_summaries(apps, schema_editor):
+    """Build the monthly summaries of the existing invoices and payments"""
+    Child = apps.get_model('invoices', 'Child')
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Payment = apps.get_model('invoices', 'Payment')
+    MonthlySummary = apps.get_model('invoices', 'MonthlySummary')
+
+    owners = {pk: (user_id, provider_id) for pk, user_id, provider_id in Child.objects.values_list(
+        'pk', 'user_id', 'daycare_provider_id',
+    )}
+    cells = {}
+
+    def cell(child_id, month):
+        if (child_id, month) not in cells:
+            user_id, provider_id = owners[child_id]
+            cells[child_id, month] = MonthlySummary(child_id=child_id, month=month, user_id=user_id,
+                                                    provider_id=provider_id)
+        return cells[child_id, month]
+
+    for row in Invoice.objects.annotate(month=TruncMonth('issue_date')).order_by().values('child_id', 'month').annotate(
+        count=Count('id'), invoiced=Sum('week_amount_due'), discounts=Sum('discount_amount'),
+        outstanding=Sum(F('total_amount_due') - F('amount_paid_total'),
+                        output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+    ):
+        summary = cell(row['child_id'], row['month'])
+        summary.invoice_count = row['count']
+        summary.invoiced_amount = row['invoiced']
+        summary.discount_amount = row['discounts']
+        summary.outstanding_amount = row['outstanding']
+    for row in Payment.objects.annotate(month=TruncMonth('payment_date')).order_by().values(
+        'invoice__child_id', 'month',
+    ).annotate(paid=Sum('amount_paid')):
+        cell(row['invoice__child_id'], row['month']).paid_amount = row['paid']
+    MonthlySummary.objects.bulk_create(cells.values(), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0010_invoice_payment_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('invoiced_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Weekly amounts due, after discounts', max_digits=12)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Still unpaid on the invoices issued in the month', max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('child', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='invoices.child')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='invoices.daycareprovider')),
+                ('user', models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'monthly summaries',
+                'ordering': ['month'],
+                'indexes': [models.Index(fields=['user', 'month'], name='idx_summary_user_month')],
+                'constraints': [models.UniqueConstraint(fields=('child', 'month'), name='uniq_summary_child_month')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from decimal import Decimal
 
 User = get_user_model()
@@ -46,7 +50,8 @@ class DaycareProvider(models.Model):
 
 class Child(models.Model):
     """Child information for invoice tracking"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='children')
+    # Indexed by idx_child_user_name and the unique constraint, both led by user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='children', db_index=False)
     name = models.CharField(max_length=100)
     reference_number = models.CharField(max_length=20)
     date_of_birth = models.DateField(null=True, blank=True)
@@ -61,6 +66,12 @@ class Child(models.Model):
     class Meta:
         ordering = ['name']
         unique_together = ['user', 'reference_number', 'daycare_provider']
+        indexes = [
+            # The child list, and the user's children whenever invoices are scoped by owner
+            models.Index(fields=['user', 'name'], name='idx_child_user_name'),
+            # Providers a user has children at (provider list and detail)
+            models.Index(fields=['daycare_provider', 'user'], name='idx_child_provider_user'),
+        ]
 
 
 class Invoice(models.Model):
@@ -72,7 +83,12 @@ class Invoice(models.Model):
         ('overdue', 'Overdue'),
     ]
     
-    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name='invoices')
+    # Indexed by the composite indexes in Meta, all led by child
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name='invoices', db_index=False)
+    # Owner, copied from child.user on save so user-scoped queries need no join
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='invoices', editable=False, db_index=False,
+    )
     invoice_reference = models.CharField(max_length=50)
     
     # Invoice period
@@ -113,6 +129,15 @@ class Invoice(models.Model):
         help_text="Legacy field - use total_amount_due instead"
     )
     
+    # Running total of payments, maintained by Payment save/delete
+    amount_paid_total = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+        help_text="Sum of all payments against this invoice"
+    )
+    
     # Status and tracking
     payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='unpaid')
     fee_type = models.CharField(max_length=100, blank=True)
@@ -127,6 +152,9 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # child_id and user_id as stored in the database, set by from_db() and save()
+    _loaded = {}
+    
     def __str__(self):
         return f"Invoice {self.invoice_reference} - {self.child.name}"
     
@@ -159,8 +187,8 @@ class Invoice(models.Model):
         if errors:
             raise ValidationError(errors)
     
-    def save(self, *args, **kwargs):
-        """Override save to ensure validation and calculations"""
+    def calculate_amounts(self):
+        """Fill in derived amounts that were not provided"""
         # Auto-calculate week_amount_due if not provided
         if self.original_amount and not self.week_amount_due:
             discount = self.discount_amount or Decimal('0.00')
@@ -174,17 +202,77 @@ class Invoice(models.Model):
         # Keep legacy amount_due field in sync with total_amount_due
         if self.total_amount_due:
             self.amount_due = self.total_amount_due
+    
+    def save(self, *args, **kwargs):
+        """Override save to ensure validation and calculations"""
+        self.calculate_amounts()
+        if self.child_id is not None and (self.user_id is None or self.child_id != self._loaded.get('child_id')):
+            self.user_id = self.child.user_id
         
-        # Full clean validation
-        self.full_clean()
+        # Full clean validation; the owner is copied from the child, not entered
+        self.full_clean(exclude=['user'])
+        
+        # amount_paid_total only changes through adjust_paid_total, so a stale
+        # in-memory value must never overwrite a concurrent increment. The
+        # status is recomputed from the stored total in the same UPDATE, unless
+        # it was set by hand (e.g. 'overdue' in the admin).
+        status_from_total = False
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'amount_paid_total'
+            ]
+            if self.payment_status == self._loaded.get('payment_status'):
+                # The UPDATE's right-hand sides see the old row, so pass the new amount due
+                self.payment_status = self.payment_status_expression(
+                    F('amount_paid_total'), Value(self.total_amount_due, output_field=models.DecimalField()),
+                )
+                status_from_total = True
         super().save(*args, **kwargs)
+        if status_from_total:
+            self.refresh_from_db(fields=['amount_paid_total', 'payment_status'])
+        
+        # Moving the invoice to another owner's child moves its payments too
+        loaded_user_id = self._loaded.get('user_id')
+        if loaded_user_id is not None and loaded_user_id != self.user_id:
+            Payment.objects.filter(invoice=self).update(user_id=self.user_id, updated_at=timezone.now())
+        self._loaded = {
+            'child_id': self.child_id, 'user_id': self.user_id, 'issue_date': self.issue_date,
+            'payment_status': self.payment_status,
+        }
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Child, owner, issue date and status as stored, so changes can be told apart
+        instance._loaded = {
+            name: instance.__dict__.get(name) for name in ('child_id', 'user_id', 'issue_date', 'payment_status')
+        }
+        return instance
+    
+    @staticmethod
+    def payment_status_expression(paid, total_due=F('total_amount_due')):
+        """SQL expression for the status update_payment_status() gives an invoice with paid in payments"""
+        return Case(
+            When(GreaterThanOrEqual(paid, total_due), then=Value('paid')),
+            When(GreaterThan(paid, Decimal('0.00')), then=Value('partial')),
+            default=Value('unpaid'),
+        )
+    
+    @classmethod
+    def adjust_paid_total(cls, invoice_id, delta):
+        """Atomically add delta to an invoice's stored payment total and update its status"""
+        if delta:
+            paid = F('amount_paid_total') + delta
+            cls.objects.filter(pk=invoice_id).update(
+                amount_paid_total=paid, payment_status=cls.payment_status_expression(paid),
+                updated_at=timezone.now(),
+            )
     
     @property
     def total_paid(self):
-        """Calculate total amount paid for this invoice"""
-        return self.payments.aggregate(
-            total=models.Sum('amount_paid')
-        )['total'] or Decimal('0.00')
+        """Total amount paid for this invoice"""
+        return self.amount_paid_total
     
     @property
     def outstanding_balance(self):
@@ -216,6 +304,18 @@ class Invoice(models.Model):
     class Meta:
         ordering = ['-issue_date']
         unique_together = ['child', 'invoice_reference']
+        indexes = [
+            # Keyset pagination of the invoice list, per owner and per child
+            models.Index(fields=['user', '-issue_date', '-id'], name='idx_invoice_user_issued'),
+            models.Index(fields=['child', '-issue_date', '-id'], name='idx_invoice_child_issued'),
+            # Status filter, and covers the per-user totals in stats.py without reading rows
+            models.Index(
+                fields=['user', 'payment_status', 'total_amount_due', 'amount_paid_total'],
+                name='idx_invoice_user_totals',
+            ),
+            # Incremental sync by updated_at watermark (see sync.py)
+            models.Index(fields=['user', 'updated_at', 'id'], name='idx_invoice_user_updated'),
+        ]
 
 
 class Payment(models.Model):
@@ -230,6 +330,10 @@ class Payment(models.Model):
     ]
     
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
+    # Owner, copied from invoice.user on save so user-scoped queries need no join
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='payments', editable=False, db_index=False,
+    )
     payment_date = models.DateField()
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=15, choices=PAYMENT_METHOD_CHOICES)
@@ -246,13 +350,16 @@ class Payment(models.Model):
         if self.amount_paid and self.amount_paid <= 0:
             errors['amount_paid'] = 'Payment amount must be greater than zero.'
         
-        # Validate payment doesn't exceed invoice amount
+        # Validate payment doesn't exceed invoice amount, using the invoice's
+        # total as stored now (the loaded invoice may predate other payments)
+        # less this payment's own stored amount
         if self.invoice and self.amount_paid:
-            existing_payments = Payment.objects.filter(
-                invoice=self.invoice
-            ).exclude(pk=self.pk).aggregate(
-                total=models.Sum('amount_paid')
-            )['total'] or Decimal('0.00')
+            existing_payments = Invoice.objects.filter(pk=self.invoice_id).values_list(
+                'amount_paid_total', flat=True,
+            ).first() or Decimal('0.00')
+            stored = self._stored_values()
+            if stored and stored[0] == self.invoice_id:
+                existing_payments -= stored[1]
             
             total_with_new = existing_payments + self.amount_paid
             if total_with_new > self.invoice.amount_due:
@@ -262,15 +369,159 @@ class Payment(models.Model):
         if errors:
             raise ValidationError(errors)
     
+    def _stored_values(self):
+        """
+        (invoice_id, amount_paid, payment_date, invoice child_id, invoice
+        issue_date, user_id) as stored in the database, or None for a new
+        payment
+        """
+        if not self.pk:
+            return None
+        if '_stored' not in self.__dict__:
+            self._stored = Payment.objects.filter(pk=self.pk).values_list(
+                'invoice_id', 'amount_paid', 'payment_date', 'invoice__child_id', 'invoice__issue_date', 'user_id',
+            ).first()
+        return self._stored
+    
     def save(self, *args, **kwargs):
-        # Validate before saving
-        self.full_clean()
-        super().save(*args, **kwargs)
-        # Update invoice payment status
-        self.invoice.update_payment_status()
+        if self.invoice_id is not None:
+            self.user_id = self.invoice.user_id
+        
+        # Validate before saving; a loaded invoice and the owner copied from it
+        # need no existence queries
+        exclude = ['user']
+        if Payment.invoice.is_cached(self):
+            exclude.append('invoice')
+        self.full_clean(exclude=exclude)
+        
+        previous = self._stored_values()
+        
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Keep the stored invoice totals and statuses in step with this payment
+            if previous and previous[0] != self.invoice_id:
+                Invoice.adjust_paid_total(previous[0], -previous[1])
+                Invoice.adjust_paid_total(self.invoice_id, self.amount_paid)
+            else:
+                Invoice.adjust_paid_total(self.invoice_id, self.amount_paid - (previous[1] if previous else 0))
+        self.__dict__.pop('_stored', None)
+        
+        self.invoice.refresh_from_db(fields=['amount_paid_total', 'payment_status'])
     
     def __str__(self):
         return f"Payment ${self.amount_paid} - {self.invoice.invoice_reference}"
     
     class Meta:
         ordering = ['-payment_date']
+        indexes = [
+            # Keyset pagination of the payment list
+            models.Index(fields=['user', '-payment_date', '-id'], name='idx_payment_user_paid'),
+            # Incremental sync by updated_at watermark (see sync.py)
+            models.Index(fields=['user', 'updated_at', 'id'], name='idx_payment_user_updated'),
+        ]
+
+
+class MonthlySummary(models.Model):
+    """
+    Rollup of one child's invoices and payments for one calendar month
+
+    Maintained incrementally from invoice and payment changes (see
+    summaries.py). The owner and provider are copied from the child, so a
+    row is identified by (user, child, provider, month) but unique per child
+    and month.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='monthly_summaries', editable=False, db_index=False,
+    )
+    # Indexed by the unique constraint in Meta, led by child
+    child = models.ForeignKey(Child, on_delete=models.CASCADE, related_name='monthly_summaries', db_index=False)
+    provider = models.ForeignKey(DaycareProvider, on_delete=models.CASCADE, related_name='monthly_summaries')
+    month = models.DateField(help_text="First day of the month")
+    
+    # Invoices issued in the month
+    invoice_count = models.PositiveIntegerField(default=0)
+    invoiced_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal('0.00'),
+        help_text="Weekly amounts due, after discounts"
+    )
+    discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    outstanding_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal('0.00'),
+        help_text="Still unpaid on the invoices issued in the month"
+    )
+    # Payments dated in the month, whichever month their invoice was issued in
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    
+    def __str__(self):
+        return f"{self.child_id} {self.month:%Y-%m}"
+    
+    class Meta:
+        ordering = ['month']
+        verbose_name_plural = 'monthly summaries'
+        constraints = [
+            models.UniqueConstraint(fields=['child', 'month'], name='uniq_summary_child_month'),
+        ]
+        indexes = [
+            # Trends and yearly statements read a user's months in order
+            models.Index(fields=['user', 'month'], name='idx_summary_user_month'),
+        ]
+
+
+class DataVersion(models.Model):
+    """
+    Counter bumped on every write to a user's invoices, payments or children
+
+    Cached statistics and page ETags are keyed by it (see stats.py). It is
+    kept in the database, not the cache, so a write made by any process
+    (another web worker, import_invoices, process_invoice_jobs) is seen by
+    all of them.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='data_version')
+    version = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.user_id} v{self.version}"
+
+
+class InvoiceProcessingJob(models.Model):
+    """Queued PDF upload processed by the process_invoice_jobs worker"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invoice_jobs')
+    pdf_file = models.FileField(upload_to='invoice_jobs/%Y/%m/', blank=True)
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        help_text="process_uploaded_invoice result once the job has run"
+    )
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Job {self.pk} - {self.original_name} ({self.status})"
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='idx_job_status_created'),
+        ]
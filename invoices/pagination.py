@@ -0,0 +1,186 @@
+"""
+Keyset (cursor) pagination for the invoice and payment lists
+
+OFFSET paging reads and discards every row before the requested page, and
+Django's paginator adds a COUNT over the whole history on every page. Here a
+page instead starts from the sort key of the last row shown, e.g.
+
+    WHERE issue_date < :date OR (issue_date = :date AND id < :id)
+    ORDER BY issue_date DESC, id DESC LIMIT 21
+
+which a composite index on the same columns answers by reading just the page,
+so deep pages cost the same as the first. Positions are passed as opaque
+?cursor= tokens. The total count is optional and cached per user data version
+(see stats.cached_stats), so it is only recounted after the user's data changes.
+"""
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+from .stats import cached_stats
+
+CURSOR_PARAM = 'cursor'
+
+
+def encode_cursor(values: Sequence, direction: str = 'next') -> str:
+    """Opaque URL-safe token for a position in a keyset ordering"""
+    payload = json.dumps({'d': direction, 'k': [str(value) for value in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str):
+    """
+    Decode a cursor token
+
+    Returns:
+        (direction, [raw key values])
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction, values = payload['d'], payload['k']
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f'Invalid cursor: {e}') from e
+    if direction not in ('next', 'previous') or not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return direction, values
+
+
+def keyset_filter(fields: Sequence[str], values: Sequence, after: bool = True) -> Q:
+    """
+    Rows strictly after (or before) a position in the ordering given by fields
+
+    Args:
+        fields: Ordering, e.g. ('-issue_date', '-id')
+        values: Key values of the position, one per field
+        after: True for rows that follow the position, False for rows that precede it
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(fields, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        lookup = 'lt' if descending == after else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class KeysetPage:
+    """One page of a keyset-paginated list, with cursors for its neighbours"""
+
+    def __init__(self, object_list, fields, has_next, has_previous, query, total_count=None):
+        self.object_list = object_list
+        self.fields = fields
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.total_count = total_count
+        self._query = query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _key(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.fields]
+
+    def _querystring(self, direction, obj):
+        query = self._query.copy()
+        query[CURSOR_PARAM] = encode_cursor(self._key(obj), direction)
+        query.pop('page', None)
+        return query.urlencode()
+
+    @property
+    def next_querystring(self) -> Optional[str]:
+        """Query string for the following page, keeping the current filters"""
+        if not self.has_next:
+            return None
+        return self._querystring('next', self.object_list[-1])
+
+    @property
+    def previous_querystring(self) -> Optional[str]:
+        """Query string for the preceding page, keeping the current filters"""
+        if not self.has_previous or not self.object_list:
+            return None
+        return self._querystring('previous', self.object_list[0])
+
+    @property
+    def first_querystring(self) -> str:
+        """Query string for the first page, keeping the current filters"""
+        query = self._query.copy()
+        query.pop(CURSOR_PARAM, None)
+        query.pop('page', None)
+        return query.urlencode()
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin replacing OFFSET pagination with keyset pagination
+
+    Set keyset_fields to the list ordering, ending in a unique field such as
+    '-id', and back it with a composite index on the same columns. Set
+    count_cache_name to show a total count cached per user data version, or
+    leave it None to skip counting.
+    """
+    keyset_fields: Sequence[str] = ('-id',)
+    count_cache_name: Optional[str] = None
+
+    def paginate_queryset(self, queryset, page_size):
+        fields = tuple(self.keyset_fields)
+        queryset = queryset.order_by(*fields)
+        direction, position = 'next', None
+
+        token = self.request.GET.get(CURSOR_PARAM)
+        if token:
+            try:
+                direction, raw_values = decode_cursor(token)
+                if len(raw_values) != len(fields):
+                    raise ValueError('Cursor does not match the list ordering')
+                position = [
+                    queryset.model._meta.get_field(field.lstrip('-')).to_python(value)
+                    for field, value in zip(fields, raw_values)
+                ]
+            except (ValueError, ValidationError):
+                raise Http404('Invalid page cursor.')
+
+        if position is None:
+            rows = list(queryset[:page_size + 1])
+            has_previous = False
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+        elif direction == 'next':
+            rows = list(queryset.filter(keyset_filter(fields, position, after=True))[:page_size + 1])
+            has_previous = True
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+        else:
+            # Walk backwards in reversed order, then restore the display order
+            reversed_fields = [field[1:] if field.startswith('-') else f'-{field}' for field in fields]
+            rows = list(
+                queryset.filter(keyset_filter(fields, position, after=False)).order_by(*reversed_fields)[:page_size + 1]
+            )
+            has_next = True
+            has_previous = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+
+        page = KeysetPage(rows, fields, has_next, has_previous, self.request.GET, self.get_total_count(queryset))
+        return None, page, rows, has_next or has_previous
+
+    def get_total_count(self, queryset) -> Optional[int]:
+        """Total rows in the filtered list, cached until the user's data changes"""
+        if not self.count_cache_name:
+            return None
+        filters = self.request.GET.copy()
+        filters.pop(CURSOR_PARAM, None)
+        filters.pop('page', None)
+        name = f'{self.count_cache_name}:{filters.urlencode()}'
+        return cached_stats(name, self.request.user, lambda user: {'count': queryset.count()})['count']
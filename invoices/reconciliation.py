@@ -0,0 +1,132 @@
+"""
+Batch payment recording and bulk payment status recomputation
+
+Payment.save() validates, inserts and updates its invoice one payment at a
+time. record_payments() applies a whole batch in one transaction instead:
+one query loads the invoices, the checks clean() would make run in memory
+against their stored totals, the payments are inserted with bulk_create, and
+one UPDATE recomputes every affected invoice's total and status.
+
+recompute_payment_statuses() is the same UPDATE on its own, for repairing or
+reconciling any set of invoices.
+"""
+from decimal import Decimal
+from typing import Iterable, List, Optional
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Invoice, Payment
+from .stats import invalidate_user_stats
+from .summaries import mark_dirty
+
+
+def payments_sum_subquery():
+    """Sum of an invoice's payments as a subquery expression, zero when none"""
+    paid = Payment.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice').annotate(
+        total=Sum('amount_paid')
+    ).values('total')
+    return Coalesce(
+        Subquery(paid), Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def recompute_payment_statuses(invoices=None, rebuild_totals: bool = False) -> int:
+    """
+    Recompute payment statuses in one UPDATE
+
+    Args:
+        invoices: Invoice queryset or ids to update; None for every invoice
+        rebuild_totals: Also recompute amount_paid_total from the payments
+            rather than trusting the stored totals
+
+    Returns:
+        Number of invoices updated
+    """
+    if invoices is None:
+        queryset = Invoice.objects.all()
+    elif isinstance(invoices, models.QuerySet):
+        queryset = invoices
+    else:
+        queryset = Invoice.objects.filter(pk__in=list(invoices))
+
+    paid = payments_sum_subquery() if rebuild_totals else F('amount_paid_total')
+    updates = {'payment_status': Invoice.payment_status_expression(paid), 'updated_at': timezone.now()}
+    if rebuild_totals:
+        updates['amount_paid_total'] = paid
+
+    with transaction.atomic():
+        affected = list(queryset.order_by().values_list('user_id', 'child_id', 'issue_date'))
+        updated = queryset.order_by().update(**updates)
+        # update() sends no signals
+        mark_dirty((child_id, issue_date) for _, child_id, issue_date in affected)
+    for user_id in {user_id for user_id, _, _ in affected}:
+        invalidate_user_stats(user_id)
+    return updated
+
+
+def record_payments(payments: Iterable[Payment], user=None) -> List[Payment]:
+    """
+    Validate and insert many payments in one transaction
+
+    Either every payment is recorded or, if any is invalid, none is.
+
+    Args:
+        payments: Unsaved Payment instances with invoice_id set
+        user: If given, every payment's invoice must belong to this user
+
+    Returns:
+        The created payments
+
+    Raises:
+        ValidationError: Keyed 'payment <index>' for each invalid payment
+    """
+    payments = list(payments)
+    if not payments:
+        return []
+
+    errors = {}
+    with transaction.atomic():
+        invoices = Invoice.objects.select_for_update().in_bulk({payment.invoice_id for payment in payments})
+        running_totals = {pk: invoice.amount_paid_total for pk, invoice in invoices.items()}
+
+        for index, payment in enumerate(payments):
+            key = f'payment {index}'
+            invoice: Optional[Invoice] = invoices.get(payment.invoice_id)
+            if invoice is None or (user is not None and invoice.user_id != user.pk):
+                errors[key] = ['Invoice not found.']
+                continue
+            payment.invoice = invoice
+            payment.user_id = invoice.user_id
+            try:
+                payment.clean_fields(exclude=['invoice', 'user'])
+            except ValidationError as e:
+                errors[key] = e.messages
+                continue
+            if payment.amount_paid <= 0:
+                errors[key] = ['Payment amount must be greater than zero.']
+                continue
+            # Same rule as Payment.clean, applied to the payments in this batch too
+            running_totals[invoice.pk] += payment.amount_paid
+            if running_totals[invoice.pk] > invoice.amount_due:
+                overpayment = running_totals[invoice.pk] - invoice.amount_due
+                errors[key] = [f'Payment would result in overpayment of ${overpayment:.2f}.']
+
+        if errors:
+            raise ValidationError(errors)
+
+        created = Payment.objects.bulk_create(payments)
+        recompute_payment_statuses(invoices.keys(), rebuild_totals=True)
+        mark_dirty((payment.invoice.child_id, payment.payment_date) for payment in created)
+
+    # Bring the invoices attached to the payments up to date in one query
+    for pk, paid, status in Invoice.objects.filter(pk__in=invoices.keys()).values_list(
+        'pk', 'amount_paid_total', 'payment_status',
+    ):
+        invoices[pk].amount_paid_total = paid
+        invoices[pk].payment_status = status
+    return created
@@ -0,0 +1,93 @@
+"""
+Signal handlers keeping denormalized invoice data, monthly summaries and
+cached statistics in step with invoices, payments and children
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Child, DaycareProvider, Invoice, MonthlySummary, Payment
+from .stats import invalidate_user_stats
+from .summaries import mark_dirty
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, origin=None, **kwargs):
+    """Remove a deleted payment from its invoice's stored total and status"""
+    # A payment deleted by a cascade from anything else (an invoice, child or
+    # user) goes away with its invoice, which needs no update
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is None or origin_model is Payment:
+        Invoice.adjust_paid_total(instance.invoice_id, -instance.amount_paid)
+
+
+@receiver(pre_save, sender=Child)
+def child_saving(sender, instance, raw=False, **kwargs):
+    """Remember the stored owner and provider so a change can be copied to the child's rows"""
+    if instance.pk and not raw:
+        instance._previous = Child.objects.filter(pk=instance.pk).values_list(
+            'user_id', 'daycare_provider_id',
+        ).first()
+
+
+@receiver(post_save, sender=Child)
+@receiver(post_delete, sender=Child)
+def child_changed(sender, instance, **kwargs):
+    previous_user_id, previous_provider_id = getattr(instance, '_previous', None) or (None, None)
+    if previous_user_id is not None and previous_user_id != instance.user_id:
+        now = timezone.now()
+        Invoice.objects.filter(child=instance).update(user_id=instance.user_id, updated_at=now)
+        Payment.objects.filter(invoice__child=instance).update(user_id=instance.user_id, updated_at=now)
+        invalidate_user_stats(previous_user_id)
+    if (previous_user_id, previous_provider_id) not in ((None, None), (instance.user_id, instance.daycare_provider_id)):
+        MonthlySummary.objects.filter(child=instance).update(
+            user_id=instance.user_id, provider_id=instance.daycare_provider_id,
+        )
+    instance._previous = None
+    invalidate_user_stats(instance.user_id)
+
+
+@receiver(post_save, sender=DaycareProvider)
+def provider_changed(sender, instance, created=False, raw=False, **kwargs):
+    """Provider names are shown on the pages and reports of every user with a child there"""
+    if created or raw:
+        return
+    for user_id in set(instance.children.values_list('user_id', flat=True)):
+        invalidate_user_stats(user_id)
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def invoice_changed(sender, instance, **kwargs):
+    loaded = instance._loaded
+    cells = [(instance.child_id, instance.issue_date), (loaded.get('child_id'), loaded.get('issue_date'))]
+    if loaded.get('child_id') not in (None, instance.child_id):
+        # The invoice's payments move to the new child's months too
+        for payment_date in instance.payments.values_list('payment_date', flat=True):
+            cells += [(instance.child_id, payment_date), (loaded['child_id'], payment_date)]
+    mark_dirty(cells)
+    invalidate_user_stats(instance.user_id)
+    if loaded.get('user_id') not in (None, instance.user_id):
+        # Moved to another owner's child: the previous owner's data changed too
+        invalidate_user_stats(loaded['user_id'])
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def payment_changed(sender, instance, **kwargs):
+    if Payment.invoice.is_cached(instance):
+        invoice = (instance.invoice.child_id, instance.invoice.issue_date)
+    else:
+        invoice = Invoice.objects.filter(pk=instance.invoice_id).values_list('child_id', 'issue_date').first()
+    cells = []
+    if invoice:
+        cells += [(invoice[0], instance.payment_date), invoice]
+    # As stored before this save, if it was an update (see Payment._stored_values)
+    stored = instance.__dict__.get('_stored')
+    if stored:
+        cells += [(stored[3], stored[2]), (stored[3], stored[4])]
+    mark_dirty(cells)
+    invalidate_user_stats(instance.user_id)
+    if stored and stored[5] != instance.user_id:
+        invalidate_user_stats(stored[5])
@@ -0,0 +1,107 @@
+"""
+Invoice and payment statistics for the dashboard and AJAX endpoints
+
+Totals are aggregated in the database from the stored Invoice.amount_paid_total,
+so no query joins invoices to their payments and an invoice is never counted
+once per payment.
+
+Results are cached per user under a versioned key. The version is a
+DataVersion row in the database, bumped in the same transaction as every
+save or delete of an Invoice, Payment or Child and every provider edit (see
+signals.py). Every process reads the same version, so a write made by any
+of them (web workers, import_invoices, process_invoice_jobs) makes the
+cached summaries stale everywhere, even when each process has its own
+in-memory cache. An unchanged account costs one primary key lookup and no
+aggregate queries. The same version drives the ETags of the dashboard and
+list pages (see conditional.py).
+"""
+import time
+from decimal import Decimal
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Q, Sum
+
+from .models import Child, DataVersion, Invoice, Payment
+
+AMOUNT_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+OUTSTANDING = Sum(F('total_amount_due') - F('amount_paid_total'), output_field=AMOUNT_FIELD)
+
+
+def _start_version(user_id) -> None:
+    # A clock-based start never reuses a version from a deleted row, so cache
+    # entries written under an old version are never served again
+    DataVersion.objects.bulk_create([DataVersion(user_id=user_id, version=time.time_ns())], ignore_conflicts=True)
+
+
+def get_stats_version(user_id) -> int:
+    """Current data version for a user, starting a new one if none is stored"""
+    versions = DataVersion.objects.filter(user_id=user_id).values_list('version', flat=True)
+    version = versions.first()
+    if version is None:
+        _start_version(user_id)
+        version = versions.first()
+    return version
+
+
+def invalidate_user_stats(user_id) -> None:
+    """
+    Make every cached summary for a user stale
+
+    Called inside the writing transaction: readers keep the old version
+    until it commits, and see the new one from then on. A user without a
+    version has nothing cached under one yet (or is being deleted), and gets
+    a fresh, later version on the next read.
+    """
+    DataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
+
+
+def cached_stats(name: str, user, compute: Callable[[object], Dict]) -> Dict:
+    """Return compute(user) from the cache, computing and storing it on a miss"""
+    key = f'invoice_stats:{name}:{user.pk}:{get_stats_version(user.pk)}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute(user)
+        cache.set(key, stats, getattr(settings, 'INVOICE_STATS_CACHE_TIMEOUT', 300))
+    return stats
+
+
+def quick_stats(user) -> Dict:
+    """Invoice counts and total outstanding for a user in one query"""
+    stats = Invoice.objects.filter(user=user).aggregate(
+        total_invoices=Count('id'),
+        unpaid_count=Count('id', filter=Q(payment_status='unpaid')),
+        partial_count=Count('id', filter=Q(payment_status='partial')),
+        total_outstanding=OUTSTANDING,
+    )
+    stats['total_outstanding'] = stats['total_outstanding'] or Decimal('0.00')
+    return stats
+
+
+def dashboard_stats(user) -> Dict:
+    """
+    Summary statistics for the dashboard in three single-table queries
+
+    Args:
+        user: User whose invoices, payments and children are summarised
+
+    Returns:
+        Dictionary of counts and Decimal totals used by the dashboard template
+    """
+    stats = Invoice.objects.filter(user=user).aggregate(
+        total_invoices=Count('id'),
+        total_amount_due=Sum('total_amount_due'),
+        total_paid=Sum('amount_paid_total'),
+        unpaid_invoices=Count('id', filter=Q(payment_status='unpaid')),
+        overdue_invoices=Count('id', filter=Q(payment_status='overdue')),
+    )
+    stats['total_children'] = Child.objects.filter(user=user).count()
+    stats['total_payments'] = Payment.objects.filter(user=user).count()
+
+    # Handle None values from Sum()
+    stats['total_amount_due'] = stats['total_amount_due'] or Decimal('0.00')
+    stats['total_paid'] = stats['total_paid'] or Decimal('0.00')
+    stats['outstanding_balance'] = stats['total_amount_due'] - stats['total_paid']
+    return stats
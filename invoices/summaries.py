@@ -0,0 +1,220 @@
+"""
+Incrementally maintained monthly rollups (MonthlySummary)
+
+Every invoice or payment change marks the (child, month) cells it affects as
+dirty: the invoice's issue month, and for payments also the payment month.
+The dirty cells are recomputed from their invoices and payments when the
+transaction commits, so a batch of changes in one transaction costs two
+grouped queries and one upsert, not a recount per row. Recomputing a cell
+from its rows (rather than adding deltas) keeps it correct however many
+changes touched it, and even if an earlier transaction rolled back.
+
+Reports read the rollup instead of the raw rows: a year of history is at most
+twelve rows per child. rebuild_monthly_summaries() and
+verify_monthly_summaries() back the rebuild_monthly_summaries command.
+"""
+import threading
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Child, Invoice, MonthlySummary, Payment
+from .stats import invalidate_user_stats
+
+Cell = Tuple[int, date]
+
+AMOUNT_FIELDS = ('invoiced_amount', 'discount_amount', 'outstanding_amount', 'paid_amount')
+
+_pending = threading.local()
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def mark_dirty(cells: Iterable[Tuple[Optional[int], Optional[date]]]) -> None:
+    """
+    Queue (child_id, day) cells for recomputation when the transaction commits
+
+    Cells with a missing child or date are ignored; days are reduced to
+    their month.
+    """
+    cells = {(child_id, month_start(day)) for child_id, day in cells if child_id and day}
+    if cells:
+        if getattr(_pending, 'cells', None) is None:
+            _pending.cells = set()
+        _pending.cells |= cells
+        # Registered every time: callbacks of a rolled-back transaction are
+        # dropped, and flushing an already drained queue does nothing
+        transaction.on_commit(flush_dirty)
+
+
+def flush_dirty() -> None:
+    """Recompute every queued cell"""
+    cells = getattr(_pending, 'cells', None)
+    if cells:
+        _pending.cells = set()
+        refresh_cells(cells)
+
+
+def compute_cells(invoices, payments) -> Dict[Cell, Dict]:
+    """
+    Rollup values per (child_id, month) from invoice and payment querysets
+
+    Returns:
+        {(child_id, month): {'invoice_count': ..., 'invoiced_amount': ..., ...}}
+    """
+    cells = defaultdict(lambda: {'invoice_count': 0, **{name: Decimal('0.00') for name in AMOUNT_FIELDS}})
+    invoice_rows = invoices.annotate(month=TruncMonth('issue_date')).order_by().values('child_id', 'month').annotate(
+        invoice_count=Count('id'),
+        invoiced_amount=Sum('week_amount_due'),
+        discount_amount=Sum('discount_amount'),
+        outstanding_amount=Sum(
+            F('total_amount_due') - F('amount_paid_total'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+    for row in invoice_rows:
+        cells[row.pop('child_id'), row.pop('month')].update(row)
+    payment_rows = payments.annotate(month=TruncMonth('payment_date')).order_by().values(
+        'invoice__child_id', 'month',
+    ).annotate(paid_amount=Sum('amount_paid'))
+    for row in payment_rows:
+        cells[row['invoice__child_id'], row['month']]['paid_amount'] = row['paid_amount']
+    return cells
+
+
+def _write(cells: Dict[Cell, Dict], owners: Dict[int, Tuple[int, int]]) -> None:
+    """Upsert the given cells, attaching each child's owner and provider"""
+    rows = [
+        MonthlySummary(child_id=child_id, month=month, user_id=owners[child_id][0],
+                       provider_id=owners[child_id][1], **values)
+        for (child_id, month), values in cells.items()
+        if child_id in owners
+    ]
+    MonthlySummary.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['child', 'month'],
+        update_fields=['user', 'provider', 'invoice_count', *AMOUNT_FIELDS],
+    )
+
+
+def _owners(child_ids) -> Dict[int, Tuple[int, int]]:
+    return {
+        child_id: (user_id, provider_id)
+        for child_id, user_id, provider_id in Child.objects.filter(pk__in=child_ids).values_list(
+            'id', 'user_id', 'daycare_provider_id',
+        )
+    }
+
+
+def refresh_cells(cells: Iterable[Cell]) -> None:
+    """Recompute the given (child_id, month) cells, deleting those left empty"""
+    cells = set(cells)
+    if not cells:
+        return
+    child_ids = {child_id for child_id, _ in cells}
+    months = sorted(month for _, month in cells)
+    first, last = months[0], months[-1]
+    after_last = date(last.year + last.month // 12, last.month % 12 + 1, 1)
+
+    computed = compute_cells(
+        Invoice.objects.filter(child_id__in=child_ids, issue_date__gte=first, issue_date__lt=after_last),
+        Payment.objects.filter(invoice__child_id__in=child_ids, payment_date__gte=first,
+                               payment_date__lt=after_last),
+    )
+    owners = _owners(child_ids)
+    with transaction.atomic():
+        _write({cell: computed[cell] for cell in cells if cell in computed}, owners)
+        empty = [cell for cell in cells if cell not in computed]
+        if empty:
+            condition = Q()
+            for child_id, month in empty:
+                condition |= Q(child_id=child_id, month=month)
+            MonthlySummary.objects.filter(condition).delete()
+        # The writes that dirtied these cells committed before this refresh;
+        # a trend cached in between would otherwise outlive it
+        for user_id in {user_id for user_id, _ in owners.values()}:
+            invalidate_user_stats(user_id)
+
+
+def rebuild_monthly_summaries(users=None) -> int:
+    """
+    Replace the rollup rows of the given users (all users if None) with
+    freshly computed ones
+
+    Returns:
+        Number of rows written
+    """
+    invoices, payments, summaries = Invoice.objects.all(), Payment.objects.all(), MonthlySummary.objects.all()
+    if users is not None:
+        invoices, payments, summaries = (
+            queryset.filter(user__in=users) for queryset in (invoices, payments, summaries)
+        )
+    computed = compute_cells(invoices, payments)
+    with transaction.atomic():
+        summaries.delete()
+        _write(computed, _owners({child_id for child_id, _ in computed}))
+    return len(computed)
+
+
+def verify_monthly_summaries(users=None) -> List[Tuple[Cell, Optional[Dict], Optional[Dict]]]:
+    """
+    Compare the stored rollup with one computed from the raw rows
+
+    Returns:
+        (cell, stored values, expected values) for every cell that differs,
+        with None for a missing row on either side
+    """
+    invoices, payments, summaries = Invoice.objects.all(), Payment.objects.all(), MonthlySummary.objects.all()
+    if users is not None:
+        invoices, payments, summaries = (
+            queryset.filter(user__in=users) for queryset in (invoices, payments, summaries)
+        )
+    expected = compute_cells(invoices, payments)
+    stored = {
+        (row.pop('child_id'), row.pop('month')): row
+        for row in summaries.values('child_id', 'month', 'invoice_count', *AMOUNT_FIELDS)
+    }
+    return [
+        (cell, stored.get(cell), expected.get(cell))
+        for cell in sorted(stored.keys() | expected.keys())
+        if stored.get(cell) != expected.get(cell)
+    ]
+
+
+def monthly_trend(user, months: int = 12) -> List[Dict]:
+    """
+    Totals per month for a user's most recent months, oldest first
+
+    Reads at most months * children rollup rows.
+    """
+    latest = MonthlySummary.objects.filter(user=user).order_by('-month').values_list('month', flat=True).first()
+    if latest is None:
+        return []
+    total_months = latest.year * 12 + latest.month - 1 - (months - 1)
+    since = date(total_months // 12, total_months % 12 + 1, 1)
+    return list(
+        MonthlySummary.objects.filter(user=user, month__gte=since).order_by('month').values('month').annotate(
+            invoice_count=Sum('invoice_count'),
+            **{name: Sum(name) for name in AMOUNT_FIELDS},
+        )
+    )
+
+
+def yearly_statement(user, year: int) -> List[Dict]:
+    """Totals per child and provider for one calendar year, e.g. for a tax statement"""
+    return list(
+        MonthlySummary.objects.filter(
+            user=user, month__gte=date(year, 1, 1), month__lt=date(year + 1, 1, 1),
+        ).order_by('child__name', 'child_id').values(
+            'child_id', 'child__name', 'provider__name',
+        ).annotate(
+            invoice_count=Sum('invoice_count'),
+            **{name: Sum(name) for name in AMOUNT_FIELDS},
+        )
+    )
@@ -0,0 +1,165 @@
+"""
+Incremental JSON Lines sync of a user's invoices and payments
+
+A sync request streams the rows changed since a watermark, one JSON object
+per line, oldest change first:
+
+    GET /api/sync/invoices/?since=<token>
+
+    {"type": "invoice", "id": 7, "updated_at": "...", ...}
+    ...
+    {"type": "watermark", "since": "<token>", "total": 520, "checksum": 135460, "more": false}
+
+Rows are ordered by (updated_at, id), so the watermark is the position of
+the last row sent and the next sync continues strictly after it, like a
+keyset page (see pagination.py). ?limit= caps the rows per response, with
+"more" set when the limit was reached.
+
+updated_at is stamped when a row is saved, not when its transaction
+commits, so a row can become visible after rows stamped later than it. Rows
+changed within SYNC_OVERLAP of the request are therefore sent but not
+passed by the watermark: the next sync reads them again, along with any row
+that committed late among them. Clients must upsert rows by id, and will
+receive some rows they already have.
+
+The final line also carries the user's row count and the sum of their row
+ids. Ids are never reused, so after applying a sync a client whose own
+count or id sum differs has missed a deletion (a delete and an insert
+leave the count unchanged, but not the sum) and should resync from
+scratch.
+
+Every response has an ETag derived from the user's row count, id sum,
+latest change and the requested position, all read in one aggregate over
+the (user, updated_at, id) index. A client repeating a sync with
+If-None-Match gets 304 Not Modified, and no rows are read, when nothing has
+changed.
+
+Bulk updates of these models must set updated_at (Django's auto_now only
+applies to save()), or the rows they change are not synced.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from typing import Iterator, Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+
+from .pagination import decode_cursor, encode_cursor, keyset_filter
+
+SYNC_ORDERING = ('updated_at', 'id')
+CHUNK_SIZE = 2000
+
+# Longer than any transaction writing these models takes to commit
+SYNC_OVERLAP = timedelta(minutes=1)
+
+INVOICE_FIELDS = (
+    'id', 'child_id', 'invoice_reference', 'period_start', 'period_end', 'issue_date', 'due_date',
+    'original_amount', 'discount_percentage', 'discount_amount', 'previous_balance', 'week_amount_due',
+    'total_amount_due', 'amount_paid_total', 'payment_status', 'fee_type', 'created_at', 'updated_at',
+)
+
+PAYMENT_FIELDS = (
+    'id', 'invoice_id', 'payment_date', 'amount_paid', 'payment_method', 'reference_number', 'notes',
+    'created_at', 'updated_at',
+)
+
+# Line type -> fields included in each line
+SYNC_FIELDS = {'invoice': INVOICE_FIELDS, 'payment': PAYMENT_FIELDS}
+
+
+def _etag(kind: str, state: dict, token: str, limit: Optional[int]) -> str:
+    latest = state['latest'].isoformat() if state['latest'] else ''
+    key = f"{kind}:{state['total']}:{state['checksum']}:{latest}:{state['last_id']}:{token}:{limit}"
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+def _lines(kind: str, queryset, fields: Sequence[str], token: str, state: dict,
+           limit: Optional[int]) -> Iterator[bytes]:
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    recent = timezone.now() - SYNC_OVERLAP
+    settled = queryset.filter(updated_at__lt=recent)
+    if limit is not None:
+        settled = settled[:limit]
+    chunk, count, last = [], 0, None
+    for row in settled.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        record = dict(zip(fields, row))
+        chunk.append(encoder.encode({'type': kind, **record}))
+        count += 1
+        last = record
+        if len(chunk) >= CHUNK_SIZE:
+            yield ('\n'.join(chunk) + '\n').encode()
+            chunk = []
+    if last is not None:
+        token = encode_cursor([last[field] for field in SYNC_ORDERING])
+    more = limit is not None and count == limit
+    if not more:
+        # Rows changed within SYNC_OVERLAP, sent whatever the limit since the
+        # watermark does not move past them
+        for row in queryset.filter(updated_at__gte=recent).values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(encoder.encode({'type': kind, **dict(zip(fields, row))}))
+            if len(chunk) >= CHUNK_SIZE:
+                yield ('\n'.join(chunk) + '\n').encode()
+                chunk = []
+    chunk.append(json.dumps({
+        'type': 'watermark', 'since': token, 'total': state['total'], 'checksum': state['checksum'] or 0,
+        'more': more,
+    }))
+    yield ('\n'.join(chunk) + '\n').encode()
+
+
+def sync_response(request, queryset, kind: str):
+    """
+    Stream the rows of queryset changed since the request's ?since= token
+
+    Args:
+        request: GET request with optional since and limit parameters
+        queryset: The user's rows of one model
+        kind: Value of each line's "type", a key of SYNC_FIELDS
+
+    Returns:
+        StreamingHttpResponse of JSON Lines, 304 if the If-None-Match ETag
+        still matches, or 400 for a bad token or limit
+    """
+    token = request.GET.get('since', '')
+    position = None
+    try:
+        if token:
+            _, raw_values = decode_cursor(token)
+            if len(raw_values) != len(SYNC_ORDERING):
+                raise ValueError('Token does not match the sync ordering')
+            position = [
+                queryset.model._meta.get_field(field).to_python(value)
+                for field, value in zip(SYNC_ORDERING, raw_values)
+            ]
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be positive')
+    except (ValueError, ValidationError) as e:
+        return HttpResponseBadRequest(f'Invalid sync parameters: {e}')
+
+    state = queryset.order_by().aggregate(
+        total=Count('id'), checksum=Sum('id'), latest=Max('updated_at'), last_id=Max('id'),
+    )
+    etag = _etag(kind, state, token, limit)
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    changed = queryset.order_by(*SYNC_ORDERING)
+    if position is not None:
+        changed = changed.filter(keyset_filter(SYNC_ORDERING, position, after=True))
+
+    response = StreamingHttpResponse(
+        _lines(kind, changed, SYNC_FIELDS[kind], token, state, limit),
+        content_type='application/x-ndjson; charset=utf-8',
+    )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
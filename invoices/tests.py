@@ -1,3 +1,1328 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from array import array
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.corpus import load_sofia_text, make_pdf, synthetic_simple, synthetic_statement
+from benchmarks.legacy_parser import legacy_parse_invoice_data
+
+from . import metrics, views
+from . import jobs, utils
+from .analytics import group_sums, spend_report
+from .cache_backends import SQLiteCache
+from .extraction_cache import FileSystemBackend
+from .log_pipeline import QueueFileHandler
+from .logging_config import check_rate_limit
+from .models import Child, DaycareProvider, Invoice, InvoiceProcessingJob, MonthlySummary, Payment
+from .reconciliation import recompute_payment_statuses, record_payments
+from .summaries import monthly_trend, verify_monthly_summaries, yearly_statement
+from .stats import get_stats_version, quick_stats
+from .tracing import disable_tracing, enable_tracing, trace, tracing_enabled
+from .utils import parse_invoice_data, process_uploaded_invoice
+
+User = get_user_model()
+
+
+class InvoiceQuickStatsTests(TestCase):
+    """invoice_quick_stats aggregates in the database at a fixed query count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='parent', password='password')
+        provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        cls.child = Child.objects.create(
+            user=cls.user, name='Sofia Green', reference_number='SG123', daycare_provider=provider
+        )
+
+    def create_invoices(self, count, start=0):
+        for number in range(start, start + count):
+            invoice = Invoice.objects.create(
+                child=self.child,
+                invoice_reference=f'INV{number}',
+                period_start=date(2025, 8, 4),
+                period_end=date(2025, 8, 8),
+                issue_date=date(2025, 8, 4),
+                original_amount=Decimal('100.00'),
+                total_amount_due=Decimal('100.00'),
+            )
+            # Every other invoice is part paid
+            if number % 2:
+                Payment.objects.create(
+                    invoice=invoice,
+                    payment_date=date(2025, 8, 5),
+                    amount_paid=Decimal('40.00'),
+                    payment_method='cash',
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_stats(self):
+        response = self.client.get(reverse('invoices:invoice_quick_stats'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_totals(self):
+        self.create_invoices(4)
+        self.client.force_login(self.user)
+        stats = self.get_stats()
+        self.assertEqual(stats['total_invoices'], 4)
+        self.assertEqual(stats['unpaid_count'], 2)
+        self.assertEqual(stats['partial_count'], 2)
+        self.assertEqual(Decimal(stats['total_outstanding']), Decimal('320.00'))
+
+    def test_query_count_independent_of_invoice_volume(self):
+        self.client.force_login(self.user)
+        self.create_invoices(2)
+        get_stats_version(self.user.pk)
+        with self.assertNumQueries(4) as context:
+            self.get_stats()
+        few_queries = len(context.captured_queries)
+
+        self.create_invoices(20, start=2)
+        with self.assertNumQueries(few_queries):
+            stats = self.get_stats()
+        self.assertEqual(stats['total_invoices'], 22)
+
+
+class ParserParityTests(TestCase):
+    """parse_invoice_data returns what the original parser returned"""
+
+    def assertParity(self, text):
+        self.assertEqual(parse_invoice_data(text), legacy_parse_invoice_data(text))
+
+    def test_sofia_sample(self):
+        self.assertParity(load_sofia_text())
+
+    def test_synthetic(self):
+        rng = random.Random(2025)
+        for _ in range(50):
+            with self.subTest():
+                self.assertParity(synthetic_statement(rng))
+                self.assertParity(synthetic_statement(rng, extra_lines=20))
+                self.assertParity(synthetic_simple(rng))
+
+    def test_empty(self):
+        self.assertParity('')
+
+
+@override_settings(INVOICE_EXTRACTION_CACHE={
+    'BACKEND': 'invoices.extraction_cache.DjangoCacheBackend',
+    'OPTIONS': {'alias': 'invoice_extraction', 'timeout': None},
+})
+class ExtractionCacheTests(TestCase):
+    """Re-uploads of a file skip extraction until the parser rules change"""
+
+    def setUp(self):
+        caches['invoice_extraction'].clear()
+        self.user = User.objects.create_user(username='uploader', email='uploader@example.com', password='password')
+        self.pdf = make_pdf(synthetic_statement(random.Random(7)))
+
+    def upload(self, content):
+        with mock.patch.object(utils, 'extract_pdf_text', wraps=utils.extract_pdf_text) as extract:
+            result = process_uploaded_invoice(SimpleUploadedFile('invoice.pdf', content), self.user)
+        return result, extract.called
+
+    def test_hit_and_miss(self):
+        first, extracted = self.upload(self.pdf)
+        self.assertTrue(extracted)
+        self.assertTrue(first['data']['invoice_reference'])
+        second, extracted = self.upload(self.pdf)
+        self.assertFalse(extracted)
+        self.assertEqual(second['data'], first['data'])
+        # Other contents miss
+        self.assertTrue(self.upload(make_pdf(synthetic_statement(random.Random(8))))[1])
+
+    def test_parser_version(self):
+        self.upload(self.pdf)
+        with mock.patch('invoices.extraction_cache.PARSER_VERSION', 'next'):
+            self.assertTrue(self.upload(self.pdf)[1])
+
+    def test_failures_not_cached(self):
+        blank = make_pdf('')
+        self.assertIn('No text could be extracted from PDF. Manual entry will be required.',
+                      self.upload(blank)[0]['warnings'])
+        self.assertTrue(self.upload(blank)[1])
+
+    def test_oversized_file_not_hashed(self):
+        content = b'%PDF-1.4\n' + b'0' * (10 * 1024 * 1024)
+        with mock.patch.object(utils, 'hash_uploaded_file') as hash_file:
+            result, _ = self.upload(content)
+        self.assertIn('file_size', result['errors'])
+        hash_file.assert_not_called()
+
+    def test_file_system_backend(self):
+        entry = {'text': 'Statement', 'data': {'amount_due': Decimal('42.50'), 'issue_date': date(2025, 8, 25)}}
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileSystemBackend(directory, max_entries=2)
+            self.assertIsNone(backend.get('a'))
+            backend.set('a', entry)
+            backend.set('b', entry)
+            self.assertEqual(backend.get('a'), entry)
+            # The least recently read entry is evicted
+            os.utime(backend._path('a'), (1, 1))
+            os.utime(backend._path('b'), (2, 2))
+            backend.get('a')
+            backend.set('c', entry)
+            self.assertIsNone(backend.get('b'))
+            self.assertEqual(backend.get('a'), entry)
+            self.assertEqual(backend.get('c'), entry)
+
+
+class InlineExecutor:
+    """Stand-in for ProcessPoolExecutor running jobs in the test process and transaction"""
+
+    def __init__(self, max_workers=None, initializer=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables, chunksize=1):
+        return map(fn, *iterables)
+
+
+class JobQueueTests(TestCase):
+    """Queued uploads are claimed once, processed, and requeued if interrupted"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, INVOICE_EXTRACTION_CACHE=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='queued', email='queued@example.com', password='password')
+        self.pdf = make_pdf(synthetic_statement(random.Random(11)))
+
+    def enqueue(self):
+        return jobs.enqueue_invoice_job(SimpleUploadedFile('invoice.pdf', self.pdf), self.user)
+
+    def test_claim_and_complete(self):
+        job = self.enqueue()
+        self.assertEqual(job.status, InvoiceProcessingJob.STATUS_QUEUED)
+        self.assertTrue(job.pdf_file.storage.exists(job.pdf_file.name))
+
+        self.assertEqual(jobs.claim_jobs(5), [job.pk])
+        self.assertEqual(jobs.claim_jobs(5), [])
+        self.assertEqual(jobs.run_invoice_job(job.pk), InvoiceProcessingJob.STATUS_COMPLETED)
+
+        job.refresh_from_db()
+        self.assertTrue(job.result['success'])
+        self.assertTrue(job.result['data']['invoice_reference'])
+        self.assertIsNotNone(job.finished_at)
+        # The stored upload is removed once processed
+        self.assertFalse(job.pdf_file)
+
+    def test_failure(self):
+        job = self.enqueue()
+        jobs.claim_jobs(1)
+        with mock.patch.object(jobs, 'process_uploaded_invoice', side_effect=RuntimeError('boom')), \
+                self.assertLogs('invoices.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_invoice_job(job.pk), InvoiceProcessingJob.STATUS_FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.error, 'Error processing PDF: boom')
+
+    def test_requeue_running(self):
+        job = self.enqueue()
+        jobs.claim_jobs(1)
+        self.assertEqual(jobs.requeue_running_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, InvoiceProcessingJob.STATUS_QUEUED)
+        self.assertIsNone(job.started_at)
+        self.assertEqual(jobs.claim_jobs(1), [job.pk])
+
+    def test_command(self):
+        job = self.enqueue()
+        with mock.patch('invoices.management.commands.process_invoice_jobs.ProcessPoolExecutor', InlineExecutor):
+            call_command('process_invoice_jobs', workers=1, once=True, stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, InvoiceProcessingJob.STATUS_COMPLETED)
+
+    @override_settings(INVOICE_PROCESSING_ASYNC=True)
+    def test_upload_and_status(self):
+        self.client.force_login(self.user)
+        upload = reverse('invoices:invoice_upload_ajax')
+        response = self.client.post(upload, {'pdf_file': SimpleUploadedFile('invoice.pdf', self.pdf)})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], InvoiceProcessingJob.STATUS_QUEUED)
+
+        jobs.run_invoice_job(jobs.claim_jobs(1)[0])
+        self.assertTrue(self.client.get(status_url).json()['result']['success'])
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='password')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+        # Files failing the cheap checks are refused before anything is stored
+        response = self.client.post(upload, {'pdf_file': SimpleUploadedFile('invoice.pdf', b'not a pdf')})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file_type', response.json()['errors'])
+        self.assertEqual(InvoiceProcessingJob.objects.count(), 1)
+
+    @override_settings(INVOICE_PROCESSING_ASYNC=True)
+    def test_invoice_form_checks_structure(self):
+        cache.clear()
+        provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        child = Child.objects.create(user=self.user, name='Sofia Green', reference_number='SG123',
+                                     daycare_provider=provider)
+        self.client.force_login(self.user)
+        form = {
+            'child': child.pk, 'invoice_reference': 'INV1', 'period_start': '2025-08-04',
+            'period_end': '2025-08-08', 'issue_date': '2025-08-04', 'original_amount': '100.00',
+            'discount_percentage': '0', 'fee_type': 'Under 3 Fee',
+        }
+        corrupt = SimpleUploadedFile('invoice.pdf', b'%PDF-1.4\nnot really a pdf')
+        response = self.client.post(reverse('invoices:invoice_create'), {**form, 'pdf_file': corrupt})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Invoice.objects.exists())
+
+        valid = SimpleUploadedFile('invoice.pdf', self.pdf)
+        response = self.client.post(reverse('invoices:invoice_create'), {**form, 'pdf_file': valid})
+        self.assertRedirects(response, reverse('invoices:invoice_list'))
+        # The attached file is not queued again
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.assertFalse(InvoiceProcessingJob.objects.exists())
+
+
+@mock.patch('invoices.management.commands.import_invoices.ProcessPoolExecutor', InlineExecutor)
+class ImportInvoicesTests(TestCase):
+    """import_invoices creates matched invoices once and reports everything else"""
+
+    def setUp(self):
+        directory, media = tempfile.TemporaryDirectory(), tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(media.cleanup)
+        self.directory, self.media = Path(directory.name), Path(media.name)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='importer', email='importer@example.com', password='password')
+        provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        # The only child, so every statement matches it
+        Child.objects.create(user=self.user, name='Sofia Green', reference_number='SG123', daycare_provider=provider)
+        rng = random.Random(3)
+        for number in range(3):
+            (self.directory / f'statement{number}.pdf').write_bytes(make_pdf(synthetic_statement(rng)))
+        # Same statement under another name
+        (self.directory / 'copy.pdf').write_bytes((self.directory / 'statement0.pdf').read_bytes())
+        (self.directory / 'broken.pdf').write_bytes(b'not a pdf')
+        (self.directory / 'incomplete.pdf').write_bytes(make_pdf('Statement for Sofia Green-SG123'))
+
+    def run_import(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_invoices', str(self.directory), '--user', 'importer', '--workers', '1',
+                     *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        out, _ = self.run_import('--dry-run')
+        self.assertIn('3 created, 1 duplicate, 0 unmatched, 1 invalid, 1 failed', out)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse((self.directory / '.import_invoices_state').exists())
+
+        out, err = self.run_import()
+        self.assertIn('3 created, 1 duplicate, 0 unmatched, 1 invalid, 1 failed', out)
+        self.assertIn('broken.pdf', err)
+        self.assertEqual(Invoice.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(any(invoice.pdf_file for invoice in Invoice.objects.all()))
+
+        # A rerun resumes after the imported files and retries the rest
+        out, _ = self.run_import()
+        self.assertIn('Found 2 PDF(s) to import (4 already imported)', out)
+        # Without the state file, existing invoices are skipped as duplicates
+        out, _ = self.run_import('--state-file', str(self.directory / 'other_state'))
+        self.assertIn('0 created, 4 duplicate', out)
+        self.assertEqual(Invoice.objects.count(), 3)
+
+    def test_copy_files(self):
+        self.run_import('--copy-files')
+        invoices = Invoice.objects.all()
+        self.assertEqual(len(invoices), 3)
+        for invoice in invoices:
+            self.assertTrue((self.media / invoice.pdf_file.name).is_file())
+
+    def test_copies_removed_on_rollback(self):
+        with mock.patch.object(Invoice.objects, 'bulk_create', side_effect=IntegrityError), \
+                self.assertRaises(IntegrityError):
+            self.run_import('--copy-files')
+        self.assertEqual([path for path in self.media.rglob('*') if path.is_file()], [])
+
+
+class DashboardStatsTests(TestCase):
+    """Dashboard totals count each invoice once regardless of its payments"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='parent', password='password')
+        provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        child = Child.objects.create(
+            user=cls.user, name='Sofia Green', reference_number='SG123', daycare_provider=provider
+        )
+        Child.objects.create(user=cls.user, name='Liam Green', reference_number='LG456', daycare_provider=provider)
+        for number, payments in enumerate([3, 0]):
+            invoice = Invoice.objects.create(
+                child=child,
+                invoice_reference=f'INV{number}',
+                period_start=date(2025, 8, 4),
+                period_end=date(2025, 8, 8),
+                issue_date=date(2025, 8, 4),
+                original_amount=Decimal('100.00'),
+                total_amount_due=Decimal('100.00'),
+            )
+            for _ in range(payments):
+                Payment.objects.create(
+                    invoice=invoice,
+                    payment_date=date(2025, 8, 5),
+                    amount_paid=Decimal('10.00'),
+                    payment_method='cash',
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_stats(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('invoices:dashboard'))
+        stats = response.context['stats']
+        self.assertEqual(stats['total_invoices'], 2)
+        self.assertEqual(stats['total_amount_due'], Decimal('200.00'))
+        self.assertEqual(stats['total_paid'], Decimal('30.00'))
+        self.assertEqual(stats['outstanding_balance'], Decimal('170.00'))
+        self.assertEqual(stats['total_children'], 2)
+        self.assertEqual(stats['total_payments'], 3)
+        self.assertEqual(stats['unpaid_invoices'], 1)
+
+    def test_cached_until_write(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('invoices:dashboard'))
+        # Session, user, the data version (for the ETag and each cached
+        # summary), recent invoices and recent payments; no aggregates
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('invoices:dashboard'))
+        self.assertEqual(response.context['stats']['total_payments'], 3)
+
+        Payment.objects.create(
+            invoice=Invoice.objects.get(invoice_reference='INV1'),
+            payment_date=date(2025, 8, 6),
+            amount_paid=Decimal('100.00'),
+            payment_method='cash',
+        )
+        stats = self.client.get(reverse('invoices:dashboard')).context['stats']
+        self.assertEqual(stats['total_payments'], 4)
+        self.assertEqual(stats['outstanding_balance'], Decimal('70.00'))
+        self.assertEqual(stats['unpaid_invoices'], 0)
+
+    def test_move_to_another_owner(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('invoices:dashboard')).context['stats']['total_invoices'], 2)
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='password')
+        child = Child.objects.create(user=other, name='Noah Brown', reference_number='NB789',
+                                     daycare_provider=DaycareProvider.objects.get())
+        invoice = Invoice.objects.get(invoice_reference='INV1')
+        invoice.child = child
+        invoice.save()
+        stats = self.client.get(reverse('invoices:dashboard')).context['stats']
+        self.assertEqual(stats['total_invoices'], 1)
+        self.assertEqual(stats['total_amount_due'], Decimal('100.00'))
+
+
+class RateLimitTests(TestCase):
+    """Sliding-window limiter counts accepted requests only"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_limit(self):
+        results = [check_rate_limit('parent', 3, 600) for _ in range(5)]
+        self.assertEqual(results[:3], [0, 0, 0])
+        self.assertTrue(all(retry_after > 0 for retry_after in results[3:]))
+        # Refused requests were not counted; other identifiers are unaffected
+        self.assertEqual(check_rate_limit('other', 3, 600), 0)
+
+
+class SQLiteCacheTests(TestCase):
+    """The SQLite cache is shared by every instance on one file and updates atomically"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'cache.sqlite3'
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_get_set_add(self):
+        values = {'small': 5, 'big': 2 ** 70, 'negative': -2 ** 64, 'flag': True, 'text': 'x', 'data': {'a': [1]}}
+        for key, value in values.items():
+            self.cache.set(key, value)
+        self.assertEqual({key: self.cache.get(key) for key in values}, values)
+        self.assertIs(self.cache.get('flag'), True)
+        self.assertIsNone(self.cache.get('missing'))
+
+        self.assertFalse(self.cache.add('small', 1))
+        self.assertTrue(self.cache.add('new', 1))
+        self.assertEqual(self.cache.get('small'), 5)
+
+    def test_incr(self):
+        self.cache.set('count', 1)
+        self.assertEqual(self.cache.incr('count', 10), 11)
+        self.assertEqual(self.cache.decr('count'), 10)
+        # Past 64 bits the value is pickled, and still counts
+        self.cache.set('count', 2 ** 63 - 2)
+        self.assertEqual(self.cache.incr('count', 5), 2 ** 63 + 3)
+        self.assertEqual(self.cache.incr('count', -10), 2 ** 63 - 7)
+        self.assertEqual(self.cache.incr('count', 2 ** 70), 2 ** 70 + 2 ** 63 - 7)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry(self):
+        self.cache.set('gone', 1, timeout=0)
+        self.assertIsNone(self.cache.get('gone'))
+        self.assertFalse(self.cache.has_key('gone'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('gone')
+        # An expired entry can be added again; a live one cannot
+        self.assertTrue(self.cache.add('gone', 2))
+        self.assertEqual(self.cache.get('gone'), 2)
+        self.cache.set('kept', 1, timeout=None)
+        self.assertTrue(self.cache.touch('kept', timeout=0))
+        self.assertIsNone(self.cache.get('kept'))
+
+    def test_cull(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        with mock.patch('invoices.cache_backends.CULL_CHECK_INTERVAL', 1):
+            cache.set('forever', 1, timeout=None)
+            for number in range(20):
+                cache.set(f'key{number}', number, timeout=60 + number)
+                self.assertLessEqual(len(self.entries()), 10)
+        # The soonest to expire go first, entries without a timeout last
+        self.assertIn('forever', ''.join(self.entries()))
+        self.assertIsNotNone(cache.get('key19'))
+        self.assertIsNone(cache.get('key0'))
+
+    def test_shared_file(self):
+        other = self.make_cache()
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+        self.cache.set('count', 0)
+        added = []
+
+        def work(cache):
+            for _ in range(50):
+                cache.incr('count')
+                added.append(cache.add('once', 1))
+
+        threads = [threading.Thread(target=work, args=(cache,)) for cache in (self.cache, other) * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('count'), 200)
+        self.assertEqual(added.count(True), 1)
+
+    def entries(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            return [row[0] for row in connection.execute('SELECT cache_key FROM cache_entries')]
+        finally:
+            connection.close()
+
+
+class TracingTests(TestCase):
+    """Trace events are only evaluated and logged while tracing is enabled"""
+
+    def test_lazy_fields(self):
+        calls = []
+        with self.assertNoLogs('invoices.trace'):
+            trace('event', value=lambda: calls.append('called'))
+        self.assertEqual(calls, [])
+
+        token = enable_tracing()
+        try:
+            with self.assertLogs('invoices.trace') as logs:
+                trace('event', value=lambda: calls.append('called') or 42)
+        finally:
+            disable_tracing(token)
+        self.assertEqual(calls, ['called'])
+        self.assertEqual(logs.records[0].trace, {'value': 42})
+        self.assertFalse(tracing_enabled())
+
+
+class LogPipelineTests(TestCase):
+    """QueueFileHandler writes JSON lines from its background thread"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.path = self.directory / 'app.log'
+
+    def make_handler(self, **kwargs):
+        handler = QueueFileHandler(self.path, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def read_lines(self):
+        return [json.loads(line) for path in sorted(self.directory.glob('app.log*'))
+                if not path.name.endswith('.lock') for line in path.read_text(encoding='utf-8').splitlines()]
+
+    def test_json_lines(self):
+        handler = self.make_handler()
+        test_logger = logging.getLogger('invoices.tests.pipeline')
+        # assertLogs keeps the warning off the console; the handler is added inside it
+        with self.assertLogs(test_logger, 'WARNING'):
+            test_logger.addHandler(handler)
+            test_logger.warning('Amount %s', 'due', extra={'amount': Decimal('12.50')})
+            handler.flush()
+        entry = self.read_lines()[0]
+        self.assertEqual(entry['message'], 'Amount due')
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['amount'], '12.50')
+
+    def test_shared_file_rotated_once(self):
+        # Two handlers on one file stand in for two processes
+        handlers = [self.make_handler(max_bytes=2000, backup_count=50, batch_size=1) for _ in range(2)]
+        for number in range(100):
+            handler = handlers[number % 2]
+            handler.handle(logging.makeLogRecord({'msg': f'Record {number:03d}', 'levelno': logging.INFO}))
+            handler.flush()
+        messages = [entry['message'] for entry in self.read_lines()]
+        self.assertEqual(sorted(messages), [f'Record {number:03d}' for number in range(100)])
+        # Every rotated file filled up before rotating; none were rotated twice
+        backups = [path for path in self.directory.glob('app.log.*') if not path.name.endswith('.lock')]
+        self.assertGreater(len(backups), 1)
+        for path in backups:
+            self.assertGreaterEqual(path.stat().st_size, 2000)
+
+    def test_rotate_by_age(self):
+        handler = self.make_handler(rotate_when='H')
+        handler.handle(logging.makeLogRecord({'msg': 'Old', 'levelno': logging.INFO}))
+        handler.flush()
+        # The lock file's mtime records the last rotation, for every process
+        lock = Path(f'{self.path}.lock')
+        an_hour_ago = time.time() - 3601
+        os.utime(lock, (an_hour_ago, an_hour_ago))
+        handler.handle(logging.makeLogRecord({'msg': 'New', 'levelno': logging.INFO}))
+        handler.flush()
+        self.assertEqual(json.loads(Path(f'{self.path}.1').read_text(encoding='utf-8'))['message'], 'Old')
+        self.assertEqual(json.loads(self.path.read_text(encoding='utf-8'))['message'], 'New')
+        self.assertGreater(lock.stat().st_mtime, an_hour_ago)
+
+    def test_dropped_records_reported(self):
+        handler = self.make_handler(queue_size=1)
+        release = threading.Event()
+        with mock.patch.object(handler.target, 'rollover_if_due', side_effect=lambda: release.wait(5)):
+            for number in range(10):
+                handler.handle(logging.makeLogRecord({'msg': f'Record {number}', 'levelno': logging.INFO}))
+            release.set()
+            handler.flush()
+        messages = [entry['message'] for entry in self.read_lines()]
+        self.assertIn(f'Log queue full; dropped {10 - len(messages) + 1} record(s)', messages)
+
+
+class RequestTimingTests(TestCase):
+    """Sampled requests report query counts and stages in Server-Timing"""
+
+    @override_settings(INVOICE_TIMING_SAMPLE_RATE=1.0, INVOICE_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        user = User.objects.create_user(username='parent', password='password')
+        self.client.force_login(user)
+        with self.assertLogs('invoices.timing', level='INFO') as logs:
+            response = self.client.get(reverse('invoices:dashboard'))
+        header = response['Server-Timing']
+        self.assertIn('total;dur=', header)
+        self.assertIn('queries"', header)
+        self.assertIn('render;dur=', header)
+        self.assertGreater(logs.records[0].query_count, 0)
+
+    @override_settings(INVOICE_TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled(self):
+        response = self.client.get(reverse('accounts:login'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTests(TestCase):
+    """Metrics are aggregated through the shared file and shown to staff only"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(INVOICE_METRICS_FILE=str(Path(directory.name) / 'metrics.sqlite3'))
+        override.enable()
+        self.addCleanup(override.disable)
+        # Drop deltas recorded by earlier tests
+        metrics.registry.reset()
+
+    def test_staff_endpoint(self):
+        metrics.child_matches.inc(strategy='name')
+        metrics.child_matches.inc(strategy='name')
+        metrics.upload_duration.observe(0.2)
+        metrics.registry.flush()
+        metrics.child_matches.inc(strategy='name')
+
+        user = User.objects.create_user(username='parent', password='password')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('invoices:metrics')).status_code, 302)
+
+        user.is_staff = True
+        user.save()
+        body = self.client.get(reverse('invoices:metrics')).content.decode()
+        self.assertIn('invoice_child_matches_total{strategy="name"} 3', body)
+        self.assertIn('invoice_upload_processing_seconds_bucket{le="0.25"} 1', body)
+        self.assertIn('invoice_upload_processing_seconds_count 1', body)
+
+    @override_settings(INVOICE_METRICS_FLUSH_SECONDS=0)
+    def test_flush_off_request_thread(self):
+        flushed = threading.Event()
+        threads = []
+
+        def flush():
+            threads.append(threading.current_thread())
+            flushed.set()
+
+        with mock.patch.object(metrics.registry, 'flush', side_effect=flush):
+            metrics.child_matches.inc(strategy='name')
+            self.assertTrue(flushed.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+class GenerateLoadDataTests(TestCase):
+    """Generated data is reproducible and its stored totals match its payments"""
+
+    def generate(self):
+        call_command('generate_load_data', users=2, children=2, years=0.25, seed=7,
+                     end_date=date(2025, 8, 25), clear=True, stdout=io.StringIO())
+        return list(Invoice.objects.order_by('invoice_reference').values_list(
+            'invoice_reference', 'total_amount_due', 'amount_paid_total', 'payment_status',
+        ))
+
+    def test_seeded_and_consistent(self):
+        first = self.generate()
+        self.assertEqual(len(first), 2 * 2 * 13)
+        self.assertEqual(User.objects.filter(username__startswith='loadtest_').count(), 2)
+        call_command('rebuild_paid_totals', verify=True, stdout=io.StringIO())
+
+        second = self.generate()
+        self.assertEqual([row[1:] for row in first], [row[1:] for row in second])
+
+
+
+class KeysetPaginationTests(TestCase):
+    """Invoice list pages follow cursors in both directions at a constant cost"""
+
+    def setUp(self):
+        call_command('generate_load_data', users=1, children=2, years=0.5, seed=3,
+                     end_date=date(2025, 8, 25), stdout=io.StringIO())
+        self.user = User.objects.get(username__startswith='loadtest_')
+        self.client.force_login(self.user)
+        self.expected = list(Invoice.objects.filter(user=self.user).order_by('-issue_date', '-id'))
+
+    def test_walk_forward_and_back(self):
+        url = reverse('invoices:invoice_list')
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].total_count, len(self.expected))
+
+        pages = [response.context['invoices']]
+        while response.context['page_obj'].has_next:
+            # Session, user, the data version (for the ETag and the cached
+            # total count) and the page itself
+            with self.assertNumQueries(5):
+                response = self.client.get(f"{url}?{response.context['page_obj'].next_querystring}")
+            pages.append(response.context['invoices'])
+        self.assertEqual([invoice for page in pages for invoice in page], self.expected)
+
+        response = self.client.get(f"{url}?{response.context['page_obj'].previous_querystring}")
+        self.assertEqual(list(response.context['invoices']), list(pages[-2]))
+
+    def test_filters_kept_and_bad_cursor(self):
+        url = reverse('invoices:invoice_list')
+        child = Child.objects.filter(user=self.user).first()
+        response = self.client.get(url, {'child': child.pk})
+        self.assertIn(f'child={child.pk}', response.context['page_obj'].next_querystring)
+        self.assertEqual(response.context['page_obj'].total_count, child.invoices.count())
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class QueryPlanTests(TestCase):
+    """The views' querysets are answered from the indexes declared for them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_load_data', users=2, children=2, years=0.25, seed=5,
+                     end_date=date(2025, 8, 25), stdout=io.StringIO())
+        cls.user = User.objects.filter(username__startswith='loadtest_').first()
+        cls.child = Child.objects.filter(user=cls.user).first()
+
+    def view_queryset(self, view_class, **params):
+        request = RequestFactory().get('/', params)
+        request.user = self.user
+        view = view_class()
+        view.setup(request)
+        return view.get_queryset()
+
+    def assertUsesIndex(self, queryset, index_name, sorted_by_index=False):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        if sorted_by_index:
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_invoice_list(self):
+        fields = views.InvoiceListView.keyset_fields
+        queryset = self.view_queryset(views.InvoiceListView).order_by(*fields)[:21]
+        self.assertUsesIndex(queryset, 'idx_invoice_user_issued', sorted_by_index=True)
+        queryset = self.view_queryset(views.InvoiceListView, status='paid').order_by(*fields)[:21]
+        self.assertUsesIndex(queryset, 'idx_invoice_user')
+
+    def test_payment_list(self):
+        fields = views.PaymentListView.keyset_fields
+        queryset = self.view_queryset(views.PaymentListView).order_by(*fields)[:21]
+        self.assertUsesIndex(queryset, 'idx_payment_user_paid', sorted_by_index=True)
+
+    def test_stats_covered(self):
+        queryset = Invoice.objects.filter(user=self.user).order_by().values(
+            'payment_status', 'total_amount_due', 'amount_paid_total',
+        )
+        self.assertUsesIndex(queryset, 'COVERING INDEX idx_invoice_user_totals')
+        self.assertEqual(quick_stats(self.user)['total_invoices'], 2 * 13)
+
+    def test_child_and_provider_views(self):
+        self.assertUsesIndex(self.view_queryset(views.ChildListView), 'idx_child_user_name', sorted_by_index=True)
+        queryset = Invoice.objects.filter(
+            user=self.user, child__daycare_provider=self.child.daycare_provider,
+        ).order_by('-issue_date', '-id')[:10]
+        self.assertUsesIndex(queryset, 'idx_invoice_')
+
+    def test_sync(self):
+        for model, index in ((Invoice, 'idx_invoice_user_updated'), (Payment, 'idx_payment_user_updated')):
+            queryset = model.objects.filter(user=self.user).order_by('updated_at', 'id')
+            self.assertUsesIndex(queryset, index, sorted_by_index=True)
+
+
+
+class OwnerTests(TestCase):
+    """Invoices and payments carry their child's owner and follow it when it changes"""
+
+    def test_owner_copied_and_followed(self):
+        parent = User.objects.create_user(username='parent', email='parent@example.com', password='password')
+        other = User.objects.create_user(username='other', email='other@example.com', password='password')
+        provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        child = Child.objects.create(
+            user=parent, name='Sofia Green', reference_number='SG123', daycare_provider=provider,
+        )
+        invoice = Invoice.objects.create(
+            child=child, invoice_reference='INV1', period_start=date(2025, 8, 4), period_end=date(2025, 8, 8),
+            issue_date=date(2025, 8, 4), original_amount=Decimal('100.00'),
+        )
+        payment = Payment.objects.create(
+            invoice=invoice, payment_date=date(2025, 8, 5), amount_paid=Decimal('10.00'), payment_method='cash',
+        )
+        self.assertEqual((invoice.user, payment.user), (parent, parent))
+
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('invoices:invoice_detail', args=[invoice.pk])).status_code, 404)
+
+        child.user = other
+        child.save()
+        self.assertEqual(Invoice.objects.get(pk=invoice.pk).user, other)
+        self.assertEqual(Payment.objects.get(pk=payment.pk).user, other)
+        self.assertEqual(self.client.get(reverse('invoices:invoice_detail', args=[invoice.pk])).status_code, 200)
+
+
+class ReconciliationTests(TestCase):
+    """Payments are recorded in batches and statuses recomputed in one UPDATE"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='parent', email='parent@example.com', password='password')
+        provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        child = Child.objects.create(
+            user=self.user, name='Sofia Green', reference_number='SG123', daycare_provider=provider,
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                child=child, invoice_reference=f'INV{number}', period_start=date(2025, 8, 4),
+                period_end=date(2025, 8, 8), issue_date=date(2025, 8, 4), original_amount=Decimal('100.00'),
+            )
+            for number in range(3)
+        ]
+
+    def payment(self, invoice, amount):
+        return Payment(invoice=invoice, payment_date=date(2025, 8, 5), amount_paid=Decimal(amount),
+                       payment_method='cash')
+
+    def test_single_payment_queries(self):
+        invoice = Invoice.objects.get(pk=self.invoices[0].pk)
+        # Stored total, savepoint, insert, data version, total and status
+        # update, release, refresh
+        with self.assertNumQueries(7):
+            self.payment(invoice, '40.00').save()
+        self.assertEqual((invoice.amount_paid_total, invoice.payment_status), (Decimal('40.00'), 'partial'))
+
+    def test_overpayment_with_stale_invoice(self):
+        stale = Invoice.objects.get(pk=self.invoices[0].pk)
+        self.payment(Invoice.objects.get(pk=stale.pk), '70.00').save()
+        with self.assertRaises(ValidationError):
+            self.payment(stale, '40.00').save()
+
+        # Editing a payment counts the others, not its own stored amount
+        payment = Payment.objects.get()
+        payment.invoice = stale
+        payment.amount_paid = Decimal('100.00')
+        payment.save()
+        self.assertEqual(Invoice.objects.get(pk=stale.pk).amount_paid_total, Decimal('100.00'))
+
+    def test_record_batch(self):
+        first, second, third = self.invoices
+        batch = [self.payment(first, '60.00'), self.payment(first, '40.00'), self.payment(second, '25.00')]
+        # Invoices, insert, user ids, status update, data version and refresh,
+        # plus savepoints
+        with self.assertNumQueries(10):
+            created = record_payments(batch, user=self.user)
+        self.assertTrue(all(payment.pk for payment in created))
+        statuses = dict(Invoice.objects.values_list('invoice_reference', 'payment_status'))
+        self.assertEqual(statuses, {'INV0': 'paid', 'INV1': 'partial', 'INV2': 'unpaid'})
+        self.assertEqual(created[2].invoice.amount_paid_total, Decimal('25.00'))
+        self.assertEqual(Payment.objects.get(pk=created[0].pk).user, self.user)
+
+        with self.assertRaises(ValidationError) as error:
+            record_payments([self.payment(third, '10.00'), self.payment(second, '80.00')])
+        self.assertIn('payment 1', error.exception.message_dict)
+        self.assertFalse(third.payments.exists())
+
+    def test_recompute(self):
+        Payment.objects.create(invoice=self.invoices[0], payment_date=date(2025, 8, 5),
+                               amount_paid=Decimal('100.00'), payment_method='cash')
+        Invoice.objects.update(payment_status='unpaid', amount_paid_total=Decimal('0.00'))
+        self.assertEqual(recompute_payment_statuses(rebuild_totals=True), 3)
+        self.assertEqual(Invoice.objects.get(pk=self.invoices[0].pk).payment_status, 'paid')
+
+    def stored(self, invoice):
+        return Invoice.objects.values_list('amount_paid_total', 'payment_status').get(pk=invoice.pk)
+
+    def test_paid_totals_follow_payments(self):
+        first, second, _ = self.invoices
+        payment = self.payment(first, '40.00')
+        payment.save()
+        self.assertEqual(self.stored(first), (Decimal('40.00'), 'partial'))
+
+        payment.amount_paid = Decimal('100.00')
+        payment.save()
+        self.assertEqual(self.stored(first), (Decimal('100.00'), 'paid'))
+
+        payment.invoice = second
+        payment.save()
+        self.assertEqual(self.stored(first), (Decimal('0.00'), 'unpaid'))
+        self.assertEqual(self.stored(second), (Decimal('100.00'), 'paid'))
+
+        payment.delete()
+        self.assertEqual(self.stored(second), (Decimal('0.00'), 'unpaid'))
+
+    def test_edit_of_stale_invoice(self):
+        stale = Invoice.objects.get(pk=self.invoices[0].pk)
+        self.payment(Invoice.objects.get(pk=stale.pk), '40.00').save()
+        stale.total_amount_due = Decimal('40.00')
+        stale.save()
+        # The status follows the stored total and the edited amount due
+        self.assertEqual(self.stored(stale), (Decimal('40.00'), 'paid'))
+        self.assertEqual((stale.amount_paid_total, stale.payment_status), (Decimal('40.00'), 'paid'))
+
+        stale.payment_status = 'overdue'
+        stale.save()
+        self.assertEqual(self.stored(stale), (Decimal('40.00'), 'overdue'))
+
+    def test_cascade_skips_total_updates(self):
+        first = self.invoices[0]
+        for amount in ('10.00', '20.00'):
+            self.payment(first, amount).save()
+        with mock.patch.object(Invoice, 'adjust_paid_total') as adjust:
+            first.delete()
+        adjust.assert_not_called()
+        self.assertFalse(Payment.objects.exists())
+
+    def test_rebuild_paid_totals(self):
+        self.payment(self.invoices[0], '100.00').save()
+        self.payment(self.invoices[1], '30.00').save()
+        Invoice.objects.update(amount_paid_total=Decimal('0.00'), payment_status='unpaid')
+
+        with self.assertRaisesMessage(CommandError, '2 invoice(s) have an incorrect paid total'):
+            call_command('rebuild_paid_totals', verify=True, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('rebuild_paid_totals', stdout=out)
+        self.assertIn('2 invoice(s) were out of date', out.getvalue())
+        self.assertEqual(self.stored(self.invoices[0]), (Decimal('100.00'), 'paid'))
+        self.assertEqual(self.stored(self.invoices[1]), (Decimal('30.00'), 'partial'))
+
+        out = io.StringIO()
+        call_command('rebuild_paid_totals', verify=True, stdout=out)
+        self.assertIn('All invoice paid totals match their payments', out.getvalue())
+
+
+class SpendReportTests(TestCase):
+    """Columnar rollups agree with database aggregates"""
+
+    def setUp(self):
+        call_command('generate_load_data', users=1, children=2, years=1.5, seed=5,
+                     end_date=date(2025, 8, 25), stdout=io.StringIO())
+        self.user = User.objects.get(username__startswith='loadtest_')
+
+    def test_group_sums(self):
+        keys = zip([1, 2, 1, 1], [2024, 2024, 2025, 2024])
+        self.assertEqual(group_sums(keys, array('q', [5, 6, 7, 2 ** 40]), [1, 1, 1, 1]),
+                         {(1, 2024): [2, 5 + 2 ** 40, 2], (2, 2024): [1, 6, 1], (1, 2025): [1, 7, 1]})
+        self.assertEqual(group_sums([]), {})
+
+    def test_rollups(self):
+        with self.assertNumQueries(3):
+            report = spend_report(self.user)
+
+        invoices = Invoice.objects.filter(user=self.user)
+        sums = invoices.aggregate(spend=Sum('week_amount_due'), discounts=Sum('discount_amount'),
+                                  paid=Sum('amount_paid_total'))
+        totals = report['totals']
+        self.assertEqual(totals['invoices'], invoices.count())
+        self.assertEqual((totals['spend'], totals['discounts'], totals['paid']),
+                         (sums['spend'], sums['discounts'], sums['paid']))
+        self.assertEqual(report['by_month'][-1]['balance'],
+                         sums['spend'] - Payment.objects.filter(user=self.user).aggregate(
+                             total=Sum('amount_paid'))['total'])
+
+        child = report['by_child'][0]
+        year = child['years'][0]
+        year_spend = invoices.filter(child_id=child['child_id'], issue_date__year=year['year']).aggregate(
+            total=Sum('week_amount_due'))['total']
+        self.assertEqual(year['spend'], year_spend)
+        self.assertEqual(sum(row['spend'] for row in report['by_provider']), totals['spend'])
+
+        latencies = [
+            (payment_date - due_date).days
+            for payment_date, due_date in Payment.objects.filter(user=self.user).values_list(
+                'payment_date', 'invoice__due_date')
+        ]
+        self.assertEqual(report['latency']['payments'], len(latencies))
+        self.assertEqual(report['latency']['late_payments'], sum(1 for days in latencies if days > 0))
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('invoices:spend_report'))
+        self.assertContains(response, 'Spend Report')
+        data = self.client.get(reverse('invoices:spend_report_api')).json()
+        self.assertEqual(Decimal(data['totals']['spend']), spend_report(self.user)['totals']['spend'])
+
+
+class MonthlySummaryTests(TestCase):
+    """The monthly rollup follows invoice and payment changes and can be rebuilt"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='parent', email='parent@example.com', password='password')
+        self.provider = DaycareProvider.objects.create(name='Active Explorers Ashburton')
+        self.child = Child.objects.create(
+            user=self.user, name='Sofia Green', reference_number='SG123', daycare_provider=self.provider,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice = Invoice.objects.create(
+                child=self.child, invoice_reference='INV1', period_start=date(2025, 7, 28),
+                period_end=date(2025, 8, 1), issue_date=date(2025, 7, 28), original_amount=Decimal('200.00'),
+                discount_amount=Decimal('20.00'),
+            )
+
+    def summary(self, month):
+        return MonthlySummary.objects.get(child=self.child, month=month)
+
+    def test_incremental_updates(self):
+        july = self.summary(date(2025, 7, 1))
+        self.assertEqual((july.invoice_count, july.invoiced_amount, july.discount_amount, july.outstanding_amount),
+                         (1, Decimal('180.00'), Decimal('20.00'), Decimal('180.00')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(invoice=self.invoice, payment_date=date(2025, 8, 4),
+                                             amount_paid=Decimal('100.00'), payment_method='cash')
+        self.assertEqual(self.summary(date(2025, 7, 1)).outstanding_amount, Decimal('80.00'))
+        self.assertEqual(self.summary(date(2025, 8, 1)).paid_amount, Decimal('100.00'))
+
+        # Moving the payment to another month empties August
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.payment_date = date(2025, 7, 30)
+            payment.save()
+        self.assertEqual(self.summary(date(2025, 7, 1)).paid_amount, Decimal('100.00'))
+        self.assertFalse(MonthlySummary.objects.filter(month=date(2025, 8, 1)).exists())
+
+        other = Child.objects.create(user=self.user, name='Liam Green', reference_number='LG1',
+                                     daycare_provider=self.provider)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.child = other
+            self.invoice.save()
+        self.assertEqual(list(MonthlySummary.objects.values_list('child_id', 'paid_amount')),
+                         [(other.pk, Decimal('100.00'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.delete()
+        self.assertEqual(verify_monthly_summaries(), [])
+        self.assertEqual(monthly_trend(self.user)[0]['outstanding_amount'], Decimal('180.00'))
+        self.assertEqual(yearly_statement(self.user, 2025)[0]['child__name'], 'Liam Green')
+
+    def test_rebuild_command(self):
+        MonthlySummary.objects.update(invoiced_amount=Decimal('1.00'))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_monthly_summaries', verify=True, stdout=io.StringIO())
+        call_command('rebuild_monthly_summaries', user='parent', stdout=io.StringIO())
+        call_command('rebuild_monthly_summaries', verify=True, stdout=io.StringIO())
+        self.assertEqual(self.summary(date(2025, 7, 1)).invoiced_amount, Decimal('180.00'))
+
+
+class ExportTests(TestCase):
+    """Exports stream from values_list rows, never model instances"""
+
+    def setUp(self):
+        call_command('generate_load_data', users=1, children=2, years=0.5, seed=9,
+                     end_date=date(2025, 8, 25), stdout=io.StringIO())
+        self.user = User.objects.get(username__startswith='loadtest_')
+        self.client.force_login(self.user)
+        self.child = Child.objects.filter(user=self.user).order_by('pk').first()
+
+    def download(self, url, **params):
+        with mock.patch.object(Invoice, 'from_db', side_effect=AssertionError('model instance built')), \
+                mock.patch.object(Payment, 'from_db', side_effect=AssertionError('model instance built')):
+            response = self.client.get(url, params)
+            self.assertTrue(response.streaming)
+            return response, b''.join(response.streaming_content)
+
+    def test_invoice_csv_with_filters(self):
+        response, content = self.download(reverse('invoices:invoice_export'), child=self.child.pk, status='paid',
+                                          **{'from': '2025-04-01', 'to': '2025-07-31'})
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        expected = Invoice.objects.filter(child=self.child, payment_status='paid',
+                                          issue_date__range=(date(2025, 4, 1), date(2025, 7, 31)))
+        self.assertEqual(rows[0][:2], ['Reference', 'Child'])
+        self.assertEqual(len(rows) - 1, expected.count())
+        self.assertIn('attachment; filename="invoices-', response['Content-Disposition'])
+
+    def test_payment_xlsx(self):
+        _, content = self.download(reverse('invoices:payment_export'), format='xlsx')
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = sheet.findall(f'{namespace}sheetData/{namespace}row')
+        self.assertEqual(len(rows) - 1, Payment.objects.filter(user=self.user).count())
+
+    def test_statement(self):
+        url = reverse('invoices:child_statement', args=[self.child.pk])
+        _, content = self.download(url, **{'from': '2025-06-01'})
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        charged = Invoice.objects.filter(child=self.child).aggregate(total=Sum('week_amount_due'))['total']
+        paid = Payment.objects.filter(invoice__child=self.child).aggregate(total=Sum('amount_paid'))['total']
+        self.assertEqual(rows[1][1], 'Opening balance')
+        self.assertEqual(Decimal(rows[-1][5]), charged - paid)
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='password')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url, {'from': '1 June'}).status_code, 400)
+
+    def test_statement_filename(self):
+        Child.objects.filter(pk=self.child.pk).update(reference_number='SG"1;\nx')
+        response, _ = self.download(reverse('invoices:child_statement', args=[self.child.pk]))
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="statement-sg1-x-{date.today():%Y%m%d}.csv"')
+
+    def test_csv_formulas_quoted(self):
+        notes = ['=HYPERLINK("http://example.com")', '+1', '-2+3', '@SUM(A1)', '\tx', '\rx', 'Paid in full']
+        payments = Payment.objects.filter(user=self.user).order_by('pk').values_list('pk', flat=True)
+        for pk, note in zip(payments, notes):
+            Payment.objects.filter(pk=pk).update(notes=note)
+        _, content = self.download(reverse('invoices:payment_export'))
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'), newline='')))
+        exported = {row[6] for row in rows[1:]}
+        self.assertLessEqual({"'" + note for note in notes[:-1]} | {'Paid in full'}, exported)
+        # Amounts are numbers, not text, and are left alone
+        self.assertFalse(any(row[3].startswith("'") for row in rows[1:]))
+
+
+class SyncTests(TestCase):
+    """The sync API streams changed rows after a watermark and honours If-None-Match"""
+
+    def setUp(self):
+        call_command('generate_load_data', users=1, children=1, years=0.25, seed=4,
+                     end_date=date(2025, 8, 25), stdout=io.StringIO())
+        self.user = User.objects.get(username__startswith='loadtest_')
+        self.client.force_login(self.user)
+        # History from before the overlap window, so the watermark passes it
+        for model in (Invoice, Payment):
+            model.objects.update(updated_at=F('updated_at') - timedelta(hours=1))
+
+    def sync(self, url, since='', etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        response = self.client.get(url, {'since': since, **params}, **headers)
+        if response.status_code != 200:
+            return response, []
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return response, lines
+
+    def test_incremental_sync(self):
+        url = reverse('invoices:payment_sync')
+        response, lines = self.sync(url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows, watermark = lines[:-1], lines[-1]
+        self.assertEqual(len(rows), Payment.objects.filter(user=self.user).count())
+        self.assertEqual(watermark['total'], len(rows))
+        self.assertEqual(watermark['checksum'], sum(row['id'] for row in rows))
+
+        # Nothing changed: 304 on the same request, no rows after the watermark
+        since = watermark['since']
+        response, lines = self.sync(url, since)
+        self.assertEqual(lines, [{'type': 'watermark', 'since': since, 'total': len(rows),
+                                  'checksum': watermark['checksum'], 'more': False}])
+        with self.assertNumQueries(3):
+            self.assertEqual(self.sync(url, since, etag=response['ETag'])[0].status_code, 304)
+
+        payment = Payment.objects.filter(user=self.user).order_by('updated_at').first()
+        payment.notes = 'Paid by card'
+        payment.save()
+        response, lines = self.sync(url, since, etag=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(line['id'], line['notes']) for line in lines[:-1]], [(payment.pk, 'Paid by card')])
+
+        invoice_lines = self.sync(reverse('invoices:invoice_sync'), limit=2)[1]
+        self.assertTrue(invoice_lines[-1]['more'])
+        # Updates made with QuerySet.update() are synced too
+        invoice_since = self.sync(reverse('invoices:invoice_sync'))[1][-1]['since']
+        Invoice.adjust_paid_total(payment.invoice_id, Decimal('0.01'))
+        changed = self.sync(reverse('invoices:invoice_sync'), invoice_since)[1]
+        self.assertEqual([line['id'] for line in changed[:-1]], [payment.invoice_id])
+
+    def test_recent_rows_read_again(self):
+        url = reverse('invoices:payment_sync')
+        since = self.sync(url)[1][-1]['since']
+        first, second = Payment.objects.filter(user=self.user).order_by('pk')[:2]
+        now = timezone.now()
+        Payment.objects.filter(pk=first.pk).update(updated_at=now - timedelta(seconds=10))
+        lines = self.sync(url, since)[1]
+        self.assertEqual([line['id'] for line in lines[:-1]], [first.pk])
+        # Recent rows are sent without moving the watermark past them
+        self.assertEqual(lines[-1]['since'], since)
+
+        # A transaction stamped before the last sync that committed after it
+        Payment.objects.filter(pk=second.pk).update(updated_at=now - timedelta(seconds=20))
+        lines = self.sync(url, lines[-1]['since'])[1]
+        self.assertEqual([line['id'] for line in lines[:-1]], [second.pk, first.pk])
+
+        # The limit never stops short of the recent rows, so syncs progress
+        lines = self.sync(url, limit=1000)[1]
+        self.assertEqual(len(lines) - 1, Payment.objects.filter(user=self.user).count())
+        self.assertFalse(lines[-1]['more'])
+
+    def test_deletion_changes_checksum(self):
+        url = reverse('invoices:payment_sync')
+        lines = self.sync(url)[1]
+        held = {line['id'] for line in lines[:-1]}
+        self.assertEqual(lines[-1]['checksum'], sum(held))
+
+        payment = Payment.objects.filter(user=self.user).order_by('pk').first()
+        deleted = payment.pk
+        payment.delete()
+        payment.pk = None
+        payment.save()
+        lines = self.sync(url, lines[-1]['since'])[1]
+        held |= {line['id'] for line in lines[:-1]}
+        self.assertEqual([line['id'] for line in lines[:-1]], [payment.pk])
+        # The count matches what the client held before; the id sum does not
+        self.assertEqual(lines[-1]['total'], len(held) - 1)
+        self.assertEqual(lines[-1]['checksum'], sum(held) - deleted)
+
+    def test_bad_token(self):
+        response = self.client.get(reverse('invoices:invoice_sync'), {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ConditionalGetTests(TestCase):
+    """Dashboard and list pages answer 304 until the user's data changes"""
+
+    def setUp(self):
+        call_command('generate_load_data', users=1, children=1, years=0.25, seed=5,
+                     end_date=date(2025, 8, 25), stdout=io.StringIO())
+        self.user = User.objects.get(username__startswith='loadtest_')
+        self.client.force_login(self.user)
+        # The first page sets the CSRF cookie, which is part of the ETag
+        self.client.get(reverse('invoices:dashboard'))
+
+    def test_not_modified_until_write(self):
+        for name in ('invoices:dashboard', 'invoices:invoice_list', 'invoices:payment_list'):
+            url = reverse(name)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            etag = response['ETag']
+            # Session, user and data version only: no aggregates, no rendering
+            with self.assertNumQueries(3):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertIn('private', response['Cache-Control'])
+            # Another filter is another page
+            self.assertEqual(self.client.get(url, {'status': 'paid'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        payment = Payment.objects.filter(user=self.user).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.notes = 'Changed'
+            payment.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_write_from_another_process(self):
+        url = reverse('invoices:dashboard')
+        response = self.client.get(url)
+        etag, total = response['ETag'], response.context['stats']['total_payments']
+
+        # A worker or management command with its own in-memory cache
+        with mock.patch('invoices.stats.cache', LocMemCache('other-process', {})):
+            Payment.objects.filter(user=self.user).first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['total_payments'], total - 1)
+
+    def test_provider_rename(self):
+        url = reverse('invoices:spend_report')
+        etag = self.client.get(url)['ETag']
+        provider = Child.objects.filter(user=self.user).first().daycare_provider
+        provider.name = 'Renamed Daycare'
+        provider.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed Daycare')
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.get(reverse('invoices:dashboard'), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,89 @@
+"""
+Switchable debug tracing for invoice processing
+
+Replaces the stdout debug printing in the upload and parsing paths. Events
+are written to the 'invoices.trace' logger only while tracing is enabled for
+the current request, which TracingMiddleware decides from settings:
+
+    INVOICE_TRACE_ENABLED = False   # trace every request
+    INVOICE_TRACE_USERS = [3, 7]    # trace requests by these user ids
+    INVOICE_TRACE_PARAM = 'trace'   # staff can add ?trace=1 to one request
+
+Field values may be callables; they are only called, and the event only
+formatted, when tracing is on. With tracing off, trace() returns after one
+context variable lookup.
+"""
+import logging
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .logging_config import StructuredLogger
+
+logger = logging.getLogger('invoices.trace')
+
+_trace_request = ContextVar('invoice_trace_request', default=None)
+_trace_enabled = ContextVar('invoice_trace_enabled', default=False)
+
+
+def tracing_enabled() -> bool:
+    """Whether trace events are recorded in the current context"""
+    return _trace_enabled.get()
+
+
+def enable_tracing(request=None):
+    """Turn tracing on for the current context; returns a token for disable_tracing"""
+    return _trace_enabled.set(True), _trace_request.set(request)
+
+
+def disable_tracing(token) -> None:
+    """Restore the tracing state saved by enable_tracing"""
+    enabled_token, request_token = token
+    _trace_enabled.reset(enabled_token)
+    _trace_request.reset(request_token)
+
+
+def trace(event: str, **fields) -> None:
+    """
+    Record a debug event if tracing is enabled
+
+    Args:
+        event: Short event name, e.g. 'child_match'
+        **fields: Event data; callables are evaluated lazily
+    """
+    if not _trace_enabled.get():
+        return
+    data = {name: value() if callable(value) else value for name, value in fields.items()}
+    StructuredLogger.log_info(
+        logger, f'{event}: {data!r}', request=_trace_request.get(),
+        extra_data={'trace_event': event, 'trace': data},
+    )
+
+
+def should_trace(request) -> bool:
+    """Whether settings enable tracing for this request"""
+    if getattr(settings, 'INVOICE_TRACE_ENABLED', False):
+        return True
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return False
+    if user.pk in getattr(settings, 'INVOICE_TRACE_USERS', ()):
+        return True
+    param = getattr(settings, 'INVOICE_TRACE_PARAM', 'trace')
+    return bool(param) and user.is_staff and request.GET.get(param) == '1'
+
+
+class TracingMiddleware:
+    """Enable tracing for the duration of requests selected by should_trace"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_trace(request):
+            return self.get_response(request)
+        token = enable_tracing(request)
+        try:
+            return self.get_response(request)
+        finally:
+            disable_tracing(token)
@@ -14,12 +14,14 @@ urlpatterns = [
     
     # Invoice management
     path('invoices/', views.InvoiceListView.as_view(), name='invoice_list'),
+    path('invoices/export/', views.invoice_export, name='invoice_export'),
     path('invoices/create/', views.InvoiceCreateView.as_view(), name='invoice_create'),
     path('invoices/<int:pk>/', views.InvoiceDetailView.as_view(), name='invoice_detail'),
     path('invoices/<int:pk>/edit/', views.InvoiceUpdateView.as_view(), name='invoice_edit'),
     
     # Payment management
     path('payments/', views.PaymentListView.as_view(), name='payment_list'),
+    path('payments/export/', views.payment_export, name='payment_export'),
     path('payments/create/', views.PaymentCreateView.as_view(), name='payment_create'),
     path('payments/<int:pk>/', views.PaymentDetailView.as_view(), name='payment_detail'),
     path('payments/<int:pk>/edit/', views.PaymentUpdateView.as_view(), name='payment_edit'),
@@ -28,12 +30,25 @@ urlpatterns = [
     path('children/', views.ChildListView.as_view(), name='child_list'),
     path('children/create/', views.ChildCreateView.as_view(), name='child_create'),
     path('children/<int:pk>/edit/', views.ChildUpdateView.as_view(), name='child_edit'),
+    path('children/<int:pk>/statement/', views.child_statement, name='child_statement'),
     
     # Provider management
     path('providers/', views.ProviderListView.as_view(), name='provider_list'),
     path('providers/<int:pk>/', views.ProviderDetailView.as_view(), name='provider_detail'),
     
+    # Reports
+    path('reports/spend/', views.SpendReportView.as_view(), name='spend_report'),
+    path('api/reports/spend/', views.spend_report_api, name='spend_report_api'),
+    
+    # Sync API
+    path('api/sync/invoices/', views.invoice_sync, name='invoice_sync'),
+    path('api/sync/payments/', views.payment_sync, name='payment_sync'),
+    
     # AJAX endpoints
     path('ajax/invoice-upload/', views.invoice_upload_ajax, name='invoice_upload_ajax'),
     path('ajax/quick-stats/', views.invoice_quick_stats, name='invoice_quick_stats'),
+    path('ajax/jobs/<int:pk>/', views.invoice_job_status, name='invoice_job_status'),
+    
+    # Monitoring
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
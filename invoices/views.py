@@ -1,22 +1,37 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DetailView
-from django.db.models import Sum, Count, Q
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.urls import reverse_lazy, reverse
+from django.utils.text import slugify
+from datetime import date
 from decimal import Decimal
-from .models import Invoice, Payment, Child, DaycareProvider
+from .models import Invoice, Payment, Child, DaycareProvider, InvoiceProcessingJob
 from .forms import InvoiceForm, PaymentForm, ChildForm
-from .utils import process_uploaded_invoice
+from .utils import process_uploaded_invoice, validate_pdf_file
+from .pagination import KeysetPaginationMixin
+from .conditional import ConditionalUserDataMixin
+from .analytics import spend_report
+from .exports import (
+    FORMATS as EXPORT_FORMATS, INVOICE_COLUMNS, PAYMENT_COLUMNS, STATEMENT_COLUMNS, export_response,
+    queryset_rows, statement_rows,
+)
+from .summaries import monthly_trend, yearly_statement
+from .sync import sync_response
+from .jobs import async_processing_enabled, enqueue_invoice_job
+from . import metrics
+from .stats import cached_stats, dashboard_stats, quick_stats
+from .tracing import trace
 from .logging_config import StructuredLogger, PDFProcessingError, FileUploadError, rate_limit_uploads
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class DashboardView(LoginRequiredMixin, TemplateView):
+class DashboardView(LoginRequiredMixin, ConditionalUserDataMixin, TemplateView):
     """Main dashboard view showing summary statistics"""
     template_name = 'invoices/dashboard.html'
     
@@ -24,91 +39,72 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         user = self.request.user
         
-        # OPTIMIZED: Single query with all related data
-        user_invoices = Invoice.objects.filter(child__user=user)\
-            .select_related('child', 'child__daycare_provider')\
-            .prefetch_related('payments')\
-            .order_by('-issue_date')
-        
-        user_children = Child.objects.filter(user=user)\
-            .select_related('daycare_provider')\
-            .prefetch_related('invoices')
-        
-        # Calculate statistics in database, not Python
-        stats = user_invoices.aggregate(
-            total_invoices=Count('id'),
-            total_amount_due=Sum('amount_due'),
-            total_paid=Sum('payments__amount_paid'),
-            unpaid_count=Count('id', filter=Q(payment_status='unpaid')),
-            overdue_count=Count('id', filter=Q(payment_status='overdue'))
-        )
-        
-        # Handle None values from Sum()
-        stats['total_amount_due'] = stats['total_amount_due'] or Decimal('0.00')
-        stats['total_paid'] = stats['total_paid'] or Decimal('0.00')
-        stats['outstanding_balance'] = stats['total_amount_due'] - stats['total_paid']
-        stats['total_children'] = user_children.count()
-        
-        # Get payment count separately since we need to count payments, not invoices
-        stats['total_payments'] = Payment.objects.filter(
-            invoice__child__user=user
-        ).count()
-        
-        context['stats'] = stats
+        context['stats'] = cached_stats('dashboard', user, dashboard_stats)
+        context['trend'] = cached_stats('monthly_trend', user, lambda user: {'months': monthly_trend(user)})['months']
         
         # Limit recent items for performance
-        context['recent_invoices'] = user_invoices[:5]
+        context['recent_invoices'] = Invoice.objects.filter(
+            user=user
+        ).select_related('child').order_by('-issue_date')[:5]
         context['recent_payments'] = Payment.objects.filter(
-            invoice__child__user=user
-        ).select_related('invoice', 'invoice__child').order_by('-payment_date')[:5]
+            user=user
+        ).select_related('invoice').order_by('-payment_date')[:5]
         
         return context
 
 
-class InvoiceListView(LoginRequiredMixin, ListView):
+def filter_invoices(queryset, params):
+    """Apply the invoice list's child and status filters from query parameters"""
+    # Filter by child if specified
+    child_id = params.get('child')
+    if child_id:
+        try:
+            child_id = int(child_id)
+            queryset = queryset.filter(child_id=child_id)
+        except (ValueError, TypeError):
+            pass
+    
+    # Filter by status if specified
+    status = params.get('status')
+    if status and status in ['paid', 'partial', 'unpaid', 'overdue']:
+        queryset = queryset.filter(payment_status=status)
+    
+    return queryset
+
+
+class InvoiceListView(LoginRequiredMixin, ConditionalUserDataMixin, KeysetPaginationMixin, ListView):
     """List view for user's invoices (placeholder for Phase 2)"""
     model = Invoice
     template_name = 'invoices/invoice_list.html'
     context_object_name = 'invoices'
     paginate_by = 20
+    keyset_fields = ('-issue_date', '-id')
+    count_cache_name = 'invoice_list_count'
     
     def get_queryset(self):
         queryset = Invoice.objects.filter(
-            child__user=self.request.user
+            user=self.request.user
         ).select_related(
             'child', 'child__daycare_provider'
-        ).order_by('-issue_date')
-        
-        # Filter by child if specified
-        child_id = self.request.GET.get('child')
-        if child_id:
-            try:
-                child_id = int(child_id)
-                queryset = queryset.filter(child_id=child_id)
-            except (ValueError, TypeError):
-                pass
-        
-        # Filter by status if specified
-        status = self.request.GET.get('status')
-        if status and status in ['paid', 'partial', 'unpaid', 'overdue']:
-            queryset = queryset.filter(payment_status=status)
-            
-        return queryset
+        )
+        return filter_invoices(queryset, self.request.GET)
 
 
-class PaymentListView(LoginRequiredMixin, ListView):
+class PaymentListView(LoginRequiredMixin, ConditionalUserDataMixin, KeysetPaginationMixin, ListView):
     """List view for user's payments (placeholder for Phase 2)"""
     model = Payment
     template_name = 'invoices/payment_list.html'
     context_object_name = 'payments'
     paginate_by = 20
+    keyset_fields = ('-payment_date', '-id')
+    count_cache_name = 'payment_list_count'
     
     def get_queryset(self):
         return Payment.objects.filter(
-            invoice__child__user=self.request.user
+            user=self.request.user
         ).select_related(
             'invoice', 'invoice__child'
-        ).order_by('-payment_date')
+        )
 
 
 class ChildListView(LoginRequiredMixin, ListView):
@@ -139,27 +135,30 @@ class InvoiceCreateView(LoginRequiredMixin, CreateView):
     
     @rate_limit_uploads(max_uploads=5, window_minutes=10)
     def post(self, request, *args, **kwargs):
-        print("=== INVOICE FORM POST DATA ===")
-        print("POST data:", request.POST)
-        print("FILES:", request.FILES)
-        print("=== END DEBUG ===")
+        trace('invoice_form_post', post=lambda: request.POST.dict(), files=lambda: list(request.FILES))
         return super().post(request, *args, **kwargs)
     
     def form_valid(self, form):
         correlation_id = StructuredLogger.get_correlation_id(self.request)
         
         try:
-            print("=== INVOICE FORM VALID ===")
-            print("Form cleaned data:", form.cleaned_data)
+            trace('invoice_form_valid', cleaned_data=lambda: form.cleaned_data)
             invoice = form.save(commit=False)
-            print(f"Created invoice object: {invoice}")
+            
+            # With the worker enabled the upload was already extracted through
+            # invoice_upload_ajax; only validate the file that is attached
+            if form.cleaned_data.get('pdf_file') and async_processing_enabled():
+                validation_errors = validate_pdf_file(form.cleaned_data['pdf_file'])
+                if validation_errors:
+                    for error in validation_errors.values():
+                        messages.error(self.request, error)
+                    return self.form_invalid(form)
             
             # Process PDF if uploaded
-            if form.cleaned_data.get('pdf_file'):
+            elif form.cleaned_data.get('pdf_file'):
                 try:
-                    print("Processing PDF file...")
                     result = process_uploaded_invoice(form.cleaned_data['pdf_file'], self.request.user)
-                    print(f"PDF processing result: {result}")
+                    trace('pdf_processing_result', result=result)
                     
                     if result['errors']:
                         StructuredLogger.log_error(
@@ -198,7 +197,6 @@ class InvoiceCreateView(LoginRequiredMixin, CreateView):
             )
             
             messages.success(self.request, f'Invoice {invoice.invoice_reference} created successfully!')
-            print("=== INVOICE FORM SUCCESS ===")
             return super().form_valid(form)
             
         except Exception as e:
@@ -212,9 +210,7 @@ class InvoiceCreateView(LoginRequiredMixin, CreateView):
             return self.form_invalid(form)
     
     def form_invalid(self, form):
-        print("=== INVOICE FORM INVALID ===")
-        print("Form errors:", form.errors)
-        print("=== END FORM ERRORS ===")
+        trace('invoice_form_invalid', errors=lambda: form.errors.get_json_data())
         
         StructuredLogger.log_error(
             logger,
@@ -233,7 +229,7 @@ class InvoiceDetailView(LoginRequiredMixin, DetailView):
     
     def get_queryset(self):
         return Invoice.objects.filter(
-            child__user=self.request.user
+            user=self.request.user
         ).select_related('child', 'child__daycare_provider').prefetch_related('payments')
 
 
@@ -244,7 +240,7 @@ class InvoiceUpdateView(LoginRequiredMixin, UpdateView):
     template_name = 'invoices/invoice_form.html'
     
     def get_queryset(self):
-        return Invoice.objects.filter(child__user=self.request.user)
+        return Invoice.objects.filter(user=self.request.user)
     
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -277,7 +273,7 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
             try:
                 invoice = Invoice.objects.get(
                     pk=invoice_id, 
-                    child__user=self.request.user
+                    user=self.request.user
                 )
                 initial['invoice'] = invoice
                 # Suggest remaining balance as payment amount
@@ -289,25 +285,16 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
         return initial
     
     def post(self, request, *args, **kwargs):
-        print("=== PAYMENT FORM POST DATA ===")
-        print("POST data:", request.POST)
-        print("FILES:", request.FILES)
-        print("=== END DEBUG ===")
+        trace('payment_form_post', post=lambda: request.POST.dict(), files=lambda: list(request.FILES))
         return super().post(request, *args, **kwargs)
     
     def form_valid(self, form):
-        print("=== PAYMENT FORM VALID ===")
-        print("Form cleaned data:", form.cleaned_data)
-        payment = form.save(commit=False)
-        print(f"Created payment object: {payment}")
+        trace('payment_form_valid', cleaned_data=lambda: form.cleaned_data)
         messages.success(self.request, 'Payment recorded successfully!')
-        print("=== PAYMENT FORM SUCCESS ===")
         return super().form_valid(form)
     
     def form_invalid(self, form):
-        print("=== PAYMENT FORM INVALID ===")
-        print("Form errors:", form.errors)
-        print("=== END FORM ERRORS ===")
+        trace('payment_form_invalid', errors=lambda: form.errors.get_json_data())
         return super().form_invalid(form)
 
 
@@ -319,7 +306,7 @@ class PaymentDetailView(LoginRequiredMixin, DetailView):
 
     def get_queryset(self):
         return Payment.objects.filter(
-            invoice__child__user=self.request.user
+            user=self.request.user
         ).select_related('invoice', 'invoice__child', 'invoice__child__daycare_provider')
 
 
@@ -332,7 +319,7 @@ class PaymentUpdateView(LoginRequiredMixin, UpdateView):
 
     def get_queryset(self):
         return Payment.objects.filter(
-            invoice__child__user=self.request.user
+            user=self.request.user
         )
 
     def form_valid(self, form):
@@ -348,26 +335,18 @@ class ChildCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('invoices:child_list')
     
     def post(self, request, *args, **kwargs):
-        print("=== CHILD FORM POST DATA ===")
-        print("POST data:", request.POST)
-        print("FILES:", request.FILES)
-        print("=== END DEBUG ===")
+        trace('child_form_post', post=lambda: request.POST.dict(), files=lambda: list(request.FILES))
         return super().post(request, *args, **kwargs)
     
     def form_valid(self, form):
-        print("=== CHILD FORM VALID ===")
-        print("Form cleaned data:", form.cleaned_data)
+        trace('child_form_valid', cleaned_data=lambda: form.cleaned_data)
         form.instance.user = self.request.user
-        child = form.save()
-        print(f"Created child object: {child}")
+        form.save()
         messages.success(self.request, f'Child {form.instance.name} added successfully!')
-        print("=== CHILD FORM SUCCESS ===")
         return super().form_valid(form)
     
     def form_invalid(self, form):
-        print("=== CHILD FORM INVALID ===")
-        print("Form errors:", form.errors)
-        print("=== END FORM ERRORS ===")
+        trace('child_form_invalid', errors=lambda: form.errors.get_json_data())
         return super().form_invalid(form)
 
 
@@ -397,26 +376,169 @@ def invoice_upload_ajax(request):
         return JsonResponse({'error': 'No file uploaded'}, status=400)
     
     pdf_file = request.FILES['pdf_file']
+    
+    if async_processing_enabled():
+        # Only the cheap file checks run in the request; the worker does the rest
+        validation_errors = validate_pdf_file(pdf_file, check_structure=False)
+        if validation_errors:
+            return JsonResponse({'success': False, 'data': {}, 'errors': validation_errors, 'warnings': []},
+                                status=400)
+        job = enqueue_invoice_job(pdf_file, request.user)
+        return JsonResponse(_job_status_payload(job), status=202)
+    
     result = process_uploaded_invoice(pdf_file, request.user)
     
     return JsonResponse(result)
 
 
+def _job_status_payload(job):
+    """JSON body describing a processing job and, once finished, its result"""
+    payload = {
+        'job_id': job.pk,
+        'status': job.status,
+        'status_url': reverse('invoices:invoice_job_status', kwargs={'pk': job.pk}),
+    }
+    if job.status == InvoiceProcessingJob.STATUS_COMPLETED:
+        payload['result'] = job.result
+    elif job.status == InvoiceProcessingJob.STATUS_FAILED:
+        payload['result'] = {
+            'success': False,
+            'data': {},
+            'errors': {'processing': job.error},
+            'warnings': [],
+        }
+    return payload
+
+
+@login_required
+def invoice_job_status(request, pk):
+    """AJAX endpoint polled for the status and result of a processing job"""
+    job = get_object_or_404(InvoiceProcessingJob, pk=pk, user=request.user)
+    return JsonResponse(_job_status_payload(job))
+
+
 @login_required
 def invoice_quick_stats(request):
     """AJAX endpoint for quick invoice statistics"""
-    user_invoices = Invoice.objects.filter(child__user=request.user)
-    
-    stats = {
-        'total_invoices': user_invoices.count(),
-        'unpaid_count': user_invoices.filter(payment_status='unpaid').count(),
-        'partial_count': user_invoices.filter(payment_status='partial').count(),
-        'total_outstanding': str(sum(inv.outstanding_balance for inv in user_invoices)),
-    }
+    stats = dict(cached_stats('quick', request.user, quick_stats))
+    stats['total_outstanding'] = str(stats['total_outstanding'])
     
     return JsonResponse(stats)
 
 
+
+class SpendReportView(LoginRequiredMixin, ConditionalUserDataMixin, TemplateView):
+    """Spend, discounts and payment timing per child, provider and month"""
+    template_name = 'invoices/spend_report.html'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['report'] = cached_stats('spend_report', self.request.user, spend_report)
+        
+        # Yearly statement from the monthly summaries, for the latest year by default
+        years = [row['year'] for child in context['report']['by_child'] for row in child['years']]
+        try:
+            year = int(self.request.GET.get('year') or max(years, default=date.today().year))
+        except ValueError:
+            year = max(years, default=date.today().year)
+        context['statement_year'] = year
+        context['statement_years'] = sorted(set(years), reverse=True)
+        context['statement'] = yearly_statement(self.request.user, year)
+        return context
+
+
+@login_required
+def spend_report_api(request):
+    """The spend report as JSON, with amounts as decimal strings"""
+    return JsonResponse(cached_stats('spend_report', request.user, spend_report))
+
+
+def _export_options(request):
+    """
+    Format and date range of an export request
+
+    Returns:
+        (format, start date or None, end date or None)
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'")
+    try:
+        start, end = (date.fromisoformat(request.GET[name]) if request.GET.get(name) else None
+                      for name in ('from', 'to'))
+    except ValueError:
+        raise ValueError('Dates must be given as YYYY-MM-DD')
+    return fmt, start, end
+
+
+@login_required
+def invoice_export(request):
+    """Download the filtered invoice list as CSV or XLSX, optionally limited to an issue date range"""
+    try:
+        fmt, start, end = _export_options(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    queryset = filter_invoices(Invoice.objects.filter(user=request.user), request.GET)
+    if start:
+        queryset = queryset.filter(issue_date__gte=start)
+    if end:
+        queryset = queryset.filter(issue_date__lte=end)
+    columns, rows = queryset_rows(queryset.order_by('issue_date', 'id'), INVOICE_COLUMNS)
+    return export_response(columns, rows, fmt, f'invoices-{date.today():%Y%m%d}')
+
+
+@login_required
+def payment_export(request):
+    """Download payments as CSV or XLSX, optionally for one child and a payment date range"""
+    try:
+        fmt, start, end = _export_options(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    queryset = Payment.objects.filter(user=request.user)
+    child_id = request.GET.get('child')
+    if child_id and child_id.isdigit():
+        queryset = queryset.filter(invoice__child_id=child_id)
+    if start:
+        queryset = queryset.filter(payment_date__gte=start)
+    if end:
+        queryset = queryset.filter(payment_date__lte=end)
+    columns, rows = queryset_rows(queryset.order_by('payment_date', 'id'), PAYMENT_COLUMNS)
+    return export_response(columns, rows, fmt, f'payments-{date.today():%Y%m%d}')
+
+
+@login_required
+def child_statement(request, pk):
+    """Download a child's statement of charges, payments and running balance"""
+    child = get_object_or_404(Child, pk=pk, user=request.user)
+    try:
+        fmt, start, end = _export_options(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    filename = f"statement-{slugify(child.reference_number) or child.pk}-{date.today():%Y%m%d}"
+    return export_response(STATEMENT_COLUMNS, statement_rows(child, start, end), fmt, filename)
+
+
+@login_required
+def invoice_sync(request):
+    """JSON Lines of the user's invoices changed since ?since= (see sync.py)"""
+    return sync_response(request, Invoice.objects.filter(user=request.user), 'invoice')
+
+
+@login_required
+def payment_sync(request):
+    """JSON Lines of the user's payments changed since ?since= (see sync.py)"""
+    return sync_response(request, Payment.objects.filter(user=request.user), 'payment')
+
+
+@staff_member_required
+def metrics_view(request):
+    """Invoice pipeline metrics in Prometheus text format, for staff only"""
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # Daycare Provider Management Views
 
 class ProviderListView(LoginRequiredMixin, ListView):
@@ -446,7 +568,7 @@ class ProviderDetailView(LoginRequiredMixin, DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        provider = self.get_object()
+        provider = self.object
         
         # Get user's children at this provider
         context['user_children'] = Child.objects.filter(
@@ -456,8 +578,8 @@ class ProviderDetailView(LoginRequiredMixin, DetailView):
         
         # Get invoices for this provider
         context['invoices'] = Invoice.objects.filter(
-            child__user=self.request.user,
+            user=self.request.user,
             child__daycare_provider=provider
-        ).select_related('child').order_by('-issue_date')[:10]
+        ).select_related('child').order_by('-issue_date', '-id')[:10]
         
         return context